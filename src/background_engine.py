@@ -0,0 +1,122 @@
+#Engine running in a background thread, so the GUI keeps handling events while it thinks
+#
+#search() returns a concurrent.futures future of the engine move. stop() makes the running search
+#return the best move found so far, cancel() stops it and discards its result.
+#Pondering: while the user thinks, the engine searches the position after the reply it expects, with no
+#time limit. If the user plays that reply (a ponder hit), that search goes on as the search of the engine
+#move and is stopped move_time later; otherwise it is cancelled and a new search starts.
+#With an opening book, book positions are answered from the book without searching
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+import search_algo as search
+import parallel_search
+
+class background_engine():
+	def __init__(self, move_time = 3.0, workers = 1, book = None):
+		self.move_time = move_time
+		self.workers = workers		#More than 1: parallel search (see parallel_search.py)
+		self.book = book		#opening_book.opening_book or None
+		self.executor = ThreadPoolExecutor(max_workers = 1)
+		self.stop_event = threading.Event()
+		self.future = None
+		self.timer = None		#threading.Timer stopping a ponder search after a ponder hit
+		self.ponder_key = None		#Key of the position searched by the ponder search
+		self.ponder_hits = 0
+		self.ponder_misses = 0
+
+	#Start the search of the move to play at state. Return a future of the move, None if there is no move
+	def search(self, state):
+		if self.ponder_key is not None:
+			if self.ponder_key == state.key:
+				self.ponder_hits += 1
+				return self.ponder_hit()
+			self.ponder_misses += 1
+		self.cancel()
+		book_move = self.book.pick(state) if self.book is not None else None
+		if book_move is not None:
+			self.future = Future()
+			self.future.set_result(book_move)
+			return self.future
+
+		self.stop_event.clear()
+		self.future = self.executor.submit(self.best_move, state.copy(), self.move_time)
+
+		return self.future
+
+	#The ponder search becomes the search of the engine move: it gets move_time from now
+	def ponder_hit(self):
+		self.ponder_key = None
+		if not self.future.done():
+			self.timer = threading.Timer(self.move_time, self.stop)
+			self.timer.daemon = True
+			self.timer.start()
+		return self.future
+
+	def best_move(self, state, move_time):
+		maximizing_player = state.turn == 'w'
+		if self.workers > 1:
+			return parallel_search.parallel_iterative_deepening_move(state, maximizing_player, move_time, self.workers)
+		return search.iterative_deepening_move(state, maximizing_player, move_time = move_time, stop_event = self.stop_event)
+
+	def busy(self):
+		return self.future is not None and not self.future.done()
+
+	#Make the running search return now, with the best move found so far
+	def stop(self):
+		self.stop_event.set()
+		if self.workers > 1:
+			parallel_search.request_stop()
+
+	#Stop the running search (if any) and wait for it to end, its result is discarded
+	def cancel(self):
+		if self.timer is not None:
+			self.timer.cancel()
+			self.timer = None
+		if self.future is not None:
+			while not self.future.done():
+				self.stop()
+				wait([self.future], timeout = 0.05)
+			self.future = None
+		self.ponder_key = None
+
+	#Transposition table the searches write to
+	def table(self):
+		if self.workers > 1:
+			return parallel_search.shared_table
+		return search.get_transposition_table()
+
+	#Reply expected at state (best move stored by the last search), None if unknown
+	def expected_move(self, state):
+		table = self.table()
+		entry = table.probe(state.key) if table is not None else None
+		if not entry or not entry[3]:
+			return None
+		move = search.rules.decode_move(entry[3])
+		board = state.copy()
+		if not search.rules.is_pseudo_legal(move, board) or search.rules.make_legal_move(board, move) is None:
+			return None
+
+		return move
+
+	#Search the position after the expected reply to state, until the next search() or cancel().
+	#Return the expected reply, None if there is none (then there is no pondering)
+	def ponder(self, state):
+		self.cancel()
+		move = self.expected_move(state)
+		if move is None:
+			return None
+
+		ponder_state = state.copy()
+		ponder_state.make_move(move)
+		self.stop_event.clear()
+		self.ponder_key = ponder_state.key
+		self.future = self.executor.submit(self.best_move, ponder_state, None)
+
+		return move
+
+	def shutdown(self):
+		self.cancel()
+		self.executor.shutdown()
+		if self.book is not None:
+			self.book.close()
@@ -1,12 +1,32 @@
 import pygame
 import os
-import chess_rules as rules
+import sys
 import search_algo as algo
+import opening_book
+from background_engine import background_engine
 
 #Set players, 'engine' or 'user'
 WPLAYER = 'user'
 BPLAYER = 'engine'
 
+rules = algo.rules
+
+#Engine thinking time per move, in seconds
+ENGINE_MOVE_TIME = 3.0
+
+#Engine search processes; more than 1 splits root moves across a process pool (see parallel_search.py)
+SEARCH_WORKERS = 1
+
+#Engine thinks on the user's time, on the reply it expects
+PONDER = True
+
+#Polyglot opening book played by the engine while the position is in it, None for no book
+#(a missing file is no book; see opening_book.py to build one)
+BOOK_PATH = opening_book.DEFAULT_BOOK
+
+#Engine searches in a background thread; press space while it thinks to make it move now
+engine = background_engine(ENGINE_MOVE_TIME, SEARCH_WORKERS, opening_book.open_book(BOOK_PATH) if BOOK_PATH else None)
+
 # Colors, sizes and window
 pygame.font.init()
 COORD_FONT = pygame.font.SysFont('comicsans', 50)
@@ -62,8 +82,8 @@ for col in range(8):
 
 		board.append(square(col, lin, color))
 
-#Initializing current_state board
-current_state = rules.start_board_position()
+#Initializing the game (current state and move history)
+current_game = rules.game()
 
 
 #Graphics
@@ -112,7 +132,7 @@ def draw_window(current_state, click_change = False, clicking = False, clicked_s
 
 	#WIN.blit(draw_text, (0, 0))
 
-	status = current_state.special[rules.special_dict['game_finished']]
+	status = current_state.status
 	if status == 'w':
 		draw_text = COORD_FONT.render("White wins", 1, BLACK)
 	elif status == 'b':
@@ -127,7 +147,15 @@ def draw_window(current_state, click_change = False, clicking = False, clicked_s
 
 	pygame.display.update()
 
-def user_selector(current_state):
+def quit_game():
+	engine.shutdown()
+	pygame.quit()
+	sys.exit()
+
+def user_selector(current_game):
+	current_state = current_game.state
+	if PONDER and players[rules.reverse_color(current_state.turn)] == 'engine':
+		engine.ponder(current_state)
 	clock = pygame.time.Clock()
 	run = True
 	clicking = False 		#True if click is holded, false otherwise
@@ -140,8 +168,7 @@ def user_selector(current_state):
 		mx, my = pygame.mouse.get_pos() #Mouse position
 		for event in pygame.event.get():
 			if event.type == pygame.QUIT:
-				run = False
-				pygame.quit()
+				quit_game()
 			
 			if event.type == pygame.MOUSEBUTTONDOWN:
 				if event.button == 1:
@@ -169,45 +196,53 @@ def user_selector(current_state):
 			clicked_square = None
 			target_square = None
 
-		#Send move info to check if it's legal; if so, change current_state accordingly 
+		#Send move info to check if it's legal; if so, return the move (pawns promote to queen)
 		if clicked_square and target_square and clicked_square != target_square:
-			children = rules.legal_move_check(clicked_square.coord, target_square.coord, current_state)
-			if children != False:
-				if rules.finished_game_check(children):
-					children.special[rules.special_dict['game_finished']] = rules.finished_game_check(children)
-				return children
+			for move in current_game.legal_moves():
+				if move[0] == clicked_square.coord and move[1] == target_square.coord and move[2] in (None, 'Q'):
+					return move
 
 		draw_window(current_state, click_change, clicking, clicked_square, target_square)
 
 
 
-def main(current_state):
-	run = True
-	while run:
-		turn = current_state.turn
-		if turn == 'w':
-			if WPLAYER == 'engine':
-				next_state = algo.minimax_algo(current_state, True, 2)
-				#next_state = algo.first_instinct_move(current_state)
-			else:
-				next_state = user_selector(current_state)
-		elif turn == 'b':
-			if BPLAYER == 'engine':
-				next_state = algo.minimax_algo(current_state, False, 2)
-				#next_state = algo.random_move(current_state)
-			else:
-				next_state = user_selector(current_state)
-
+#Wait for the engine move, handling events and drawing at FPS meanwhile
+def engine_selector(current_game):
+	clock = pygame.time.Clock()
+	future = engine.search(current_game.state)
+	while not future.done():
+		clock.tick(FPS)
 		for event in pygame.event.get():
 			if event.type == pygame.QUIT:
-				run = False
-				pygame.quit()
+				quit_game()
+			if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+				engine.stop()
+		draw_window(current_game.state)
 
-		if next_state != False:
-			current_state = next_state
-			
-		draw_window(current_state)
+	return future.result()
+
+players = {'w': WPLAYER, 'b': BPLAYER}
+
+def main(current_game):
+	clock = pygame.time.Clock()
+	while True:
+		current_state = current_game.state
+		if current_state.status:	#Game finished, nothing to play
+			move = None
+			clock.tick(FPS)
+			for event in pygame.event.get():
+				if event.type == pygame.QUIT:
+					quit_game()
+		elif players[current_state.turn] == 'engine':
+			move = engine_selector(current_game)
+		else:
+			move = user_selector(current_game)
+
+		if move:
+			current_game.play(move)
+
+		draw_window(current_game.state)
 
 
 if __name__ == "__main__":
-	main(current_state)
+	main(current_game)
@@ -0,0 +1,223 @@
+#Batch evaluation: the score of search_algo.evaluator for many positions at once, computed with numpy
+#
+#Positions are stacked in an (N, 64) int8 array of piece codes (the state_board.board bytes), with their
+#flags and turns. Material is a table lookup summed by row; scope (the squares each
+#piece sees) is counted on uint64 bitboards, shifted and filled for all the boards at once.
+#Scores are the same as the scalar evaluator, bit for bit.
+#It scores positions offline (files, datasets): the search evaluates one leaf at a time, and batches only
+#beat evaluator from a few dozen positions on
+#
+#Usage:
+#	python3 batch_eval.py --positions 2000       throughput against search_algo.evaluator
+#	python3 batch_eval.py --file positions.epd       score every position of a FEN / EPD file
+
+import sys
+import time
+import argparse
+import numpy as np
+import chess_rules
+from chess_rules import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK, special_dict
+
+#Rows evaluated at a time
+CHUNK = 4096
+
+#Material by code and square, white positive (centipawns)
+material_table = np.zeros((16, 64), dtype = np.int64)
+for __code in range(16):
+	if chess_rules.terms_of_code[__code] is not None:
+		for __sq in range(64):
+			__sign = -1 if __code & BLACK else 1
+			material_table[__code, __sq] = __sign * chess_rules.terms_of_code[__code][__sq][0]
+squares = np.arange(64)
+
+#Scope is counted on bitboards, one uint64 per piece code and board, square sq being bit sq (a8 = 0).
+#A direction is (d, mask): squares move by d (sq + d) and must land on mask, so no ray wraps around the board
+def __file_mask(files):
+	return sum(1 << sq for sq in range(64) if sq % 8 in files)
+
+FULL = (1 << 64) - 1
+not_file = [FULL ^ __file_mask((x,)) for x in range(8)]
+straight_directions = [(-8, FULL), (8, FULL), (1, not_file[0]), (-1, not_file[7])]
+diagonal_directions = [(-7, not_file[0]), (-9, not_file[7]), (9, not_file[0]), (7, not_file[7])]
+knight_directions = [(dy * 8 + dx, FULL ^ __file_mask([x for x in range(8) if not 0 <= x - dx <= 7]))
+	for dx, dy in ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))]
+king_directions = straight_directions + diagonal_directions
+
+#Shift of bitboards by d squares (toward higher squares if d > 0)
+def shift(bitboards, d):
+	return bitboards << np.uint64(d) if d > 0 else bitboards >> np.uint64(- d)
+
+#Squares reached from sliders along a direction up to the first occupied square, that one included (Kogge-Stone fill)
+def ray_attacks(sliders, empty, d, mask):
+	mask = np.uint64(mask)
+	empty = empty & mask
+	sliders = sliders | (empty & shift(sliders, d))
+	empty = empty & shift(empty, d)
+	sliders = sliders | (empty & shift(sliders, 2 * d))
+	empty = empty & shift(empty, 2 * d)
+	sliders = sliders | (empty & shift(sliders, 4 * d))
+	return shift(sliders, d) & mask
+
+if hasattr(np, 'bitwise_count'):
+	popcount = np.bitwise_count
+else:
+	__byte_counts = np.array([bin(byte).count('1') for byte in range(256)], dtype = np.uint8)
+	def popcount(bitboards):
+		bitboards = np.ascontiguousarray(bitboards, dtype = '<u8')
+		return __byte_counts[bitboards.view(np.uint8)].reshape(bitboards.shape + (8,)).sum(axis = -1)
+
+#Codes of the bitboards made from a board: white pieces then black ones
+bitboard_codes = np.array([PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING] + [BLACK | kind for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)], dtype = np.int8)
+
+#Pawns of the side to move next to the file of flags >> 4 (en passant file + 1), by color
+__rows = (__file_mask(range(8)) & (0xFF << 24), __file_mask(range(8)) & (0xFF << 32))
+passant_masks = np.zeros((2, 16), dtype = np.uint64)
+for __file in range(8):
+	for __color in range(2):
+		passant_masks[__color, __file + 1] = __rows[__color] & __file_mask((__file - 1, __file + 1))
+
+#Boards (N, 64) int8, flags (N) and white to move (N, bool) of states
+def stack_states(states):
+	return stack_boards([bytes(state.board) for state in states], [state.flags for state in states], [state.turn == 'w' for state in states])
+
+#Same from lists of board bytes, flags and white to move
+def stack_boards(board_bytes, flags, white_turn):
+	boards = np.frombuffer(b''.join(board_bytes), dtype = np.int8).reshape(len(board_bytes), 64)
+	return boards, np.array(flags, dtype = np.int64), np.array(white_turn, dtype = bool)
+
+#Material balance in pawns, white positive, as in search_algo
+def material_terms(boards):
+	return material_table[boards.astype(np.intp), squares].sum(axis = 1) / 100
+
+#Scope count of the pieces of each board (white minus black), as with scope_squares. In one direction
+#the squares seen by pieces of the same side never overlap, so the count is the sum over directions of
+#the squares seen from all of them
+def scope_terms(boards, flags, white_turn):
+	count = len(boards)
+	bitboards = np.packbits(boards[:, None, :] == bitboard_codes[None, :, None], axis = 2, bitorder = 'little').view('<u8')[..., 0]
+	white = np.bitwise_or.reduce(bitboards[:, :6], axis = 1)
+	black = np.bitwise_or.reduce(bitboards[:, 6:], axis = 1)
+	empty = ~(white | black)
+
+	#White boards then black boards
+	own = np.concatenate((white, black))
+	available = ~own
+	both_empty = np.concatenate((empty, empty))
+	pieces = np.concatenate((bitboards[:, :6], bitboards[:, 6:]))
+	knights, kings = pieces[:, 1], pieces[:, 5]
+	straight = pieces[:, 3] | pieces[:, 4]
+	diagonal = pieces[:, 2] | pieces[:, 4]
+
+	seen = [shift(knights, d) & np.uint64(mask) & available for d, mask in knight_directions]
+	seen += [shift(kings, d) & np.uint64(mask) & available for d, mask in king_directions]
+	seen += [ray_attacks(straight, both_empty, d, mask) & available for d, mask in straight_directions]
+	seen += [ray_attacks(diagonal, both_empty, d, mask) & available for d, mask in diagonal_directions]
+
+	#Pawns: one step (two from home) to empty squares, captures of enemy pieces, en passant for the side to move
+	white_pawns, black_pawns = bitboards[:, 0], bitboards[:, 6]
+	white_step, black_step = shift(white_pawns, -8) & empty, shift(black_pawns, 8) & empty
+	seen.append(np.concatenate((white_step, black_step)))
+	seen.append(np.concatenate((shift(white_step & np.uint64(0xFF << 40), -8) & empty, shift(black_step & np.uint64(0xFF << 16), 8) & empty)))
+	seen.append(np.concatenate((shift(white_pawns, -9) & np.uint64(not_file[7]) & black, shift(black_pawns, 7) & np.uint64(not_file[7]) & white)))
+	seen.append(np.concatenate((shift(white_pawns, -7) & np.uint64(not_file[0]) & black, shift(black_pawns, 9) & np.uint64(not_file[0]) & white)))
+	passant_file = flags >> 4
+	seen.append(np.concatenate((white_pawns & np.where(white_turn, passant_masks[0, passant_file], np.uint64(0)),
+		black_pawns & np.where(white_turn, np.uint64(0), passant_masks[1, passant_file]))))
+
+	counts = popcount(np.stack(seen, axis = 1)).sum(axis = 1, dtype = np.int64)
+	scope = counts[:count] - counts[count:]
+
+	#Castling: rights with empty squares between king and rook
+	if flags.any():
+		for bit, king_sq, between, sign in ((special_dict['w0-0'], 60, (61, 62), 1), (special_dict['w0-0-0'], 60, (57, 58, 59), 1),
+				(special_dict['b0-0'], 4, (5, 6), -1), (special_dict['b0-0-0'], 4, (1, 2, 3), -1)):
+			king = KING | (0 if sign > 0 else BLACK)
+			castle = ((flags >> bit) & 1 != 0) & (boards[:, king_sq] == king) & (boards[:, list(between)] == 0).all(axis = 1)
+			scope += sign * castle
+
+	return scope
+
+#Scores of the boards (N, 64) with their flags and white_turn (see stack_states). Game status is not
+#looked at, finished games are scored as if they were not
+def evaluate_boards(boards, flags, white_turn):
+	scores = np.empty(len(boards))
+	for start in range(0, len(boards), CHUNK):
+		chunk = boards[start:start + CHUNK]
+		scores[start:start + CHUNK] = 4 * material_terms(chunk) + scope_terms(chunk, flags[start:start + CHUNK], white_turn[start:start + CHUNK])
+	return scores
+
+#Scores of states, a list of floats as search_algo.evaluator would give (finished games included)
+def evaluate_states(states):
+	if not states:
+		return []
+	scores = evaluate_boards(*stack_states(states)).tolist()
+	for i, state in enumerate(states):
+		if state.status == 'w':
+			scores[i] = float('inf')
+		elif state.status == 'b':
+			scores[i] = float('-inf')
+		elif state.status == 'Draw':
+			scores[i] = 0.0
+	return scores
+
+#Positions reached by random legal moves from the start position, for measures
+def random_positions(count, seed = 0, max_plies = 80):
+	import random
+	generator = random.Random(seed)
+	positions = []
+	while len(positions) < count:
+		state = chess_rules.start_board_position()
+		for ply in range(generator.randrange(max_plies)):
+			moves = chess_rules.legal_moves(state)
+			if not moves:
+				break
+			state.make_move(generator.choice(moves))
+		positions.append(state)
+	return positions
+
+#Scores of the positions of a FEN or EPD file (one per line), evaluated in batches of CHUNK.
+#Return a list of (fen, score)
+def score_file(path):
+	import epd
+	fens = [fen for number, fen, operations in epd.read_epd(path)]
+	scores = []
+	for start in range(0, len(fens), CHUNK):
+		scores += evaluate_states([chess_rules.fen_to_state(fen) for fen in fens[start:start + CHUNK]])
+	return list(zip(fens, scores))
+
+def main(arguments):
+	import search_algo as search
+
+	parser = argparse.ArgumentParser(description = "Score positions in bulk, or compare batch and scalar evaluation throughput")
+	parser.add_argument('--file', help = "FEN or EPD file to score, one position per line")
+	parser.add_argument('--positions', type = int, default = 2000, help = "random positions measured")
+	parser.add_argument('--batch', type = int, nargs = '+', default = [1, 8, 32, 256, 4096], help = "batch sizes measured")
+	options = parser.parse_args(arguments)
+
+	if options.file:
+		start_time = time.perf_counter()
+		scored = score_file(options.file)
+		for fen, score in scored:
+			print("%8.2f  %s" % (score, fen))
+		print("%d positions in %.3f s" % (len(scored), time.perf_counter() - start_time), file = sys.stderr)
+		return 0
+
+	states = random_positions(options.positions)
+	start_time = time.perf_counter()
+	expected = [search.evaluator(state) for state in states]
+	scalar_time = time.perf_counter() - start_time
+	print("scalar: %d positions in %.3f s, %.0f positions/s" % (len(states), scalar_time, len(states) / scalar_time))
+
+	for size in options.batch:
+		start_time = time.perf_counter()
+		scores = []
+		for start in range(0, len(states), size):
+			scores += evaluate_states(states[start:start + size])
+		elapsed = time.perf_counter() - start_time
+		mismatches = sum(score != value for score, value in zip(scores, expected))
+		print("batch %5d: %.3f s, %.0f positions/s, %.1fx, %d mismatches" % (size, elapsed, len(states) / elapsed, scalar_time / elapsed, mismatches))
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+#Benchmark: move generation (perft), evaluation and fixed depth search on the perft reference positions
+#
+#Each part is run several times and reported with its nodes, time and nodes/second. The signature is the
+#total node count of the searches: it only changes when the search itself does, so a change that should
+#only be faster must keep it. Results can be written as JSON and two result files compared: a part whose
+#nodes/second dropped by more than the threshold, with a significant Welch t-test over the runs, is flagged.
+#
+#Usage:
+#	python3 bench.py run --output before.json
+#	python3 bench.py run --output after.json --repeat 5 --depth 4
+#	python3 bench.py compare before.json after.json          exit status 1 if a part regressed
+
+import sys
+import json
+import time
+import math
+import platform
+import argparse
+import statistics
+import search_algo as search
+from perft import reference_positions, perft
+
+#Two sided 5% critical values of Student's t by degrees of freedom, then the larger ones
+t_critical_values = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+	2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+t_critical_large = ((40, 2.021), (60, 2.000), (120, 1.980))
+
+def t_critical(dof):
+	if dof < 1:
+		return float('inf')
+	if dof <= len(t_critical_values):
+		return t_critical_values[int(dof) - 1]
+	for limit, value in reversed(t_critical_large):
+		if dof >= limit:
+			return value
+	return t_critical_values[-1]
+
+#Positions of the evaluation part: every position two plies from each reference position
+def evaluation_positions(rules):
+	positions = []
+	for fen, counts in reference_positions.values():
+		state = rules.fen_to_state(fen)
+		for move in rules.legal_moves(state):
+			undo = state.make_move(move)
+			for reply in rules.legal_moves(state):
+				reply_undo = state.make_move(reply)
+				positions.append(state.copy())
+				state.unmake_move(reply_undo)
+			state.unmake_move(undo)
+	return positions
+
+#Parts of the benchmark: function(rules, options) returning (nodes, details), details being a dict of node
+#counts by position (or None)
+def bench_movegen(rules, options):
+	details = dict()
+	for name, (fen, counts) in reference_positions.items():
+		details[name] = perft(rules, rules.fen_to_state(fen), options.perft_depth)
+	return sum(details.values()), details
+
+def bench_evaluation(rules, options, positions):
+	for state in positions:
+		search.evaluator(state)
+	return len(positions), None
+
+def bench_search(rules, options):
+	details = dict()
+	for name, (fen, counts) in reference_positions.items():
+		search.get_transposition_table().clear()
+		state = rules.fen_to_state(fen)
+		valuation, pv, stats = search.iterative_deepening_search(state, state.turn == 'w', max_depth = options.depth)
+		details[name] = stats.nodes
+	return sum(details.values()), details
+
+#Run every part options.repeat times. Return the results as a dict (see the JSON output)
+def run_bench(options):
+	rules = search.rules
+	search.REPORT_STATS = False
+	#Results must not depend on files found at run time nor on options of the engine
+	search.ENDGAME_TABLES = False
+	search.TIME_FUNCTIONS = False
+	positions = evaluation_positions(rules)
+
+	parts = (('movegen', bench_movegen), ('evaluation', lambda rules, options: bench_evaluation(rules, options, positions)), ('search', bench_search))
+	results = dict(python = platform.python_version(), depth = options.depth, perft_depth = options.perft_depth,
+		repeat = options.repeat, parts = dict())
+	for name, function in parts:
+		seconds = []
+		for run in range(options.repeat):
+			start_time = time.perf_counter()
+			nodes, details = function(rules, options)
+			seconds.append(time.perf_counter() - start_time)
+		median = statistics.median(seconds)
+		results['parts'][name] = dict(nodes = nodes, seconds = seconds, nps = nodes / max(median, 1e-9), positions = details)
+		print("%-10s %9d nodes %8.3f s %9.0f nodes/s" % (name, nodes, median, nodes / max(median, 1e-9)))
+
+	results['signature'] = results['parts']['search']['nodes']
+	print("signature %d" % results['signature'])
+	return results
+
+#Nodes/second of each run of a part
+def part_speeds(part):
+	return [part['nodes'] / max(seconds, 1e-9) for seconds in part['seconds']]
+
+#Welch's t statistic and degrees of freedom of two samples, None if there are too few runs to tell
+def welch_test(before, after):
+	if len(before) < 2 or len(after) < 2:
+		return None
+	before_variance = statistics.variance(before) / len(before)
+	after_variance = statistics.variance(after) / len(after)
+	total = before_variance + after_variance
+	if total == 0:
+		return None
+	t = (statistics.mean(after) - statistics.mean(before)) / math.sqrt(total)
+	dof = total ** 2 / ((before_variance ** 2 / (len(before) - 1) if before_variance else 0) + (after_variance ** 2 / (len(after) - 1) if after_variance else 0))
+	return t, dof
+
+#Compare two results: print each part and return the names of the parts that regressed (slower by more
+#than threshold, a fraction, and significantly so)
+def compare_results(before, after, threshold = 0.02):
+	if before['signature'] != after['signature']:
+		print("signature changed: %d -> %d (the search is not the same)" % (before['signature'], after['signature']))
+	for key in ('depth', 'perft_depth', 'python'):
+		if before.get(key) != after.get(key):
+			print("%s differs: %s -> %s" % (key, before.get(key), after.get(key)))
+
+	regressions = []
+	for name, part in after['parts'].items():
+		if name not in before['parts']:
+			continue
+		before_speeds, after_speeds = part_speeds(before['parts'][name]), part_speeds(part)
+		change = statistics.mean(after_speeds) / statistics.mean(before_speeds) - 1
+		test = welch_test(before_speeds, after_speeds)
+		if test is None:
+			verdict = "too few runs to test"
+		elif abs(test[0]) < t_critical(test[1]):
+			verdict = "no significant change"
+		elif change < - threshold:
+			verdict = "REGRESSION"
+			regressions.append(name)
+		elif change > threshold:
+			verdict = "faster"
+		else:
+			verdict = "within threshold"
+		t_text = "t %6.2f" % test[0] if test else "t    -"
+		print("%-10s %9.0f -> %9.0f nodes/s %+6.1f%% %s  %s" % (name, statistics.mean(before_speeds), statistics.mean(after_speeds), 100 * change, t_text, verdict))
+
+	return regressions
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "Benchmark move generation, evaluation and search, or compare two results")
+	commands = parser.add_subparsers(dest = 'command', required = True)
+	run = commands.add_parser('run', help = "run the benchmark")
+	run.add_argument('--depth', type = int, default = 4, help = "search depth")
+	run.add_argument('--perft-depth', type = int, default = 3)
+	run.add_argument('--repeat', type = int, default = 3, help = "runs of each part")
+	run.add_argument('--output', help = "JSON file for the results")
+	compare = commands.add_parser('compare', help = "compare two JSON results")
+	compare.add_argument('before')
+	compare.add_argument('after')
+	compare.add_argument('--threshold', type = float, default = 2.0, help = "slowdown in percent below which no part is flagged")
+	options = parser.parse_args(arguments)
+
+	if options.command == 'run':
+		results = run_bench(options)
+		if options.output:
+			with open(options.output, 'w') as output_file:
+				json.dump(results, output_file, indent = 1)
+		return 0
+
+	with open(options.before) as before_file, open(options.after) as after_file:
+		regressions = compare_results(json.load(before_file), json.load(after_file), options.threshold / 100)
+	if regressions:
+		print("regressions: " + ', '.join(regressions))
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
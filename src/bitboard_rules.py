@@ -0,0 +1,407 @@
+#Bitboard move generation, a second implementation of the game logic to check chess_rules against
+#Same functions as chess_rules (piece_scope, check_king, legal_move_check, child_states, ...), but scopes
+#and attacks are computed with 64-bit integer bitboards instead of walking the board.
+#The position is a chess_rules state with the bitboards kept next to its board array, so each move does the
+#work of both: it is slower than chess_rules and the engine doesn't use it. Perft of both must agree
+#
+#Usage:
+#	python3 bitboard_rules.py         perft reference counts, then node throughput of both
+#
+#Square index of internal coordinate (x, y) is y * 8 + x, so a8 = 0 and h1 = 63
+
+import sys
+import time
+import chess_rules
+from chess_rules import special_dict, algebraic_to_internal, reverse_color, square_of, coord_of_square, encode_move, decode_move
+from chess_rules import child_from_move, promotion_pieces, move_to_uci, uci_to_move, move_to_san, san_to_move, state_to_fen, evaluation_terms, ordering_value, moves_to, is_quiet, has_pieces
+from chess_rules import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK, color_bit, color_of_bit, piece_codes
+
+def squares_of(bitboard):
+	squares = []
+	while bitboard:
+		lowest = bitboard & -bitboard
+		squares.append(lowest.bit_length() - 1)
+		bitboard ^= lowest
+	return squares
+
+#Precomputed attack tables
+def __jump_table(jumps):
+	table = []
+	for sq in range(64):
+		x, y = coord_of_square[sq]
+		bitboard = 0
+		for dx, dy in jumps:
+			if 0 <= x + dx <= 7 and 0 <= y + dy <= 7:
+				bitboard |= 1 << square_of((x + dx, y + dy))
+		table.append(bitboard)
+	return table
+
+knight_attacks = __jump_table(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+king_attacks = __jump_table(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)))
+
+#pawn_attacks[color][sq]: squares attacked by a pawn of that color standing on sq
+pawn_attacks = dict()
+pawn_attacks['w'] = __jump_table(((-1, -1), (1, -1)))
+pawn_attacks['b'] = __jump_table(((-1, 1), (1, 1)))
+
+#Rays going to increasing square index use the lowest blocker, the others the highest one
+positive_directions = ((1, 0), (0, 1), (1, 1), (-1, 1))
+negative_directions = ((-1, 0), (0, -1), (-1, -1), (1, -1))
+
+rays = dict()
+for __direction in positive_directions + negative_directions:
+	rays[__direction] = []
+	for sq in range(64):
+		x, y = coord_of_square[sq]
+		bitboard = 0
+		x += __direction[0]
+		y += __direction[1]
+		while 0 <= x <= 7 and 0 <= y <= 7:
+			bitboard |= 1 << square_of((x, y))
+			x += __direction[0]
+			y += __direction[1]
+		rays[__direction].append(bitboard)
+
+#Rays of a slider, each with True if it goes to increasing square index
+bishop_rays = [(rays[direction], direction in positive_directions) for direction in ((1, 1), (-1, 1), (-1, -1), (1, -1))]
+rook_rays = [(rays[direction], direction in positive_directions) for direction in ((1, 0), (0, 1), (-1, 0), (0, -1))]
+
+def __slider_attacks(sq, occupied, slider_rays):
+	attacks = 0
+	for ray, positive in slider_rays:
+		attacks |= ray[sq]
+		blockers = ray[sq] & occupied
+		if blockers:
+			if positive:
+				blocker = (blockers & -blockers).bit_length() - 1
+			else:
+				blocker = blockers.bit_length() - 1
+			attacks ^= ray[blocker]
+	return attacks
+
+def bishop_attacks(sq, occupied):
+	return __slider_attacks(sq, occupied, bishop_rays)
+
+def rook_attacks(sq, occupied):
+	return __slider_attacks(sq, occupied, rook_rays)
+
+#Position holding one bitboard per piece code (bitboards[code]) and per color (occupied[color]), next to the board
+class bitboard_state(chess_rules.state_board):
+	__slots__ = ('bitboards', 'occupied')
+
+	def __init__(self, board = None, turn = 'w'):
+		chess_rules.state_board.__init__(self, board, turn)
+		self.refresh_bitboards()
+
+	#Rebuild bitboards from the board
+	def refresh_bitboards(self):
+		self.bitboards = [0 for i in range(16)]
+		self.occupied = {'w': 0, 'b': 0}
+		for sq in range(64):
+			code = self.board[sq]
+			if code:
+				self.bitboards[code] |= 1 << sq
+				self.occupied[color_of_bit[code & BLACK]] |= 1 << sq
+
+	def toggle_piece(self, code, sq):
+		bit = 1 << sq
+		self.bitboards[code] ^= bit
+		self.occupied['b' if code & BLACK else 'w'] ^= bit
+
+	def place_piece(self, piece_name, coord):
+		sq = square_of(coord)
+		if self.board[sq]:
+			self.toggle_piece(self.board[sq], sq)
+		chess_rules.state_board.place_piece(self, piece_name, coord)
+		if piece_name:
+			self.toggle_piece(piece_codes[piece_name], sq)
+
+	def copy(self):
+		copy_state = chess_rules.state_board.copy(self)
+		copy_state.bitboards = self.bitboards.copy()
+		copy_state.occupied = self.occupied.copy()
+
+		return copy_state
+
+	#Bits that change with a move; toggling them again takes the move back
+	def __toggle_move(self, start_sq, target_sq, code, final_code, captured_code, captured_sq):
+		self.toggle_piece(code, start_sq)
+		self.toggle_piece(final_code, target_sq)
+		if captured_code:
+			self.toggle_piece(captured_code, captured_sq)
+		if code & 7 == KING and (target_sq - start_sq == 2 or target_sq - start_sq == -2):
+			rook = (code & BLACK) | ROOK
+			if target_sq % 8 == 6:
+				self.toggle_piece(rook, target_sq + 1)
+				self.toggle_piece(rook, target_sq - 1)
+			else:
+				self.toggle_piece(rook, target_sq - 2)
+				self.toggle_piece(rook, target_sq + 1)
+
+	def make_move(self, move):
+		undo = chess_rules.state_board.make_move(self, move)
+		start_sq, target_sq, code, captured_code, captured_sq = undo[:5]
+		self.__toggle_move(start_sq, target_sq, code, self.board[target_sq], captured_code, captured_sq)
+		return undo
+
+	def unmake_move(self, undo):
+		start_sq, target_sq, code, captured_code, captured_sq = undo[:5]
+		self.__toggle_move(start_sq, target_sq, code, self.board[target_sq], captured_code, captured_sq)
+		chess_rules.state_board.unmake_move(self, undo)
+
+#Bitboard state with the same position as a chess_rules state
+def from_array_state(array_state):
+	state = bitboard_state(bytearray(array_state.board), array_state.turn)
+	state.flags = array_state.flags
+	state.status = array_state.status
+	state.key = array_state.key
+	state.halfmove = array_state.halfmove
+	state.fullmove = array_state.fullmove
+
+	return state
+
+#Set state to initial chess position
+def start_board_position():
+	return from_array_state(chess_rules.start_board_position())
+
+#Set state to position given in FEN notation
+def fen_to_state(fen):
+	return from_array_state(chess_rules.fen_to_state(fen))
+
+#True if square (coordinate) is attacked by pieces of color by_color
+def is_square_attacked(square, by_color, state):
+	return square_attacked(square_of(square), by_color, state)
+
+#Same as is_square_attacked, for square index sq
+def square_attacked(sq, by_color, state):
+	bitboards = state.bitboards
+	color = color_bit[by_color]
+	if knight_attacks[sq] & bitboards[color | KNIGHT]:
+		return True
+	if king_attacks[sq] & bitboards[color | KING]:
+		return True
+	if pawn_attacks[reverse_color(by_color)][sq] & bitboards[color | PAWN]:
+		return True
+	occupied = state.occupied['w'] | state.occupied['b']
+	queens = bitboards[color | QUEEN]
+	if bishop_attacks(sq, occupied) & (bitboards[color | BISHOP] | queens):
+		return True
+	if rook_attacks(sq, occupied) & (bitboards[color | ROOK] | queens):
+		return True
+	return False
+
+#Bitboard of squares at scope of the piece on sq (see chess_rules.piece_scope)
+def scope_bitboard(sq, state):
+	code = state.board[sq]
+	if not code:
+		return 0
+	color = 'b' if code & BLACK else 'w'
+	kind = code & 7
+	own = state.occupied[color]
+	occupied = own | state.occupied[reverse_color(color)]
+
+	if kind == KNIGHT:
+		return knight_attacks[sq] & ~own
+	if kind == BISHOP:
+		return bishop_attacks(sq, occupied) & ~own
+	if kind == ROOK:
+		return rook_attacks(sq, occupied) & ~own
+	if kind == QUEEN:
+		return (bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)) & ~own
+
+	x, y = coord_of_square[sq]
+	if kind == PAWN:
+		step, home, passant_row = (-8, 6, 3) if color == 'w' else (8, 1, 4)
+		scope = pawn_attacks[color][sq] & state.occupied[reverse_color(color)]
+		if 0 <= sq + step <= 63 and not (occupied >> (sq + step)) & 1:
+			scope |= 1 << (sq + step)
+			if y == home and not (occupied >> (sq + 2 * step)) & 1:
+				scope |= 1 << (sq + 2 * step)
+		passant = (state.flags >> 4) - 1
+		if y == passant_row and passant >= 0 and color == state.turn and abs(passant - x) == 1:
+			scope |= 1 << (sq + step + passant - x)
+		return scope
+
+	#King, with castling
+	scope = king_attacks[sq] & ~own
+	if (x, y) == ((4, 7) if color == 'w' else (4, 0)):
+		if state.flags & (1 << special_dict[color + '0-0']):
+			if not (occupied >> (sq + 1)) & 3:
+				scope |= 1 << (sq + 2)
+		if state.flags & (1 << special_dict[color + '0-0-0']):
+			if not (occupied >> (sq - 3)) & 7:
+				scope |= 1 << (sq - 2)
+	return scope
+
+#Square indexes at scope of the piece on sq
+def scope_squares(sq, state):
+	return squares_of(scope_bitboard(sq, state))
+
+#Return scope of piece at coord, at board state 'state'
+def piece_scope(coord, state):
+	return [coord_of_square[target] for target in squares_of(scope_bitboard(square_of(coord), state))]
+
+def king_square(state, color):
+	king = state.bitboards[color_bit[color] | KING]
+	if not king:
+		return None
+	return king.bit_length() - 1
+
+#True if king of given color is in check in given state
+def king_in_check(state, color):
+	sq = king_square(state, color)
+	return sq is not None and square_attacked(sq, reverse_color(color), state)
+
+#Find if kings are in check in given state: (white in check, black in check).
+#Raise ValueError if a king is missing
+def check_king(state):
+	if king_square(state, 'w') is None or king_square(state, 'b') is None:
+		raise ValueError("Missing king in the board")
+
+	return king_in_check(state, 'w'), king_in_check(state, 'b')
+
+#Play move on state if it's legal. Return undo information, or None if move is illegal (state is left unchanged)
+def make_legal_move(state, move):
+	start, target, __ = move
+	turn = state.turn
+
+	#Castling: not in check to castle and not in check in the way to castling
+	if state.board[square_of(start)] & 7 == KING and abs(target[0] - start[0]) == 2:
+		opponent = reverse_color(turn)
+		if square_attacked(square_of(start), opponent, state):
+			return None
+		if square_attacked(square_of(((start[0] + target[0]) // 2, start[1])), opponent, state):
+			return None
+
+	#Not ending in check
+	undo = state.make_move(move)
+	if king_in_check(state, turn):
+		state.unmake_move(undo)
+		return None
+
+	return undo
+
+#All moves (start, target, promotion_piece) of the side to move at piece scope. Not necessarily legal
+def pseudo_legal_moves(state):
+	for sq in squares_of(state.occupied[state.turn]):
+		for move in moves_to(state, sq, squares_of(scope_bitboard(sq, state))):
+			yield move
+
+#True if move is at scope of a piece of the side to move (ex. a hash move from another position)
+def is_pseudo_legal(move, state):
+	start, target, promotion_piece = move
+	code = state.board[square_of(start)]
+	if not code or code & BLACK != color_bit[state.turn]:
+		return False
+	if (promotion_piece is not None) != (code & 7 == PAWN and (target[1] == 0 or target[1] == 7)):
+		return False
+	return (scope_bitboard(square_of(start), state) >> square_of(target)) & 1 == 1
+
+#Captures (passant included) and queen promotions of the side to move, best first: list of (score, move)
+def capture_moves(state, exclude = None):
+	turn = state.turn
+	enemy = state.occupied[reverse_color(turn)]
+	promotion_row = 0xff if turn == 'w' else 0xff << 56
+	captures = []
+	for sq in squares_of(state.occupied[turn]):
+		attacker = state.board[sq] & 7
+		scope = scope_bitboard(sq, state)
+		if attacker == PAWN:
+			#Passant and promotions are the pawn targets that are not straight pushes
+			targets = scope & (enemy | promotion_row | pawn_attacks[turn][sq])
+		else:
+			targets = scope & enemy
+		for move in moves_to(state, sq, squares_of(targets)):
+			if move == exclude or move[2] in ('N', 'R', 'B'):
+				continue
+			victim = state.board[square_of(move[1])] & 7
+			if victim:
+				score = ordering_value[victim] * 16 - ordering_value[attacker]
+			elif move[2] == 'Q':
+				score = ordering_value[QUEEN] * 16 - ordering_value[PAWN]
+			else:
+				score = ordering_value[PAWN] * 16 - ordering_value[PAWN]
+			captures.append((score, move))
+	captures.sort(key = lambda capture: capture[0], reverse = True)
+
+	return captures
+
+#All legal moves of the side to move. State is only changed temporarily
+def legal_moves(state):
+	return chess_rules.legal_moves(state, pseudo_legal_moves, make_legal_move)
+
+#From current state, return all next possible states (see chess_rules.child_states)
+def child_states(state):
+	return chess_rules.child_states(state, legal_moves)
+
+def finished_game_check(state):
+	return chess_rules.finished_game_check(state, pseudo_legal_moves, make_legal_move, king_in_check)
+
+#Test if given move is legal. If it is, return child state
+def legal_move_check(start, target, state, promotion_piece = None):
+	code = state.board[square_of(start)]
+	if not code or code & BLACK != color_bit[state.turn]:
+		return False
+
+	if not (scope_bitboard(square_of(start), state) >> square_of(target)) & 1:
+		return False
+
+	move = (start, target, promotion_piece)
+	undo = make_legal_move(state, move)
+	if undo is None:
+		return False
+	state.unmake_move(undo)
+
+	return child_from_move(state, move)
+
+#Game of bitboard states (see chess_rules.game)
+class game(chess_rules.game):
+	start_position = staticmethod(start_board_position)
+	generate_moves = staticmethod(legal_moves)
+
+#Positions used to compare move generators, as move sequences from the start position
+compare_positions = (
+	(),
+	(((4, 6), (4, 4)), ((4, 1), (4, 3)), ((6, 7), (5, 5)), ((1, 0), (2, 2)), ((5, 7), (2, 4))),
+	(((3, 6), (3, 4)), ((6, 0), (5, 2)), ((2, 6), (2, 4)), ((4, 1), (4, 2)), ((1, 7), (2, 5)), ((5, 0), (1, 4)), ((3, 7), (2, 6))),
+	(((4, 6), (4, 4)), ((2, 1), (2, 3)), ((6, 7), (5, 5)), ((3, 1), (3, 2)), ((3, 6), (3, 4)), ((2, 3), (3, 4)), ((5, 5), (3, 4))),
+)
+
+#Count leaf nodes of the legal move tree up to depth
+def count_nodes(rules, state, depth):
+	if depth == 0:
+		return 1
+	nodes = 0
+	for move in rules.pseudo_legal_moves(state):
+		undo = rules.make_legal_move(state, move)
+		if undo is not None:
+			nodes += count_nodes(rules, state, depth - 1)
+			state.unmake_move(undo)
+	return nodes
+
+#Node throughput of chess_rules and bitboard_rules on compare_positions
+def compare_generators(depth = 2):
+	results = dict()
+	for rules in (chess_rules, sys.modules[__name__]):
+		total_nodes = 0
+		start_time = time.perf_counter()
+		for moves in compare_positions:
+			state = rules.start_board_position()
+			for start, target in moves:
+				state.make_move((start, target, None))
+			total_nodes += count_nodes(rules, state, depth)
+		elapsed = time.perf_counter() - start_time
+		results[rules.__name__] = (total_nodes, elapsed)
+		print("%-15s %8d nodes %7.2f s %9.0f nodes/s" % (rules.__name__, total_nodes, elapsed, total_nodes / elapsed))
+
+	return results
+
+def main():
+	import perft
+	passed = perft.check_reference_positions(sys.modules[__name__])
+	compare_generators()
+
+	return 0 if passed else 1
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,10 +1,11 @@
 #All game logic is contained in this file
 #
-#
+#A position keeps its pieces in a flat bytearray of 64 small integer codes, indexed by
+#square = y * 8 + x (a8 = 0, h8 = 7, ..., h1 = 63), and castling rights and passant packed in one integer.
+#state.pieces[x, y] and state.special[...] still give piece names ('wp', 'bK', ...) and the old special list
 
-import numpy as np
-import search_algo as search
-import heapq
+import random
+import piece_tables
 
 #Dictionary of special moves
 special_dict = dict()
@@ -15,37 +16,381 @@ special_dict['b0-0-0'] = 3
 special_dict['passant'] = 4
 special_dict['game_finished'] = 5
 
+pieces_name = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+
+#Piece codes: kind in the 3 low bits, plus BLACK for black pieces. 0 is an empty square
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+BLACK = 8
+piece_kinds = ' pNBRQK'
+color_bit = {'w': 0, 'b': BLACK}
+color_of_bit = {0: 'w', BLACK: 'b'}
+
+#piece_names[code] is the name of the piece, piece_codes[name] its code
+piece_names = ['' for i in range(16)]
+piece_codes = {'': EMPTY}
+for __name in pieces_name:
+	piece_codes[__name] = color_bit[__name[0]] | piece_kinds.index(__name[1])
+	piece_names[piece_codes[__name]] = __name
+
+#Square index of internal coordinate (x, y)
+def square_of(coord):
+	return coord[1] * 8 + coord[0]
+
+coord_of_square = [(sq % 8, sq // 8) for sq in range(64)]
+
+#Squares in the order positions are scanned (by column, like the old pieces[i, j] loops)
+scan_order = [square_of((i, j)) for i in range(8) for j in range(8)]
+
+#Castling rights and passant packed in state.flags: bit (1 << special index) for each castling right,
+#and passant file + 1 in bits 4 to 7 (passant is always for the side to move)
+CASTLING_MASK = 15
+
+#Castling rights kept when a piece leaves or arrives on each square (king and rook starting squares)
+castling_keep = [CASTLING_MASK for sq in range(64)]
+castling_keep[square_of((7, 7))] &= ~(1 << special_dict['w0-0'])
+castling_keep[square_of((0, 7))] &= ~(1 << special_dict['w0-0-0'])
+castling_keep[square_of((4, 7))] &= ~(1 << special_dict['w0-0'] | 1 << special_dict['w0-0-0'])
+castling_keep[square_of((7, 0))] &= ~(1 << special_dict['b0-0'])
+castling_keep[square_of((0, 0))] &= ~(1 << special_dict['b0-0-0'])
+castling_keep[square_of((4, 0))] &= ~(1 << special_dict['b0-0'] | 1 << special_dict['b0-0-0'])
+
+#Pieces a pawn can promote to, most useful first
+promotion_pieces = ('Q', 'N', 'R', 'B')
+
+#Moves as small integers (start | target << 6 | promotion << 12), 0 meaning no move
+promotion_codes = (None, 'N', 'B', 'R', 'Q')
+
+def encode_move(move):
+	start, target, promotion_piece = move
+	return square_of(start) | square_of(target) << 6 | promotion_codes.index(promotion_piece) << 12
+
+def decode_move(code):
+	return (coord_of_square[code & 63], coord_of_square[(code >> 6) & 63], promotion_codes[code >> 12])
+
+#Zobrist hashing: a position key is the xor of random numbers for each piece on its square,
+#the side to move, castling rights and passant file
+__zobrist_random = random.Random(2021)
+zobrist_pieces = dict()
+for __name in pieces_name:
+	zobrist_pieces[__name] = [__zobrist_random.getrandbits(64) for i in range(64)]
+zobrist_black_turn = __zobrist_random.getrandbits(64)
+zobrist_castling = [__zobrist_random.getrandbits(64) for i in range(4)]
+zobrist_passant = [__zobrist_random.getrandbits(64) for i in range(8)]
+
+#Same numbers indexed by piece code, and by packed flags
+zobrist_codes = [None for i in range(16)]
+for __name in pieces_name:
+	zobrist_codes[piece_codes[__name]] = zobrist_pieces[__name]
+zobrist_flags = []
+for __flags in range(256):
+	__key = 0
+	for i in range(4):
+		if __flags & (1 << i):
+			__key ^= zobrist_castling[i]
+	if 0 < __flags >> 4 <= 8:
+		__key ^= zobrist_passant[(__flags >> 4) - 1]
+	zobrist_flags.append(__key)
+
+#Compute zobrist key of state from scratch
+def zobrist_key(state):
+	key = 0
+	for sq in range(64):
+		if state.board[sq]:
+			key ^= zobrist_codes[state.board[sq]][sq]
+	if state.turn == 'b':
+		key ^= zobrist_black_turn
+
+	return key ^ zobrist_flags[state.flags]
+
+#Evaluation terms of piece_tables indexed by piece code
+terms_of_code = [None for i in range(16)]
+for __name in pieces_name:
+	terms_of_code[piece_codes[__name]] = piece_tables.piece_terms[__name]
+
+#Running evaluation terms of state computed from scratch: material, middle game and end game
+#piece-square sums (dicts by color, centipawns) and game phase
+def evaluation_terms(state):
+	material = {'w': 0, 'b': 0}
+	middle_game = {'w': 0, 'b': 0}
+	end_game = {'w': 0, 'b': 0}
+	phase = 0
+	for sq in range(64):
+		code = state.board[sq]
+		if code:
+			color = color_of_bit[code & BLACK]
+			piece_material, middle, end, piece_phase = terms_of_code[code][sq]
+			material[color] += piece_material
+			middle_game[color] += middle
+			end_game[color] += end
+			phase += piece_phase
+
+	return material, middle_game, end_game, phase
+
+#Old style access to the pieces: view[x, y] is the name of the piece on (x, y), '' if empty
+class pieces_view():
+	__slots__ = ('board',)
+
+	def __init__(self, board):
+		self.board = board
+
+	def __getitem__(self, coord):
+		return piece_names[self.board[coord[1] * 8 + coord[0]]]
+
+	def __setitem__(self, coord, piece_name):
+		self.board[coord[1] * 8 + coord[0]] = piece_codes[piece_name]
+
+#Old style access to the special list of a state (see special_dict)
+class special_view():
+	__slots__ = ('state',)
+
+	def __init__(self, state):
+		self.state = state
+
+	def __getitem__(self, index):
+		state = self.state
+		if index < 4:
+			return bool(state.flags & (1 << index))
+		if index == special_dict['passant']:
+			if state.flags >> 4:
+				return (state.turn, (state.flags >> 4) - 1)
+			return False
+		if index == special_dict['game_finished']:
+			return state.status
+		raise IndexError(index)
+
+	def __setitem__(self, index, value):
+		if index == special_dict['game_finished']:
+			self.state.status = value
+		else:
+			for info_type in special_dict:
+				if special_dict[info_type] == index:
+					self.state.change_special(info_type, value)
+
+	def __len__(self):
+		return 6
+
+	def copy(self):
+		return [self[i] for i in range(6)]
+
 
 #This class must contain all specifications of a position
 class state_board():
-	def __init__(self, pieces = np.zeros(64, dtype = 'U2').reshape(8,8), turn = 'w'):
-		self.pieces = pieces
+	__slots__ = ('board', 'turn', 'flags', 'status', 'key', 'kings', 'material', 'middle_game', 'end_game', 'phase', 'halfmove', 'fullmove')
+
+	def __init__(self, board = None, turn = 'w'):
+		if board is None:
+			board = bytearray(64)
+		self.board = board
 		self.turn = turn
-		self.special = [False for i in range(6)]
-		self.parent = None
+		self.flags = 0
+		self.status = False	#Game finished: 'w' or 'b' (winner), 'Draw' or False
+		self.halfmove = 0	#Plies since the last capture or pawn move
+		self.fullmove = 1	#Move number, incremented after each black move
+		self.key = zobrist_key(self)
+
+		#Squares of kings, None if missing
+		self.kings = {'w': None, 'b': None}
+		for sq in range(64):
+			if board[sq] & 7 == KING:
+				self.kings[color_of_bit[board[sq] & BLACK]] = sq
+
+		#Evaluation terms, updated with each move
+		self.material, self.middle_game, self.end_game, self.phase = evaluation_terms(self)
+
+	@property
+	def pieces(self):
+		return pieces_view(self.board)
+
+	@property
+	def special(self):
+		return special_view(self)
 
 	def place_piece(self, piece_name, coord):
-		self.pieces[coord] = piece_name
+		sq = square_of(coord)
+		old_code = self.board[sq]
+		if old_code:
+			self.key ^= zobrist_codes[old_code][sq]
+			self.update_terms(old_code, sq, -1)
+			if old_code & 7 == KING and self.kings[color_of_bit[old_code & BLACK]] == sq:
+				self.kings[color_of_bit[old_code & BLACK]] = None
+		code = piece_codes[piece_name]
+		self.board[sq] = code
+		if code:
+			self.key ^= zobrist_codes[code][sq]
+			self.update_terms(code, sq, 1)
+			if code & 7 == KING:
+				self.kings[piece_name[0]] = sq
 
 	#info_type: 'b0-0', 'b0-0-0', 'w0-0', 'w0-0-0', 'passant', ...
 	def change_special(self, info_type, value):
-		self.special[special_dict[info_type]] = value
+		index = special_dict[info_type]
+		flags = self.flags
+		if index < 4:
+			flags = flags | (1 << index) if value else flags & ~(1 << index)
+		elif info_type == 'passant':
+			flags = (flags & CASTLING_MASK) | ((value[1] + 1) << 4 if value else 0)
+		else:
+			self.status = value
+		self.key ^= zobrist_flags[self.flags] ^ zobrist_flags[flags]
+		self.flags = flags
 
 	def change_turn(self, turn):
+		if turn != self.turn:
+			self.key ^= zobrist_black_turn
 		self.turn = turn
 
-	def set_parent(self, parent):
-		self.parent = parent
-
 	def copy(self):
-		copy_state = state_board()
-		copy_state.pieces = np.copy(self.pieces)
+		copy_state = self.__class__.__new__(self.__class__)
+		copy_state.board = bytearray(self.board)
 		copy_state.turn = self.turn
-		copy_state.special = self.special.copy()
-		copy_state.parent = self.parent
+		copy_state.flags = self.flags
+		copy_state.status = self.status
+		copy_state.key = self.key
+		copy_state.kings = self.kings.copy()
+		copy_state.material = self.material.copy()
+		copy_state.middle_game = self.middle_game.copy()
+		copy_state.end_game = self.end_game.copy()
+		copy_state.phase = self.phase
+		copy_state.halfmove = self.halfmove
+		copy_state.fullmove = self.fullmove
 
 		return copy_state
 
+	#Add (sign = 1) or remove (sign = -1) piece code on square sq from the evaluation terms
+	def update_terms(self, code, sq, sign):
+		material, middle, end, phase = terms_of_code[code][sq]
+		color = 'b' if code & BLACK else 'w'
+		self.material[color] += sign * material
+		self.middle_game[color] += sign * middle
+		self.end_game[color] += sign * end
+		self.phase += sign * phase
+
+	#Play move = (start, target, promotion_piece) in place, without checking if it's legal
+	#Return undo information to be given to unmake_move
+	def make_move(self, move):
+		start, target, promotion_piece = move
+		start_sq = start[1] * 8 + start[0]
+		target_sq = target[1] * 8 + target[0]
+		board = self.board
+		code = board[start_sq]
+		color = code & BLACK
+		kind = code & 7
+		captured_code = board[target_sq]
+		captured_sq = target_sq
+		saved_flags = self.flags
+		saved_key = self.key
+		key = saved_key ^ zobrist_black_turn ^ zobrist_flags[saved_flags]
+		update_terms = self.update_terms
+
+		board[start_sq] = EMPTY
+		final_code = code
+		flags = saved_flags & CASTLING_MASK & castling_keep[start_sq] & castling_keep[target_sq]
+
+		if kind == PAWN:
+			#Passant capture
+			if not captured_code and start[0] != target[0]:
+				captured_sq = start[1] * 8 + target[0]
+				captured_code = board[captured_sq]
+				board[captured_sq] = EMPTY
+			#Promotion
+			elif target[1] == 0 or target[1] == 7:
+				final_code = color | piece_kinds.index(promotion_piece or 'Q')
+			#Two mover pawn; possible passant available
+			elif abs(target[1] - start[1]) == 2:
+				flags |= (start[0] + 1) << 4
+
+		elif kind == KING:
+			self.kings[color_of_bit[color]] = target_sq
+
+			#Castling: move the rook too
+			if target[0] - start[0] == 2 or target[0] - start[0] == -2:
+				rook = color | ROOK
+				if target[0] == 6:
+					rook_start, rook_target = target_sq + 1, target_sq - 1
+				else:
+					rook_start, rook_target = target_sq - 2, target_sq + 1
+				board[rook_start] = EMPTY
+				board[rook_target] = rook
+				key ^= zobrist_codes[rook][rook_start] ^ zobrist_codes[rook][rook_target]
+				update_terms(rook, rook_start, -1)
+				update_terms(rook, rook_target, 1)
+
+		board[target_sq] = final_code
+
+		key ^= zobrist_codes[code][start_sq] ^ zobrist_codes[final_code][target_sq]
+		update_terms(code, start_sq, -1)
+		update_terms(final_code, target_sq, 1)
+		if captured_code:
+			key ^= zobrist_codes[captured_code][captured_sq]
+			update_terms(captured_code, captured_sq, -1)
+
+		self.flags = flags
+		self.key = key ^ zobrist_flags[flags]
+		self.turn = 'b' if self.turn == 'w' else 'w'
+		saved_halfmove = self.halfmove
+		self.halfmove = 0 if kind == PAWN or captured_code else saved_halfmove + 1
+		if color:
+			self.fullmove += 1
+
+		return (start_sq, target_sq, code, captured_code, captured_sq, saved_flags, saved_key, self.status, saved_halfmove)
+
+	#Take back a move played by make_move, restoring the exact previous position
+	def unmake_move(self, undo):
+		start_sq, target_sq, code, captured_code, captured_sq, saved_flags, saved_key, saved_status, saved_halfmove = undo
+		board = self.board
+		update_terms = self.update_terms
+
+		update_terms(board[target_sq], target_sq, -1)
+		update_terms(code, start_sq, 1)
+		board[target_sq] = EMPTY
+		board[start_sq] = code
+		if captured_code:
+			board[captured_sq] = captured_code
+			update_terms(captured_code, captured_sq, 1)
+
+		if code & 7 == KING:
+			self.kings[color_of_bit[code & BLACK]] = start_sq
+
+			#Castling: put the rook back
+			if target_sq - start_sq == 2 or target_sq - start_sq == -2:
+				rook = (code & BLACK) | ROOK
+				if target_sq % 8 == 6:
+					rook_start, rook_target = target_sq + 1, target_sq - 1
+				else:
+					rook_start, rook_target = target_sq - 2, target_sq + 1
+				board[rook_target] = EMPTY
+				board[rook_start] = rook
+				update_terms(rook, rook_target, -1)
+				update_terms(rook, rook_start, 1)
+
+		self.flags = saved_flags
+		self.key = saved_key
+		self.status = saved_status
+		self.turn = 'b' if self.turn == 'w' else 'w'
+		self.halfmove = saved_halfmove
+		if code & BLACK:
+			self.fullmove -= 1
+
+	#Pass the turn (null move, for the search): no passant is left. Return undo for unmake_null_move
+	def make_null_move(self):
+		saved_flags = self.flags
+		saved_key = self.key
+		self.flags = saved_flags & CASTLING_MASK
+		self.key = saved_key ^ zobrist_black_turn ^ zobrist_flags[saved_flags] ^ zobrist_flags[self.flags]
+		self.turn = 'b' if self.turn == 'w' else 'w'
+
+		return (saved_flags, saved_key)
+
+	def unmake_null_move(self, undo):
+		self.flags, self.key = undo
+		self.turn = 'b' if self.turn == 'w' else 'w'
+
 #Dict to translate chess algebraic coordinates (ex. 'b5', 'e4') to internal coordinates
 algebraic_to_internal = dict()
 __aux_coord = "abcdefgh"
@@ -54,6 +399,183 @@ for i in range(8):
 	for j in range(8):
 		algebraic_to_internal[__aux_coord[i] + str(j + 1)] = (i, 7 - j)
 
+internal_to_algebraic = dict()
+for __name, __coord in algebraic_to_internal.items():
+	internal_to_algebraic[__coord] = __name
+
+#Move in UCI long algebraic notation, ex. 'e2e4', 'e7e8q'
+def move_to_uci(move):
+	start, target, promotion_piece = move
+	text = internal_to_algebraic[start] + internal_to_algebraic[target]
+	if promotion_piece:
+		text += promotion_piece.lower()
+	return text
+
+#Move of UCI long algebraic notation (see move_to_uci)
+def uci_to_move(text):
+	if len(text) not in (4, 5) or text[:2] not in algebraic_to_internal or text[2:4] not in algebraic_to_internal:
+		raise ValueError("Invalid UCI move: " + text)
+	promotion_piece = text[4].upper() if len(text) == 5 else None
+	if promotion_piece is not None and promotion_piece not in promotion_pieces:
+		raise ValueError("Invalid UCI move: " + text)
+	return (algebraic_to_internal[text[:2]], algebraic_to_internal[text[2:4]], promotion_piece)
+
+#Standard algebraic notation (SAN) of a legal move at state, ex. 'Nbd2', 'exd5', 'e8=Q+', 'O-O'
+def move_to_san(state, move):
+	start, target, promotion_piece = move
+	code = state.board[square_of(start)]
+	kind = code & 7
+	if kind == KING and abs(target[0] - start[0]) == 2:
+		text = 'O-O' if target[0] == 6 else 'O-O-O'
+	else:
+		capture = state.board[square_of(target)] or (kind == PAWN and start[0] != target[0])
+		if kind == PAWN:
+			text = internal_to_algebraic[start][0] + 'x' if capture else ''
+		else:
+			text = piece_kinds[kind]
+			#Same kind of piece going to the same square: add file, rank or both of the start square
+			others = [other[0] for other in legal_moves(state) if other[1] == target and other[0] != start and state.board[square_of(other[0])] == code]
+			if others:
+				if all(other[0] != start[0] for other in others):
+					text += internal_to_algebraic[start][0]
+				elif all(other[1] != start[1] for other in others):
+					text += internal_to_algebraic[start][1]
+				else:
+					text += internal_to_algebraic[start]
+			if capture:
+				text += 'x'
+		text += internal_to_algebraic[target]
+		if promotion_piece:
+			text += '=' + promotion_piece
+
+	undo = state.make_move(move)
+	if king_in_check(state, state.turn):
+		text += '+' if legal_moves(state) else '#'
+	state.unmake_move(undo)
+
+	return text
+
+#Legal move at state written in SAN (UCI like 'g1f3' and long algebraic like 'Ng1f3' are accepted too)
+def san_to_move(state, text):
+	san = text.rstrip('+#!?')
+	moves = legal_moves(state)
+	if len(san) in (4, 5) and san[:2] in algebraic_to_internal and san[2:4] in algebraic_to_internal:
+		move = uci_to_move(san.lower())
+		if move in moves:
+			return move
+	if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+		step = 2 if len(san) == 3 else -2
+		for move in moves:
+			if state.board[square_of(move[0])] & 7 == KING and move[1][0] - move[0][0] == step:
+				return move
+		raise ValueError("Illegal move: " + text)
+
+	promotion_piece = None
+	if '=' in san:
+		san, promotion_piece = san.split('=', 1)
+		promotion_piece = promotion_piece.upper()
+	elif len(san) > 2 and san[-1] in 'QRBNqrbn' and san[-2] in '18':
+		san, promotion_piece = san[:-1], san[-1].upper()
+
+	kind = PAWN
+	if san and san[0] in 'NBRQK':
+		kind = piece_kinds.index(san[0])
+		san = san[1:]
+	if san[-2:] not in algebraic_to_internal:
+		raise ValueError("Invalid move: " + text)
+	target = algebraic_to_internal[san[-2:]]
+	hint = san[:-2].replace('x', '').replace('-', '')
+	if kind == PAWN and promotion_piece is None and (target[1] == 0 or target[1] == 7):
+		promotion_piece = 'Q'
+
+	matches = []
+	for move in moves:
+		if move[1] != target or move[2] != promotion_piece or state.board[square_of(move[0])] & 7 != kind:
+			continue
+		start_text = internal_to_algebraic[move[0]]
+		if all((char == start_text[0]) if char.isalpha() else (char == start_text[1]) for char in hint):
+			matches.append(move)
+	if len(matches) != 1:
+		raise ValueError(("Ambiguous move: " if matches else "Illegal move: ") + text)
+
+	return matches[0]
+
+#FEN letters of pieces
+fen_letters = dict()
+for __name in pieces_name:
+	fen_letters[__name] = __name[1].upper() if __name[0] == 'w' else __name[1].lower()
+fen_pieces = dict()
+for __name, __letter in fen_letters.items():
+	fen_pieces[__letter] = __name
+
+#Set state to position given in FEN notation (piece placement, turn, castling rights, passant and move counters)
+def fen_to_state(fen):
+	fields = fen.split()
+	rows = fields[0].split('/') if fields else []
+	if len(rows) != 8:
+		raise ValueError("Invalid FEN: " + fen)
+
+	state = state_board()
+	for y in range(8):
+		x = 0
+		for char in rows[y]:
+			if char.isdigit():
+				x += int(char)
+			elif char in fen_pieces and x < 8:
+				state.place_piece(fen_pieces[char], (x, y))
+				x += 1
+			else:
+				raise ValueError("Invalid FEN: " + fen)
+
+	if len(fields) > 1:
+		if fields[1] not in ('w', 'b'):
+			raise ValueError("Invalid FEN: " + fen)
+		state.change_turn(fields[1])
+	if len(fields) > 2:
+		for char, info_type in (('K', 'w0-0'), ('Q', 'w0-0-0'), ('k', 'b0-0'), ('q', 'b0-0-0')):
+			if char in fields[2]:
+				state.change_special(info_type, True)
+	if len(fields) > 3 and fields[3] != '-':
+		if fields[3] not in algebraic_to_internal:
+			raise ValueError("Invalid FEN: " + fen)
+		state.change_special('passant', (state.turn, algebraic_to_internal[fields[3]][0]))
+	if len(fields) > 5:
+		state.halfmove = int(fields[4])
+		state.fullmove = int(fields[5])
+
+	return state
+
+#FEN of state
+def state_to_fen(state):
+	rows = []
+	for y in range(8):
+		row = ''
+		empty = 0
+		for x in range(8):
+			code = state.board[y * 8 + x]
+			if code:
+				if empty:
+					row += str(empty)
+					empty = 0
+				row += fen_letters[piece_names[code]]
+			else:
+				empty += 1
+		if empty:
+			row += str(empty)
+		rows.append(row)
+
+	castling = ''
+	for char, info_type in (('K', 'w0-0'), ('Q', 'w0-0-0'), ('k', 'b0-0'), ('q', 'b0-0-0')):
+		if state.flags & (1 << special_dict[info_type]):
+			castling += char
+
+	#Passant target square is behind the pawn that just moved two squares
+	passant = '-'
+	if state.flags >> 4:
+		passant = internal_to_algebraic[((state.flags >> 4) - 1, 2 if state.turn == 'w' else 5)]
+
+	return "%s %s %s %s %d %d" % ('/'.join(rows), state.turn, castling or '-', passant, state.halfmove, state.fullmove)
+
 #Set state to initial chess position
 def start_board_position():
 
@@ -62,7 +584,7 @@ def start_board_position():
 	for i in range(8):
 		state.place_piece('bp', (i, 1))
 		state.place_piece('wp', (i, 6))
-	
+
 	#Pieces
 	state.place_piece('bR', algebraic_to_internal['a8'])
 	state.place_piece('bR', algebraic_to_internal['h8'])
@@ -80,13 +602,13 @@ def start_board_position():
 	state.place_piece('wB', algebraic_to_internal['f1'])
 	state.place_piece('wQ', algebraic_to_internal['d1'])
 	state.place_piece('wK', algebraic_to_internal['e1'])
-	
+
 	#Castling rights
 	state.change_special('b0-0', True)
 	state.change_special('w0-0', True)
 	state.change_special('b0-0-0', True)
 	state.change_special('w0-0-0', True)
-	
+
 	return state
 
 def reverse_color(color):
@@ -95,596 +617,442 @@ def reverse_color(color):
 	elif color == 'b':
 		return 'w'
 
+#Steps (dx, dy) of pieces, in the order their moves are listed
+knight_jumps = ((-1, -2), (1, -2), (-1, 2), (1, 2), (-2, -1), (2, -1), (-2, 1), (2, 1))
+king_steps = ((1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1))
+diagonal_steps = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+straight_steps = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+#Precomputed target squares: jump_squares[steps][sq] lists squares one step away,
+#ray_squares[step][sq] lists squares along the line, nearest first
+def __steps_table(steps):
+	table = []
+	for sq in range(64):
+		x, y = coord_of_square[sq]
+		table.append([square_of((x + dx, y + dy)) for dx, dy in steps if 0 <= x + dx <= 7 and 0 <= y + dy <= 7])
+	return table
+
+knight_squares = __steps_table(knight_jumps)
+king_squares = __steps_table(king_steps)
+
+ray_squares = dict()
+for __step in diagonal_steps + straight_steps:
+	ray_squares[__step] = []
+	for sq in range(64):
+		x, y = coord_of_square[sq]
+		ray = []
+		while 0 <= x + __step[0] <= 7 and 0 <= y + __step[1] <= 7:
+			x += __step[0]
+			y += __step[1]
+			ray.append(square_of((x, y)))
+		ray_squares[__step].append(ray)
+diagonal_rays = [ray_squares[step] for step in diagonal_steps]
+straight_rays = [ray_squares[step] for step in straight_steps]
+
 #Piece scope: These are not necessarily legal moves. To check if it's actually legal, a few constraints relating to the king must be met
 
-#Return scope of piece at coord, at board state 'state'
-def piece_scope(coord, state):
-	x, y = coord
-	moves = []
-	if state.pieces[coord] == '':
-		return moves
-	piece = state.pieces[coord][1]
-	color = state.pieces[coord][0]
+#Squares at scope of the piece on square sq: list of square indexes
+def scope_squares(sq, state):
+	board = state.board
+	code = board[sq]
+	targets = []
+	if not code:
+		return targets
+	color = code & BLACK
+	kind = code & 7
 
 	#Pawn
-	if piece == 'p':
-		#White pawn
-		if color == 'w':
-			if y == 6: #Pawn initial position
-				if not state.pieces[x, y-1]:
-					moves.append((x, y-1))
-					if not state.pieces[x, y-2]:
-						moves.append((x, y-2))
-			elif y > 0: #Any other pawn position
-				if not state.pieces[x, y-1]:
-					moves.append((x, y-1))
+	if kind == PAWN:
+		x, y = coord_of_square[sq]
+		if color:
+			step, home, passant_row = 8, 1, 4
+		else:
+			step, home, passant_row = -8, 6, 3
+		if 0 <= sq + step <= 63:
+			if not board[sq + step]:
+				targets.append(sq + step)
+				if y == home and not board[sq + 2 * step]:
+					targets.append(sq + 2 * step)
 
 			#Possible pawn captures
-			if y > 0:
-				if x > 0:
-					if state.pieces[x-1, y-1] and state.pieces[x-1, y-1][0] == 'b':
-						moves.append((x-1, y-1))
-				if x < 7:
-					if state.pieces[x+1, y-1] and state.pieces[x+1, y-1][0] == 'b':
-						moves.append((x+1, y-1))
-
-			#Passant
-			if y == 3:
-				if x-1 >= 0:
-					if (color, x-1) == state.special[special_dict['passant']]:
-						moves.append((x-1, 2))
-				if x+1 <= 7:
-					if (color, x+1) == state.special[special_dict['passant']]:
-						moves.append((x+1, 2))
-		#Black pawn
-		elif color == 'b':
-			if y == 1: #Pawn initial position
-				if not state.pieces[x, y+1]:
-					moves.append((x, y+1))
-					if not state.pieces[x, y+2]:
-						moves.append((x, y+2))
-			elif y < 7: #Any other pawn position
-				if not state.pieces[x, y+1]:
-					moves.append((x, y+1))
+			if x > 0 and board[sq + step - 1] and board[sq + step - 1] & BLACK != color:
+				targets.append(sq + step - 1)
+			if x < 7 and board[sq + step + 1] and board[sq + step + 1] & BLACK != color:
+				targets.append(sq + step + 1)
+
+		#Passant
+		passant = state.flags >> 4
+		if passant and y == passant_row and color_bit[state.turn] == color and (passant - 1 - x == 1 or passant - 1 - x == -1):
+			targets.append(sq + step + passant - 1 - x)
+		return targets
+
+	#Bishop, rook, queen
+	if kind == BISHOP or kind == ROOK or kind == QUEEN:
+		if kind == BISHOP:
+			rays = diagonal_rays
+		elif kind == ROOK:
+			rays = straight_rays
+		else:
+			rays = diagonal_rays + straight_rays
+		for ray in rays:
+			for target in ray[sq]:
+				if board[target]:
+					if board[target] & BLACK != color:
+						targets.append(target)
+					break
+				targets.append(target)
+		return targets
 
-			#Possible pawn captures
-			if y < 7:
-				if x > 0:
-					if state.pieces[x-1, y+1] and state.pieces[x-1, y+1][0] == 'w':
-						moves.append((x-1, y+1))
-				if x < 7:
-					if state.pieces[x+1, y+1] and state.pieces[x+1, y+1][0] == 'w':
-						moves.append((x+1, y+1))
-			#Passant
-			if y == 4:
-				if x-1 >= 0:
-					if (color, x-1) == state.special[special_dict['passant']]:
-						moves.append((x-1, 5))
-				if x+1 <= 7:
-					if (color, x+1) == state.special[special_dict['passant']]:
-						moves.append((x+1, 5))
-	#Bishop
-	if piece == 'B':
-		aux_x = x
-		aux_y = y
-		while aux_x > 0 and aux_y > 0:
-			aux_x -= 1
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x > 0 and aux_y < 7:
-			aux_x -= 1
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x < 7 and aux_y > 0:
-			aux_x += 1
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x < 7 and aux_y < 7:
-			aux_x += 1
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-	#Rook
-	if piece == 'R':
-		aux_x = x
-		aux_y = y
-		while aux_x < 7:
-			aux_x += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_y < 7:
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x > 0:
-			aux_x -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_y > 0:
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-	#Queen
-	if piece == 'Q':
-		aux_x = x
-		aux_y = y
-		while aux_x > 0 and aux_y > 0:
-			aux_x -= 1
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x > 0 and aux_y < 7:
-			aux_x -= 1
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x < 7 and aux_y > 0:
-			aux_x += 1
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x < 7 and aux_y < 7:
-			aux_x += 1
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x < 7:
-			aux_x += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_y < 7:
-			aux_y += 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
-				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_x > 0:
-			aux_x -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
+	#Knight
+	if kind == KNIGHT:
+		for target in knight_squares[sq]:
+			if not board[target] or board[target] & BLACK != color:
+				targets.append(target)
+		return targets
+
+	#King
+	for target in king_squares[sq]:
+		if not board[target] or board[target] & BLACK != color:
+			targets.append(target)
+
+	#Extra: Castling
+	flags = state.flags
+	if color == 0 and sq == 60:
+		if flags & (1 << special_dict['w0-0']) and not board[61] and not board[62]:
+			targets.append(62)
+		if flags & (1 << special_dict['w0-0-0']) and not board[59] and not board[58] and not board[57]:
+			targets.append(58)
+	if color == BLACK and sq == 4:
+		if flags & (1 << special_dict['b0-0']) and not board[5] and not board[6]:
+			targets.append(6)
+		if flags & (1 << special_dict['b0-0-0']) and not board[3] and not board[2] and not board[1]:
+			targets.append(2)
+
+	return targets
+
+#Return scope of piece at coord, at board state 'state'
+def piece_scope(coord, state):
+	return [coord_of_square[target] for target in scope_squares(square_of(coord), state)]
+
+#True if square is attacked by pieces of color by_color. Looks outward from square and stops at the first attacker
+def is_square_attacked(square, by_color, state):
+	return square_attacked(square_of(square), by_color, state)
+
+#Same as is_square_attacked, for square index sq
+def square_attacked(sq, by_color, state):
+	board = state.board
+	color = color_bit[by_color]
+	x = sq % 8
+
+	#Pawns: white pawns attack upwards (towards a8), so they stand one row below
+	pawn = color | PAWN
+	pawn_sq = sq + 8 if color == 0 else sq - 8
+	if 0 <= pawn_sq <= 63:
+		if x > 0 and board[pawn_sq - 1] == pawn:
+			return True
+		if x < 7 and board[pawn_sq + 1] == pawn:
+			return True
+
+	knight = color | KNIGHT
+	for target in knight_squares[sq]:
+		if board[target] == knight:
+			return True
+
+	king = color | KING
+	for target in king_squares[sq]:
+		if board[target] == king:
+			return True
+
+	#Sliding pieces: first piece found along each line
+	bishop = color | BISHOP
+	rook = color | ROOK
+	queen = color | QUEEN
+	for ray in diagonal_rays:
+		for target in ray[sq]:
+			if board[target]:
+				if board[target] == bishop or board[target] == queen:
+					return True
 				break
-			moves.append((aux_x, aux_y))
-
-		aux_x = x
-		aux_y = y
-		while aux_y > 0:
-			aux_y -= 1
-			if state.pieces[aux_x, aux_y]:
-				if state.pieces[aux_x, aux_y][0] != color:
-					moves.append((aux_x, aux_y))
+	for ray in straight_rays:
+		for target in ray[sq]:
+			if board[target]:
+				if board[target] == rook or board[target] == queen:
+					return True
 				break
-			moves.append((aux_x, aux_y))
 
-	#Knight
-	if piece == 'N':
-		if x-1 >= 0 and y-2 >= 0:
-			if not state.pieces[x-1, y-2] or state.pieces[x-1, y-2][0] != color:
-				moves.append((x-1, y-2))
-		if x+1 <= 7 and y-2 >= 0:	
-			if not state.pieces[x+1, y-2] or state.pieces[x+1, y-2][0] != color:
-				moves.append((x+1, y-2))
-		if x-1 >= 0 and y+2 <= 7:
-			if not state.pieces[x-1, y+2] or state.pieces[x-1, y+2][0] != color:
-				moves.append((x-1, y+2))
-		if x+1 <= 7 and y+2 <= 7:	
-			if not state.pieces[x+1, y+2] or state.pieces[x+1, y+2][0] != color:
-				moves.append((x+1, y+2))
-		if x-2 >= 0 and y-1 >= 0:
-			if not state.pieces[x-2, y-1] or state.pieces[x-2, y-1][0] != color:
-				moves.append((x-2, y-1))
-		if x+2 <= 7 and y-1 >= 0:	
-			if not state.pieces[x+2, y-1] or state.pieces[x+2, y-1][0] != color:
-				moves.append((x+2, y-1))
-		if x-2 >= 0 and y+1 <= 7:
-			if not state.pieces[x-2, y+1] or state.pieces[x-2, y+1][0] != color:
-				moves.append((x-2, y+1))
-		if x+2 <= 7 and y+1 <= 7:	
-			if not state.pieces[x+2, y+1] or state.pieces[x+2, y+1][0] != color:
-				moves.append((x+2, y+1))
+	return False
 
-	#King
-	if piece == 'K':
-		if x+1 <= 7:
-			if not state.pieces[x+1, y] or state.pieces[x+1, y][0] != color:
-				moves.append((x+1, y))
-			if y+1 <= 7:
-				if not state.pieces[x+1, y+1] or state.pieces[x+1, y+1][0] != color:
-					moves.append((x+1, y+1))
-			if y-1 >= 0:
-				if not state.pieces[x+1, y-1] or state.pieces[x+1, y-1][0] != color:
-					moves.append((x+1, y-1))
-		if x-1 >= 0:
-			if not state.pieces[x-1, y] or state.pieces[x-1, y][0] != color:
-				moves.append((x-1, y))
-			if y+1 <= 7:
-				if not state.pieces[x-1, y+1] or state.pieces[x-1, y+1][0] != color:
-					moves.append((x-1, y+1))
-			if y-1 >= 0:
-				if not state.pieces[x-1, y-1] or state.pieces[x-1, y-1][0] != color:
-					moves.append((x-1, y-1))
-		if y+1 <= 7:
-			if not state.pieces[x, y+1] or state.pieces[x, y+1][0] != color:
-				moves.append((x, y+1))
-		if y-1 >= 0:
-			if not state.pieces[x, y-1] or state.pieces[x, y-1][0] != color:
-				moves.append((x, y-1))
-
-		#Extra: Castling
-		if color == 'w':
-			if state.special[special_dict['w0-0']] and coord == (4, 7):
-				if not state.pieces[x+1, y] and not state.pieces[x+2, y]:
-					moves.append((x+2, y))
-			if state.special[special_dict['w0-0-0']] and coord == (4, 7):
-				if not state.pieces[x-1, y] and not state.pieces[x-2, y] and not state.pieces[x-3, y]:
-					moves.append((x-2, y))
-		if color == 'b':
-			if state.special[special_dict['b0-0']] and coord == (4, 0):
-				if not state.pieces[x+1, y] and not state.pieces[x+2, y]:
-					moves.append((x+2, y))
-			if state.special[special_dict['b0-0-0']] and coord == (4, 0):
-				if not state.pieces[x-1, y] and not state.pieces[x-2, y] and not state.pieces[x-3, y]:
-					moves.append((x-2, y))
+#True if king of given color is in check in given state
+def king_in_check(state, color):
+	return square_attacked(state.kings[color], reverse_color(color), state)
 
-	return moves
+#True if color has a piece other than pawns and king (positions with only those are prone to zugzwang)
+def has_pieces(state, color):
+	board = state.board
+	bit = color_bit[color]
+	return (bit | KNIGHT) in board or (bit | BISHOP) in board or (bit | ROOK) in board or (bit | QUEEN) in board
 
-#Find if kings are in check in given state
+#Find if kings are in check in given state: (white in check, black in check).
+#Raise ValueError if a king is missing
 def check_king(state):
-	#Find kings
-	for i in range(8):
-		for j in range(8):
-			if state.pieces[i,j] == 'wK':
-				wK = (i,j)
-			elif state.pieces[i,j] == 'bK':
-				bK = (i,j)
-	try:
-		wK
-		bK
-	except:
-		print("Missing king in the board")
-		return -1
-				
-
-	#Check if any king is at enemy piece scope
-	w_check = False
-	b_check = False
-	for i in range(8):
-		for j in range(8):
-			piece = state.pieces[i, j]
-			if not piece:
-				continue
-			if piece[0] == 'b':
-				if wK in piece_scope((i, j), state):
-					w_check = True
-			elif piece[0] == 'w':
-				if bK in piece_scope((i, j), state):
-					b_check = True
-	
-	return w_check, b_check
+	if state.kings['w'] is None or state.kings['b'] is None:
+		raise ValueError("Missing king in the board")
 
-#Test if given move is legal. If it is, return child state
-def legal_move_check(start, target, state, promotion_piece = None):
-	start_x, start_y = start
-	target_x, target_y = target
-
-	#No piece selected, no move
-	if not state.pieces[start]:
-		return False 
+	return king_in_check(state, 'w'), king_in_check(state, 'b')
 
-	color, piece = state.pieces[start]
+#Play move on state if it's legal (king safety, castling through check).
+#Return undo information for state.unmake_move, or None if move is illegal (state is left unchanged)
+def make_legal_move(state, move):
+	start, target, __ = move
 	turn = state.turn
 
-	#If turn is not respected, move is invalid
-	if turn != color:
+	#Castling: not in check to castle and not in check in the way to castling
+	if state.board[square_of(start)] & 7 == KING and abs(target[0] - start[0]) == 2:
+		opponent = reverse_color(turn)
+		if is_square_attacked(start, opponent, state):
+			return None
+		if is_square_attacked(((start[0] + target[0]) // 2, start[1]), opponent, state):
+			return None
+
+	#Not ending in check
+	undo = state.make_move(move)
+	if king_in_check(state, turn):
+		state.unmake_move(undo)
+		return None
+
+	return undo
+
+#Moves from square sq to target squares, with the four promotions for pawns reaching the last row
+def moves_to(state, sq, targets):
+	start = coord_of_square[sq]
+	if state.board[sq] & 7 == PAWN and (start[1] == 1 or start[1] == 6):
+		for target in targets:
+			if target < 8 or target > 55:
+				for promotion_piece in promotion_pieces:
+					yield (start, coord_of_square[target], promotion_piece)
+			else:
+				yield (start, coord_of_square[target], None)
+	else:
+		for target in targets:
+			yield (start, coord_of_square[target], None)
+
+#All moves (start, target, promotion_piece) of the side to move at piece scope. Not necessarily legal
+def pseudo_legal_moves(state):
+	board = state.board
+	color = color_bit[state.turn]
+	for sq in scan_order:
+		if board[sq] and board[sq] & BLACK == color:
+			for move in moves_to(state, sq, scope_squares(sq, state)):
+				yield move
+
+#Piece values used to order captures (indexed by piece kind): most valuable victim first, then least valuable attacker
+ordering_value = (0, 1, 3, 3, 5, 9, 10)
+
+#True if move is at scope of a piece of the side to move (ex. a hash move from another position)
+def is_pseudo_legal(move, state):
+	start, target, promotion_piece = move
+	code = state.board[square_of(start)]
+	if not code or code & BLACK != color_bit[state.turn]:
 		return False
-	
-	captured_piece = state.pieces[target]
-	
-	#If trying to capture own piece, move is invalid
-	if captured_piece:
-		if captured_piece[0] == turn:
-			return False
-
-	#Check if move is at piece scope
-	if target not in piece_scope(start, state):
+	if (promotion_piece is not None) != (code & 7 == PAWN and (target[1] == 0 or target[1] == 7)):
+		return False
+	return square_of(target) in scope_squares(square_of(start), state)
+
+#Captures and queen promotions of the side to move, best first: list of (score, move)
+def capture_moves(state, exclude = None):
+	board = state.board
+	captures = []
+	for move in pseudo_legal_moves(state):
+		start, target, promotion_piece = move
+		if move == exclude or promotion_piece in ('N', 'R', 'B'):
+			continue
+		attacker = board[square_of(start)] & 7
+		victim = board[square_of(target)] & 7
+		if victim:
+			captures.append((ordering_value[victim] * 16 - ordering_value[attacker], move))
+		elif attacker == PAWN and start[0] != target[0]:
+			captures.append((ordering_value[PAWN] * 16 - ordering_value[PAWN], move))
+		elif promotion_piece == 'Q':
+			captures.append((ordering_value[QUEEN] * 16 - ordering_value[PAWN], move))
+	captures.sort(key = lambda capture: capture[0], reverse = True)
+
+	return captures
+
+#True if move is not a capture (passant included) nor a queen promotion, the moves capture_moves leaves out
+def is_quiet(move, state):
+	start, target, promotion_piece = move
+	if state.board[square_of(target)] or promotion_piece == 'Q':
 		return False
+	return state.board[square_of(start)] & 7 != PAWN or start[0] == target[0]
+
+#Moves of the side to move in the order the search should try them: hash move, captures
+#(see capture_moves), killers (quiet moves to try first, ex. killer moves and countermove), then
+#other quiet moves, by decreasing history[from_square * 64 + to_square] if history is given.
+#Each stage is only generated when the previous one is exhausted, and moves are not checked for
+#legality: the search does it with make_legal_move when it plays them
+def staged_moves(state, hash_move = None, killers = (), history = None):
+	if hash_move and is_pseudo_legal(hash_move, state):
+		yield hash_move
+	else:
+		hash_move = None
+
+	captures = capture_moves(state, hash_move)
+	for score, move in captures:
+		yield move
+
+	tried = set(move for score, move in captures)
+	tried.add(hash_move)
+	for move in killers:
+		if move and move not in tried and is_quiet(move, state) and is_pseudo_legal(move, state):
+			tried.add(move)
+			yield move
+
+	quiet_moves = [move for move in pseudo_legal_moves(state) if move not in tried]
+	if history:
+		quiet_moves.sort(key = lambda move: history[square_of(move[0]) * 64 + square_of(move[1])], reverse = True)
+	for move in quiet_moves:
+		yield move
+
+#All legal moves of the side to move. State is only changed temporarily.
+#Another move generator (ex. bitboard_rules) passes its own pseudo_legal and make_legal
+def legal_moves(state, pseudo_legal = pseudo_legal_moves, make_legal = make_legal_move):
+	moves = []
+	for move in pseudo_legal(state):
+		undo = make_legal(state, move)
+		if undo is not None:
+			state.unmake_move(undo)
+			moves.append(move)
 
-	#Mark if the move is a special move
-	special_move = False
-	if piece == 'K':
-		if target_x - start_x == 2:
-			special_move = '0-0'
-		if target_x - start_x == -2:
-			special_move = '0-0-0'
-	
-	if piece == 'p':
-		if not state.pieces[target] and start_x != target_x:
-			special_move = 'passant'
-
-	
+	return moves
+
+#Return a new state with move played on it. Move must be legal
+def child_from_move(state, move):
 	child_state = state.copy()
+	child_state.make_move(move)
 
-	#Finally move the piece and make last checks to see if move is legal
-	illegal_move = False
-	if special_move == False:
-		child_state.pieces[target] = child_state.pieces[start]
-		child_state.pieces[start] = ''
-		if piece == 'p':
-			if target_y == 0 or target_y == 7:
-				child_state.pieces[target] = color + 'Q'
-
-		#Not ending in check
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-			
-	elif special_move == '0-0':
-
-		#Not in check to castle
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-		#Not in check in the way to castling
-		child_state.pieces[(start_x + target_x) // 2, start_y] = child_state.pieces[start]
-		child_state.pieces[start] = ''
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-		#Not in check at the end of castling
-		child_state.pieces[target] = child_state.pieces[(start_x + target_x) // 2, start_y]
-		child_state.pieces[(start_x + target_x) // 2, start_y] = ''
-		child_state.pieces[target_x -1, target_y] = child_state.pieces[7, target_y]
-		child_state.pieces[7, target_y] = ''
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-	elif special_move == '0-0-0':
-
-		#Not in check to castle
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-		#Not in check in the way to castling
-		child_state.pieces[(start_x + target_x) // 2, start_y] = child_state.pieces[start]
-		child_state.pieces[start] = ''
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-		#Not in check at the end of castling
-		child_state.pieces[target] = child_state.pieces[(start_x + target_x) // 2, start_y]
-		child_state.pieces[(start_x + target_x) // 2, start_y] = ''
-		child_state.pieces[target_x + 1, target_y] = child_state.pieces[0, target_y]
-		child_state.pieces[0, target_y] = ''
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-	elif special_move == 'passant':
-		child_state.pieces[target] = child_state.pieces[start]
-		child_state.pieces[start] = ''
-		child_state.pieces[target_x, start_y] = ''
-		w_check, b_check = check_king(child_state)
-		check = w_check if turn == 'w' else b_check
-		if check:
-			illegal_move = True
-
-	if illegal_move:
+	return child_state
+
+#Test if given move is legal. If it is, return child state
+def legal_move_check(start, target, state, promotion_piece = None):
+	code = state.board[square_of(start)]
+
+	#No piece selected, no move
+	if not code:
 		return False
 
-	#Update rest of informations of child_state
-
-	child_state.turn = reverse_color(child_state.turn)
-
-	#Lost castling rights due to king move
-	if piece == 'K':
-		if child_state.special[special_dict[color + '0-0']]:
-			child_state.special[special_dict[color + '0-0']] = False
-		if child_state.special[special_dict[color + '0-0-0']]:
-			child_state.special[special_dict[color + '0-0-0']] = False
-
-	#Lost castling rights due to rook move
-	if piece == 'R':
-		if color == 'w':
-			if start == (7, 7) and child_state.special[special_dict[color + '0-0']]:
-				child_state.special[special_dict[color + '0-0']] = False
-			if start == (0, 7) and child_state.special[special_dict[color + '0-0-0']]:
-				child_state.special[special_dict[color + '0-0-0']] = False
-		if color == 'b':
-			if start == (7, 0) and child_state.special[special_dict[color + '0-0']]:
-				child_state.special[special_dict[color + '0-0']] = False
-			if start == (0, 0) and child_state.special[special_dict[color + '0-0-0']]:
-				child_state.special[special_dict[color + '0-0-0']] = False
-
-	#Two mover pawn; possible passant available
-	child_state.special[special_dict['passant']] = False
-	if piece == 'p':
-		if abs(target_y - start_y) == 2:
-			child_state.special[special_dict['passant']] = (reverse_color(color), start_x)
-
-	child_state.set_parent(state)
+	#If turn is not respected, move is invalid
+	if code & BLACK != color_bit[state.turn]:
+		return False
 
-	return child_state
+	#Check if move is at piece scope (this also forbids capturing own pieces)
+	if square_of(target) not in scope_squares(square_of(start), state):
+		return False
 
-#Newer implementation, better for the algorithm
-#From current state, return all next possible states
-def new_child_states(state):
-	coordinates = []
-	for i in range(8):
-		for j in range(8):
-			coordinates.append((i, j))
+	move = (start, target, promotion_piece)
+	undo = make_legal_move(state, move)
+	if undo is None:
+		return False
+	state.unmake_move(undo)
 
+	return child_from_move(state, move)
+
+#Legal moves of the side to move, best moves first by evaluate(state) (white positive, ex. search_algo.evaluator)
+def ordered_moves(state, evaluate):
 	turn = state.turn
-	children = []
+	scored = []
 	i = 0
-	for coord in coordinates:
-		if not state.pieces[coord]:
-			continue
-		elif state.pieces[coord][0] != turn:
+	for move in pseudo_legal_moves(state):
+		undo = make_legal_move(state, move)
+		if undo is None:
 			continue
+		i += 1
+		if turn == 'w':
+			scored.append((- evaluate(state), i, move))
 		else:
-			target_list = piece_scope(coord, state)
-			for target in target_list:
-				children_state = legal_move_check(coord, target, state)
-				if children_state != False:
-					i += 1
-					if finished_game_check(children_state):
-						children_state.special[special_dict['game_finished']] = finished_game_check(children_state)
-					if turn == 'w':
-						children.append((- search.evaluator(children_state), i, children_state))
-					else:
-						children.append((search.evaluator(children_state), i, children_state))
-	heapq.heapify(children)
+			scored.append((evaluate(state), i, move))
+		state.unmake_move(undo)
+	scored.sort()
 
-	while children:
-		yield	heapq.heappop(children)[2]
-
-
-	#yield heapq.heappop(children)[2]
+	return [move for __, __, move in scored]
 
+#Newer implementation, better for the algorithm
 #From current state, return all next possible states
-def child_states(state):
-	coordinates = []
-	for i in range(8):
-		for j in range(8):
-			coordinates.append((i, j))
+def new_child_states(state, evaluate):
+	for move in ordered_moves(state, evaluate):
+		yield child_from_move(state, move)
 
-	turn = state.turn
+#From current state, return all next possible states. Their game status is not checked,
+#a state without legal moves is found when its own moves are generated
+def child_states(state, legal = legal_moves):
 	children = []
-	for coord in coordinates:
-		if not state.pieces[coord]:
-			continue
-		elif state.pieces[coord][0] != turn:
-			continue
-		else:
-			target_list = piece_scope(coord, state)
-			for target in target_list:
-				children_state = legal_move_check(coord, target, state)
-				if children_state != False:
-					if finished_game_check(children_state):
-						children_state.special[special_dict['game_finished']] = finished_game_check(children_state)
-					children.append(children_state)
+	for move in legal(state):
+		children.append(child_from_move(state, move))
 
 	return children
 
-def finished_game_check(state):
-	coordinates = []
-	for i in range(8):
-		for j in range(8):
-			coordinates.append((i, j))
+#Game status of state: 'w' or 'b' (winner), 'Draw' or False. Primitives as in legal_moves
+def finished_game_check(state, pseudo_legal = pseudo_legal_moves, make_legal = make_legal_move, in_check = king_in_check):
+	for move in pseudo_legal(state):
+		undo = make_legal(state, move)
+		if undo is not None:
+			state.unmake_move(undo)
+			return False
 
-	turn = state.turn
-	for coord in coordinates:
-		if not state.pieces[coord]:
-			continue
-		elif state.pieces[coord][0] != turn:
-			continue
-		else:
-			target_list = piece_scope(coord, state)
-			for target in target_list:
-				children_state = legal_move_check(coord, target, state)
-				if children_state != False:
-					return False
-
-	w_check, b_check = check_king(state)
-	if turn == 'w':
-		check = w_check
-	elif turn == 'b':
-		check = b_check
-
-	if check: #Checkmate
-		return reverse_color(turn)
+	if in_check(state, state.turn): #Checkmate
+		return reverse_color(state.turn)
 	else:	  #Stalemate
 		return 'Draw'
 
+#Game status of state given whether the side to move has a legal move: 'w' or 'b' (winner), 'Draw' or False
+def status_without_moves(state, has_moves):
+	if has_moves:
+		return False
+	if king_in_check(state, state.turn): #Checkmate
+		return reverse_color(state.turn)
+	return 'Draw'	#Stalemate
+
+#A game: the current state and the stack of moves played to reach it, each with its undo record.
+#States don't point back to the positions before them, history lives only here.
+#Legal moves and status of the current position are computed once and kept until the next move
+class game():
+	start_position = staticmethod(start_board_position)
+	generate_moves = staticmethod(legal_moves)
+	game_status = staticmethod(status_without_moves)
+
+	def __init__(self, state = None):
+		if state is None:
+			state = self.start_position()
+		self.state = state
+		self.history = []	#(move, undo) pairs, first move first
+		self.cached_moves = None
+		self.state.status = self.status()
+
+	#Legal moves of the current state
+	def legal_moves(self):
+		if self.cached_moves is None:
+			self.cached_moves = self.generate_moves(self.state)
+		return self.cached_moves
+
+	#Game status of the current state: 'w' or 'b' (winner), 'Draw' or False
+	def status(self):
+		return self.game_status(self.state, len(self.legal_moves()) > 0)
+
+	#Play a legal move on the current state and update the game status
+	def play(self, move):
+		undo = self.state.make_move(move)
+		self.history.append((move, undo))
+		self.cached_moves = None
+		self.state.status = self.status()
+
+	#Take the last move back and return it, None if no move was played
+	def take_back(self):
+		if not self.history:
+			return None
+		move, undo = self.history.pop()
+		self.state.unmake_move(undo)
+		self.cached_moves = None
+
+		return move
+
+	def moves(self):
+		return [move for move, undo in self.history]
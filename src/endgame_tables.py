@@ -0,0 +1,603 @@
+#Endgame tables: exact result and distance to mate of every position of small material sets
+#(KQK, KRK, KPK, KQKR ...), built by retrograde analysis and kept in one memory mapped file
+#
+#A material set is named by the white pieces then the black pieces, kings first, ex. KRK or KQKR.
+#Tables are built for the stronger side as white; the other colors are found by swapping colors.
+#Each table has one byte per position: 0 for a draw (or an impossible position), else the number of
+#plies to mate plus one; an odd number of plies is a win for the side to move, an even one a loss.
+#Positions are indexed by side to move and piece squares, with the white king moved by symmetry to
+#a1-d1-d4 (files a-d if there are pawns). Castling and en passant are not in the tables.
+#
+#File: b'BCTB', number of tables (4 bytes), then per table its name (8 bytes), offset and size
+#(8 bytes each), then the tables.
+#
+#Usage:
+#	python3 endgame_tables.py generate KQK KRK KPK --output endgame.bin       (4 pieces: KQKR ... take minutes)
+#	python3 endgame_tables.py probe endgame.bin --fen "8/8/8/4k3/8/8/8/KQ6 w - - 0 1"
+
+import sys
+import time
+import mmap
+import struct
+import argparse
+from chess_rules import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK
+
+#Tables file used by the search when there is none given
+DEFAULT_TABLES = 'endgame.bin'
+
+MAGIC = b'BCTB'
+HEADER = struct.Struct('<4sI')
+DIRECTORY_ENTRY = struct.Struct('<8sQQ')
+
+piece_letters = 'KQRBNP'
+letter_kinds = {'K': KING, 'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT, 'P': PAWN}
+letter_values = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+
+#Material sets without any mate: every position is a draw
+trivial_draws = ('KK', 'KBK', 'KNK')
+
+#Move tables, squares are y * 8 + x with y = 0 the 8th rank as in chess_rules
+def __targets(sq, steps):
+	x, y = sq % 8, sq // 8
+	return [(y + dy) * 8 + x + dx for dx, dy in steps if 0 <= x + dx < 8 and 0 <= y + dy < 8]
+
+king_steps = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+knight_steps = ((1, 2), (2, 1), (-1, 2), (-2, 1), (1, -2), (2, -1), (-1, -2), (-2, -1))
+king_targets = [__targets(sq, king_steps) for sq in range(64)]
+knight_targets = [__targets(sq, knight_steps) for sq in range(64)]
+
+#rays[sq][direction]: squares from sq in that direction, rook directions first then bishop ones
+rays = []
+for __sq in range(64):
+	__x, __y = __sq % 8, __sq // 8
+	__rays = []
+	for __dx, __dy in king_steps:
+		__ray = []
+		__i = 1
+		while 0 <= __x + __i * __dx < 8 and 0 <= __y + __i * __dy < 8:
+			__ray.append((__y + __i * __dy) * 8 + __x + __i * __dx)
+			__i += 1
+		__rays.append(__ray)
+	rays.append(__rays)
+
+def slider_rays(kind, sq):
+	if kind == ROOK:
+		return rays[sq][:4]
+	if kind == BISHOP:
+		return rays[sq][4:]
+	return rays[sq]
+
+#Material set of a position given as pieces, a list of (code, square)
+def material_name(pieces):
+	white = ''.join(sorted((piece_letters[6 - (code & 7)] for code, sq in pieces if not code & BLACK), key = piece_letters.index))
+	black = ''.join(sorted((piece_letters[6 - (code & 7)] for code, sq in pieces if code & BLACK), key = piece_letters.index))
+	return white + black
+
+#White and black parts of a material set name
+def split_name(name):
+	second_king = name.index('K', 1)
+	return name[:second_king], name[second_king:]
+
+#True if the tables of name have white as the stronger side (the name tables are built for)
+def is_canonical(name):
+	white, black = split_name(name)
+	return (sum(letter_values[letter] for letter in white), white) >= (sum(letter_values[letter] for letter in black), black)
+
+def swapped_name(name):
+	white, black = split_name(name)
+	return black + white
+
+#Pieces of a material set in index order: white king, black king, then the other white and black pieces
+def name_codes(name):
+	white, black = split_name(name)
+	return [KING, BLACK | KING] + [letter_kinds[letter] for letter in white[1:]] + [BLACK | letter_kinds[letter] for letter in black[1:]]
+
+#Squares the white king is moved to by symmetry, and their index
+pawnless_king_squares = [sq for sq in range(64) if sq % 8 <= 3 and 7 - sq // 8 <= sq % 8]
+pawn_king_squares = [sq for sq in range(64) if sq % 8 <= 3]
+
+#Squares of a position moved by symmetry so the white king is on its table squares: mirror files,
+#mirror ranks and swap files and ranks (the last two without pawns). A king on the a1-h8 diagonal stays
+#there when swapping, the smallest squares of both are taken. Same pieces (codes) are ordered by square
+def canonical_squares(squares, codes, has_pawns):
+	king = squares[0]
+	x, y = king % 8, king // 8
+	flip_x = x > 3
+	if has_pawns:
+		return ordered_squares([sq ^ 7 for sq in squares] if flip_x else squares, codes)
+	flip_y = y < 4
+	if flip_x:
+		squares = [sq ^ 7 for sq in squares]
+		x = 7 - x
+	if flip_y:
+		squares = [sq ^ 56 for sq in squares]
+		y = 7 - y
+	if 7 - y < x:
+		return ordered_squares(squares, codes)
+	swapped = ordered_squares([(7 - sq % 8) * 8 + 7 - sq // 8 for sq in squares], codes)
+	if 7 - y > x:
+		return swapped
+	return min(ordered_squares(squares, codes), swapped)
+
+def ordered_squares(squares, codes):
+	for i in range(2, len(codes) - 1):
+		if codes[i] == codes[i + 1] and squares[i] > squares[i + 1]:
+			squares = squares[:i] + [squares[i + 1], squares[i]] + squares[i + 2:]
+	return squares
+
+#Table layout of a material set: codes of the pieces, squares of the white king and their index, positions by side
+class table_layout():
+	def __init__(self, name):
+		self.name = name
+		self.codes = name_codes(name)
+		self.has_pawns = 'P' in name
+		self.king_squares = pawn_king_squares if self.has_pawns else pawnless_king_squares
+		self.king_index = [-1] * 64
+		for i, sq in enumerate(self.king_squares):
+			self.king_index[sq] = i
+		self.side_size = len(self.king_squares) * 64 ** (len(self.codes) - 1)
+		self.size = 2 * self.side_size
+
+	#Index of the position with squares (in codes order) and turn; the squares are moved by symmetry first
+	def index(self, squares, turn):
+		squares = canonical_squares(squares, self.codes, self.has_pawns)
+		index = self.king_index[squares[0]]
+		for sq in squares[1:]:
+			index = index * 64 + sq
+		return index + (self.side_size if turn == 'b' else 0)
+
+	#Squares (in codes order) and turn of index
+	def position(self, index):
+		turn = 'w'
+		if index >= self.side_size:
+			index -= self.side_size
+			turn = 'b'
+		squares = []
+		for i in range(len(self.codes) - 1):
+			squares.append(index % 64)
+			index //= 64
+		squares.append(self.king_squares[index])
+		squares.reverse()
+		return squares, turn
+
+#Table byte of the position pieces ((code, square) list) with turn from tables (name: bytes like object),
+#None if its material set is not in tables
+def table_value(tables, pieces, turn):
+	name = material_name(pieces)
+	if name in trivial_draws:
+		return 0
+	if not is_canonical(name):
+		#Swap colors: mirror ranks and change the color of every piece and the turn
+		name = swapped_name(name)
+		pieces = [(code ^ BLACK, sq ^ 56) for code, sq in pieces]
+		turn = 'b' if turn == 'w' else 'w'
+	if name not in tables:
+		return None
+
+	layout, table = tables[name]
+	used = [False] * len(pieces)
+	squares = []
+	for code in layout.codes:
+		for i, (piece_code, sq) in enumerate(pieces):
+			if piece_code == code and not used[i]:
+				used[i] = True
+				squares.append(sq)
+				break
+	return table[layout.index(squares, turn)]
+
+#True if square sq is attacked by a piece of pieces ((code, square) list) of color (BLACK or 0)
+def attacked(sq, color, pieces, board):
+	for code, piece_sq in pieces:
+		if code & BLACK != color:
+			continue
+		kind = code & 7
+		if kind == KING:
+			if sq in king_targets[piece_sq]:
+				return True
+		elif kind == KNIGHT:
+			if sq in knight_targets[piece_sq]:
+				return True
+		elif kind == PAWN:
+			forward = -8 if color == 0 else 8
+			if sq - piece_sq in (forward - 1, forward + 1) and abs(sq % 8 - piece_sq % 8) == 1:
+				return True
+		else:
+			for ray in slider_rays(kind, piece_sq):
+				for target in ray:
+					if target == sq:
+						return True
+					if board[target]:
+						break
+	return False
+
+#Board (bytearray of codes) of pieces
+def pieces_board(pieces):
+	board = bytearray(64)
+	for code, sq in pieces:
+		board[sq] = code
+	return board
+
+#Legal moves of pieces with turn: list of (pieces after the move, True if it captures or promotes)
+def successors(pieces, turn):
+	color = 0 if turn == 'w' else BLACK
+	board = pieces_board(pieces)
+	result = []
+	for i, (code, sq) in enumerate(pieces):
+		if code & BLACK != color:
+			continue
+		kind = code & 7
+		targets = []		#(target, promotion code or 0)
+		if kind == KING:
+			targets = [(target, 0) for target in king_targets[sq]]
+		elif kind == KNIGHT:
+			targets = [(target, 0) for target in knight_targets[sq]]
+		elif kind == PAWN:
+			forward = -8 if color == 0 else 8
+			last_row = 0 if color == 0 else 7
+			start_row = 6 if color == 0 else 1
+			pawn_targets = []
+			if not board[sq + forward]:
+				pawn_targets.append(sq + forward)
+				if sq // 8 == start_row and not board[sq + 2 * forward]:
+					pawn_targets.append(sq + 2 * forward)
+			for side in (-1, 1):
+				if 0 <= sq % 8 + side < 8 and board[sq + forward + side] and board[sq + forward + side] & BLACK != color:
+					pawn_targets.append(sq + forward + side)
+			for target in pawn_targets:
+				if target // 8 == last_row:
+					targets += [(target, color | promotion) for promotion in (QUEEN, ROOK, BISHOP, KNIGHT)]
+				else:
+					targets.append((target, 0))
+		else:
+			for ray in slider_rays(kind, sq):
+				for target in ray:
+					targets.append((target, 0))
+					if board[target]:
+						break
+
+		for target, promotion in targets:
+			captured = board[target]
+			if captured and (captured & BLACK == color or captured & 7 == KING):
+				continue
+			after = [(promotion or code, target) if j == i else piece for j, piece in enumerate(pieces) if not (captured and piece[1] == target)]
+			after_board = pieces_board(after)
+			king = next(piece_sq for piece_code, piece_sq in after if piece_code == color | KING)
+			if not attacked(king, color ^ BLACK, after, after_board):
+				result.append((after, bool(captured or promotion)))
+
+	return result
+
+#Positions the side not to move could have come from with a move that doesn't capture nor promote:
+#list of pieces, their side to move is the other one
+def predecessors(pieces, turn):
+	color = BLACK if turn == 'w' else 0
+	board = pieces_board(pieces)
+	result = []
+	for i, (code, sq) in enumerate(pieces):
+		if code & BLACK != color:
+			continue
+		kind = code & 7
+		origins = []
+		if kind == KING:
+			origins = [origin for origin in king_targets[sq] if not board[origin]]
+		elif kind == KNIGHT:
+			origins = [origin for origin in knight_targets[sq] if not board[origin]]
+		elif kind == PAWN:
+			backward = 8 if color == 0 else -8
+			first_row = 6 if color == 0 else 1
+			origin = sq + backward
+			#A pawn is never on the first or last rank
+			if 0 < origin // 8 < 7 and not board[origin]:
+				origins.append(origin)
+				if origin // 8 != first_row and (origin + backward) // 8 == first_row and not board[origin + backward]:
+					origins.append(origin + backward)
+		else:
+			for ray in slider_rays(kind, sq):
+				for origin in ray:
+					if board[origin]:
+						break
+					origins.append(origin)
+
+		for origin in origins:
+			result.append([(code, origin) if j == i else piece for j, piece in enumerate(pieces)])
+
+	return result
+
+#Value for the side to move of a move to a position of byte value (for the other side): (result, plies)
+#with result 1 for a win, 0 for a draw, -1 for a loss
+def result_of(value):
+	if not value:
+		return 0, 0
+	plies = value - 1
+	return (1 if plies % 2 else -1), plies
+
+#Build the table of material set name by retrograde analysis. tables must hold the tables of the
+#material sets reached by captures and promotions. Return the table (bytearray)
+def generate_table(name, tables, verbose = False):
+	layout = table_layout(name)
+	codes = layout.codes
+	values = bytearray(layout.size)
+	tables = dict(tables)
+	tables[name] = (layout, values)
+
+	#Flags of positions
+	ILLEGAL, DRAW_EXIT, WIN_EXIT, DONE = 1, 2, 4, 8
+	flags = bytearray(layout.size)
+	loss_exit = bytearray(layout.size)		#Longest loss through a capture or promotion, plies + 1
+	rounds = dict()		#plies: indexes found (or to be checked) at that distance to mate
+	start_time = time.perf_counter()
+
+	#First pass: illegal positions, mates, stalemates and results through captures and promotions
+	for index in range(layout.size):
+		squares, turn = layout.position(index)
+		if len(set(squares)) < len(squares) or layout.index(squares, turn) != index:
+			flags[index] = ILLEGAL
+			continue
+		pieces = list(zip(codes, squares))
+		if any(code & 7 == PAWN and sq // 8 in (0, 7) for code, sq in pieces):
+			flags[index] = ILLEGAL
+			continue
+		board = pieces_board(pieces)
+		color = 0 if turn == 'w' else BLACK
+		other_king = squares[0] if color else squares[1]
+		if attacked(other_king, color, pieces, board):
+			flags[index] = ILLEGAL
+			continue
+
+		moves = successors(pieces, turn)
+		next_turn = 'b' if turn == 'w' else 'w'
+		best_win = None
+		for after, exits in moves:
+			if not exits:
+				continue
+			result, plies = result_of(table_value(tables, after, next_turn))
+			if result < 0:
+				best_win = plies + 1 if best_win is None else min(best_win, plies + 1)
+			elif result > 0:
+				loss_exit[index] = max(loss_exit[index], plies + 2)
+			else:
+				flags[index] |= DRAW_EXIT
+		if best_win is not None:
+			flags[index] |= WIN_EXIT
+			rounds.setdefault(best_win, []).append(index)
+		elif not moves:
+			king = squares[1] if color else squares[0]
+			if attacked(king, color ^ BLACK, pieces, board):
+				rounds.setdefault(0, []).append(index)
+			else:
+				flags[index] |= DONE		#Stalemate
+		elif all(exits for after, exits in moves) and not flags[index] & DRAW_EXIT:
+			rounds.setdefault(loss_exit[index] - 1, []).append(index)
+
+	if verbose:
+		print("%s: %d positions, first pass %.1f s" % (name, layout.size, time.perf_counter() - start_time))
+
+	#Positions are found by increasing distance to mate: a position a move away from a loss is a win,
+	#a position whose moves all lead to wins of the other side is a loss. A position is looked at
+	#(DONE) in the round of its distance, an earlier round may have found it shorter
+	plies = 0
+	while rounds:
+		for index in rounds.pop(plies, []):
+			if flags[index] & DONE or (values[index] and values[index] != plies + 1):
+				continue
+			flags[index] |= DONE
+			values[index] = plies + 1
+			squares, turn = layout.position(index)
+			before_turn = 'b' if turn == 'w' else 'w'
+			for before in predecessors(list(zip(codes, squares)), turn):
+				before_index = layout.index([sq for code, sq in before], before_turn)
+				if flags[before_index] & (ILLEGAL | DONE) or values[before_index]:
+					continue
+				if plies % 2 == 0:
+					#The side that moved there wins
+					values[before_index] = plies + 2
+					rounds.setdefault(plies + 1, []).append(before_index)
+				elif not flags[before_index] & (DRAW_EXIT | WIN_EXIT):
+					longest = loss_lines(values, layout, before_index)
+					if longest is not None:
+						rounds.setdefault(max(longest + 1, loss_exit[before_index] - 1), []).append(before_index)
+		plies += 1
+
+	if verbose:
+		print("%s: done in %.1f s, longest mate %d plies" % (name, time.perf_counter() - start_time, max(values) - 1 if any(values) else 0))
+
+	return values
+
+#Longest distance to mate (plies) of the moves of position index that stay in the table (values) if
+#all of them are known wins for the other side, else None
+def loss_lines(values, layout, index):
+	squares, turn = layout.position(index)
+	next_turn = 'b' if turn == 'w' else 'w'
+	longest = 0
+	for after, exits in successors(list(zip(layout.codes, squares)), turn):
+		if exits:
+			continue
+		value = values[layout.index([sq for code, sq in after], next_turn)]
+		if not value or (value - 1) % 2 == 0:
+			return None
+		longest = max(longest, value - 1)
+	return longest
+
+#Material sets needed to build name (reached by captures and promotions), smallest first, name last
+def dependencies(name):
+	needed = []
+	def add(name):
+		if name in trivial_draws:
+			return
+		if not is_canonical(name):
+			name = swapped_name(name)
+		if name in needed:
+			return
+		white, black = split_name(name)
+		for side, other, rebuild in ((white, black, lambda side: side + black), (black, white, lambda side: white + side)):
+			for i, letter in enumerate(side):
+				if letter == 'K':
+					continue
+				#Capture of this piece
+				add(normalize(rebuild(side[:i] + side[i + 1:])))
+				#Promotion of this pawn
+				if letter == 'P':
+					for promotion in 'QRBN':
+						add(normalize(rebuild(side[:i] + promotion + side[i + 1:])))
+		needed.append(name)
+	add(normalize(name))
+	return needed
+
+#Name with the pieces of each side in the usual order
+def normalize(name):
+	white, black = split_name(name)
+	return ''.join(sorted(white, key = piece_letters.index)) + ''.join(sorted(black, key = piece_letters.index))
+
+#Build the tables of names (and those they need) and write them to path. Return {name: table}
+def generate(names, path = DEFAULT_TABLES, verbose = True):
+	order = []
+	for name in names:
+		for needed in dependencies(name.upper()):
+			if needed not in order:
+				order.append(needed)
+
+	tables = dict()
+	for name in order:
+		tables[name] = (table_layout(name), generate_table(name, tables, verbose))
+	write_tables(path, dict((name, table) for name, (layout, table) in tables.items()))
+
+	return tables
+
+def write_tables(path, tables):
+	with open(path, 'wb') as tables_file:
+		tables_file.write(HEADER.pack(MAGIC, len(tables)))
+		offset = HEADER.size + DIRECTORY_ENTRY.size * len(tables)
+		for name, table in tables.items():
+			tables_file.write(DIRECTORY_ENTRY.pack(name.encode(), offset, len(table)))
+			offset += len(table)
+		for table in tables.values():
+			tables_file.write(table)
+
+#True if a pawn of the side to move can take en passant (tables are built without en passant)
+def passant_capture(state):
+	passant_file = (state.flags >> 4) - 1
+	row = 3 if state.turn == 'w' else 4
+	pawn = PAWN | (0 if state.turn == 'w' else BLACK)
+	return any(0 <= x < 8 and state.board[row * 8 + x] == pawn for x in (passant_file - 1, passant_file + 1))
+
+#Tables of a file, read through mmap
+class endgame_tables():
+	def __init__(self, path = DEFAULT_TABLES):
+		self.path = path
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		magic, count = HEADER.unpack_from(self.map, 0)
+		if magic != MAGIC:
+			raise ValueError("Not an endgame tables file: " + path)
+		self.tables = dict()
+		for i in range(count):
+			name, offset, size = DIRECTORY_ENTRY.unpack_from(self.map, HEADER.size + i * DIRECTORY_ENTRY.size)
+			name = name.rstrip(b'\0').decode()
+			self.tables[name] = (table_layout(name), memoryview(self.map)[offset:offset + size])
+		#Most pieces of a position found in the tables
+		self.max_pieces = max([len(name) for name in self.tables] + [2])
+		self.probes = 0
+		self.hits = 0
+
+	#Result of state for the side to move: (result, plies) with result 1 for a win, 0 for a draw, -1 for a loss
+	#and plies to mate; None if state is not in the tables (too many pieces, castling rights or en passant)
+	def probe(self, state):
+		if state.flags & 15 or (state.flags >> 4 and passant_capture(state)):
+			return None
+		pieces = [(code, sq) for sq, code in enumerate(state.board) if code]
+		if len(pieces) > self.max_pieces:
+			return None
+		self.probes += 1
+		value = table_value(self.tables, pieces, state.turn)
+		if value is None:
+			return None
+		self.hits += 1
+		return result_of(value)
+
+	#Best move of state by the tables: the shortest win, else a draw, else the longest loss.
+	#Return (move, result, plies) with the result of state, None if state or a move is not in the tables
+	def best_move(self, state, rules):
+		if self.probe(state) is None:
+			return None
+		best = None
+		for move in rules.legal_moves(state):
+			undo = state.make_move(move)
+			entry = self.probe(state)
+			state.unmake_move(undo)
+			if entry is None:
+				return None
+			result, plies = entry
+			#Rank moves: the other side's loss first (shortest), then draws, then its wins (longest)
+			rank = (result, plies if result < 0 else - plies)
+			if best is None or rank < best[0]:
+				best = (rank, move, - result, plies + 1 if result else 0)
+
+		if best is None:
+			return None
+		return best[1:]
+
+	#Line of best moves from state by the tables, until the game ends or leaves them
+	def line(self, state, rules, max_plies = 256):
+		board = state.copy()
+		moves = []
+		while len(moves) < max_plies:
+			found = self.best_move(board, rules)
+			if found is None:
+				break
+			move, result, plies = found
+			moves.append(move)
+			board.make_move(move)
+			if result == 0:
+				break
+		return moves
+
+	def close(self):
+		for layout, table in self.tables.values():
+			table.release()
+		self.map.close()
+		self.file.close()
+
+#Tables of path, None if there is no such file
+def open_tables(path = DEFAULT_TABLES):
+	try:
+		return endgame_tables(path)
+	except OSError:
+		return None
+
+def main(arguments):
+	import chess_rules
+
+	parser = argparse.ArgumentParser(description = "Build or probe endgame tables")
+	commands = parser.add_subparsers(dest = 'command', required = True)
+	build = commands.add_parser('generate', help = "build tables of material sets (and those they need)")
+	build.add_argument('names', nargs = '+', help = "material sets, ex. KQK KRK KPK KQKR")
+	build.add_argument('--output', default = DEFAULT_TABLES)
+	probe = commands.add_parser('probe', help = "result of a position")
+	probe.add_argument('tables', help = "tables file")
+	probe.add_argument('--fen', required = True)
+	options = parser.parse_args(arguments)
+
+	if options.command == 'generate':
+		tables = generate(options.names, options.output)
+		print("%s written: %s" % (options.output, ', '.join(tables)))
+		return 0
+
+	tables = endgame_tables(options.tables)
+	state = chess_rules.fen_to_state(options.fen)
+	entry = tables.probe(state)
+	if entry is None:
+		print("not in the tables")
+	else:
+		result, plies = entry
+		print(("win" if result > 0 else "loss" if result < 0 else "draw") + (" in %d plies" % plies if result else ""))
+		line = []
+		for move in tables.line(state, chess_rules):
+			line.append(chess_rules.move_to_san(state, move))
+			state.make_move(move)
+		print(' '.join(line))
+	tables.close()
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,164 @@
+#EPD test suites: search each position of an EPD file and check the best move (bm) or avoid move (am) operations
+#
+#Usage:
+#	python3 epd.py suite.epd --nodes 20000
+#	python3 epd.py suite.epd --movetime 1 --workers 4      positions searched in parallel
+#	python3 epd.py suite.epd --nodes 20000 --disable null lmr      compare with search features turned off
+#
+#An EPD line is the first four FEN fields followed by operations, ex.
+#	r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - bm Bb5; id "ruy lopez";
+
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import search_algo as search
+
+#Split an EPD line in (fen, operations); operations maps each opcode to its list of operands.
+#Move counters are taken from hmvc / fmvn operations, or from a full FEN at the start of the line
+def parse_epd(line):
+	fields = line.split(None, 6)
+	if len(fields) < 4:
+		raise ValueError("Invalid EPD: " + line)
+	if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+		counters = fields[4:6]
+		text = fields[6] if len(fields) > 6 else ''
+	else:
+		counters = None
+		text = line.split(None, 4)[4] if len(fields) > 4 else ''
+
+	operations = dict()
+	for operation in text.split(';'):
+		words = operation.split(None, 1)
+		if not words:
+			continue
+		operands = words[1].strip() if len(words) > 1 else ''
+		if operands.startswith('"'):
+			operations[words[0]] = [operands.strip('"')]
+		else:
+			operations[words[0]] = operands.split()
+
+	if counters is None:
+		counters = [operations.get('hmvc', ['0'])[0], operations.get('fmvn', ['1'])[0]]
+	return ' '.join(fields[:4] + counters), operations
+
+#EPD line of state with operations (opcode: list of operands)
+def state_to_epd(state, operations = None):
+	line = ' '.join(search.rules.state_to_fen(state).split()[:4])
+	for opcode, operands in (operations or dict()).items():
+		if opcode == 'id' or any(' ' in operand for operand in operands):
+			line += ' %s "%s";' % (opcode, ' '.join(operands))
+		else:
+			line += ' %s %s;' % (opcode, ' '.join(operands))
+	return line
+
+#Positions of an EPD file, read one at a time: (line number, fen, operations)
+def read_epd(path):
+	with open(path) as epd_file:
+		for number, line in enumerate(epd_file, 1):
+			line = line.strip()
+			if line and not line.startswith('#'):
+				fen, operations = parse_epd(line)
+				yield number, fen, operations
+
+#True if text (SAN) is move at state; an illegal or unreadable text is no move
+def is_move(state, text, move):
+	try:
+		return search.rules.san_to_move(state, text) == move
+	except ValueError:
+		return False
+
+#Search one position and check its bm / am operations. Return (SAN of the move found, solved, nodes, seconds).
+#solved is None if the position has neither bm nor am
+def analyse_position(fen, operations, node_limit = None, move_time = None, max_depth = 64):
+	rules = search.rules
+	state = rules.fen_to_state(fen)
+	search.get_transposition_table().clear()
+	nodes = []
+	start_time = time.perf_counter()
+	move = search.iterative_deepening_move(state, state.turn == 'w', move_time = move_time, node_limit = node_limit, max_depth = max_depth,
+		on_iteration = lambda depth, score, pv, iteration_nodes, seconds: nodes.append(iteration_nodes))
+	elapsed = time.perf_counter() - start_time
+	if move is None:
+		return None, False, sum(nodes[-1:]), elapsed
+
+	found = rules.move_to_san(state, move)
+	solved = None
+	if 'bm' in operations:
+		solved = any(is_move(state, text, move) for text in operations['bm'])
+	if 'am' in operations:
+		solved = (solved is not False) and not any(is_move(state, text, move) for text in operations['am'])
+
+	return found, solved, sum(nodes[-1:]), elapsed
+
+def init_worker(disabled):
+	search.disable_features(disabled)
+	search.REPORT_STATS = False
+
+#Analyse positions of (number, fen, operations) with the given budget, workers processes at a time.
+#Results are printed as they come. Return (positions, solved, positions with bm or am, seconds).
+#Workers search with the features of disabled turned off (see search_algo.FEATURES)
+def run_suite(positions, node_limit = None, move_time = None, max_depth = 64, workers = 1, disabled = ()):
+	total = solved_count = checked = total_nodes = 0
+	start_time = time.perf_counter()
+
+	def report(number, operations, result):
+		nonlocal total, solved_count, checked, total_nodes
+		found, solved, nodes, elapsed = result
+		total += 1
+		total_nodes += nodes
+		if solved is not None:
+			checked += 1
+			solved_count += solved
+		if 'bm' in operations:
+			expected = ' '.join(['bm'] + operations['bm'])
+		elif 'am' in operations:
+			expected = ' '.join(['am'] + operations['am'])
+		else:
+			expected = '-'
+
+		name = operations.get('id', ['line %d' % number])[0]
+		result_text = '-' if solved is None else ('ok' if solved else 'FAILED')
+		print("%-24s %-16s found %-8s %-6s %8d nodes %6.2f s" % (name, expected, found, result_text, nodes, elapsed))
+
+	if workers <= 1:
+		for number, fen, operations in positions:
+			report(number, operations, analyse_position(fen, operations, node_limit, move_time, max_depth))
+	else:
+		#A few positions per worker in flight, so the file is read as the work goes
+		with ProcessPoolExecutor(max_workers = workers, initializer = init_worker, initargs = (tuple(disabled),)) as executor:
+			running = dict()
+			for number, fen, operations in positions:
+				running[executor.submit(analyse_position, fen, operations, node_limit, move_time, max_depth)] = (number, operations)
+				if len(running) >= 2 * workers:
+					done, __ = wait(running, return_when = FIRST_COMPLETED)
+					for future in done:
+						report(*running.pop(future), future.result())
+			for future in list(running):
+				report(*running.pop(future), future.result())
+
+	elapsed = time.perf_counter() - start_time
+	print("solved %d/%d, %d positions in %.2f s, %.2f positions/s, %d nodes" % (solved_count, checked, total, elapsed, total / max(elapsed, 1e-9), total_nodes))
+
+	return total, solved_count, checked, elapsed
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "Search the positions of an EPD file and check their bm / am moves")
+	parser.add_argument('path', help = "EPD file")
+	parser.add_argument('--nodes', type = int, help = "node budget per position")
+	parser.add_argument('--movetime', type = float, help = "seconds per position")
+	parser.add_argument('--depth', type = int, default = 64, help = "maximum depth")
+	parser.add_argument('--workers', type = int, default = 1, help = "positions searched in parallel")
+	parser.add_argument('--disable', nargs = '+', default = [], choices = sorted(search.FEATURES), help = "search features to turn off")
+	options = parser.parse_args(arguments)
+	if options.nodes is None and options.movetime is None and options.depth == 64:
+		parser.error("give a budget: --nodes, --movetime or --depth")
+
+	search.disable_features(options.disable)
+	search.REPORT_STATS = False
+	total, solved, checked, elapsed = run_suite(read_epd(options.path), options.nodes, options.movetime, options.depth, options.workers, options.disable)
+
+	return 0 if solved == checked else 1
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
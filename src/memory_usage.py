@@ -0,0 +1,73 @@
+#Peak memory of a fixed depth search
+#
+#Usage:
+#	python3 memory_usage.py --depth 4                     start position
+#	python3 memory_usage.py --position kiwipete --depth 3 --trace
+#
+#Peak resident memory (ru_maxrss) is the peak of the whole process, measured before and after the search.
+#--trace also measures the peak of python allocations made during the search with tracemalloc (slower)
+
+import sys
+import time
+import argparse
+import tracemalloc
+import search_algo
+from perft import reference_positions
+
+try:
+	import resource
+except ImportError:	#Not available on Windows
+	resource = None
+
+#Peak resident memory of the process, in bytes (None if unknown)
+def peak_resident_memory():
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin':	#Bytes on macOS, kilobytes elsewhere
+		return peak
+	return peak * 1024
+
+#Search fen at depth. Return (peak resident memory before, after, traced peak or None, nodes, seconds)
+def measure_search(rules, fen, depth, trace = False):
+	state = rules.fen_to_state(fen)
+	search_algo.get_transposition_table()	#Allocate the table before measuring
+	rss_before = peak_resident_memory()
+	if trace:
+		tracemalloc.start()
+
+	start_time = time.perf_counter()
+	context = search_algo.search_context(state)
+	context.minimax(state.turn == 'w', depth, float('-inf'), float('inf'), root = True)
+	elapsed = time.perf_counter() - start_time
+
+	traced_peak = None
+	if trace:
+		traced_peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+	return rss_before, peak_resident_memory(), traced_peak, context.nodes, elapsed
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "Measure peak memory of a fixed depth search")
+	parser.add_argument('--fen', help = "position to search")
+	parser.add_argument('--position', default = 'start', choices = sorted(reference_positions), help = "reference position to search")
+	parser.add_argument('--depth', type = int, default = 3)
+	parser.add_argument('--trace', action = 'store_true', help = "also trace python allocations of the search")
+	options = parser.parse_args(arguments)
+
+	rules = search_algo.rules
+	search_algo.REPORT_STATS = False
+	fen = options.fen or reference_positions[options.position][0]
+	rss_before, rss_after, traced_peak, nodes, elapsed = measure_search(rules, fen, options.depth, options.trace)
+
+	print("depth %d: %d nodes %.2f s" % (options.depth, nodes, elapsed))
+	if rss_after is not None:
+		print("peak resident memory: %.1f MB (%.1f MB before the search)" % (rss_after / 2**20, rss_before / 2**20))
+	if traced_peak is not None:
+		print("peak traced allocations during the search: %.1f KB" % (traced_peak / 2**10))
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+#Opening book in the Polyglot .bin format, and a tool to build one from PGN games
+#
+#A book is a file of 16 byte big endian entries sorted by key: key (8 bytes, zobrist key of the
+#position with the Polyglot Random64 numbers), move (2), weight (2) and learn (4, unused here).
+#The file is memory mapped and searched by key, so it's never read as a whole.
+#
+#Usage:
+#	python3 opening_book.py build games.pgn more_games.pgn --output book.bin --plies 16
+#	python3 opening_book.py probe book.bin                        book moves of the start position
+#	python3 opening_book.py probe book.bin --fen "<fen>"
+
+import sys
+import mmap
+import random
+import struct
+import argparse
+import chess_rules
+from chess_rules import PAWN, KING, BLACK, square_of
+from polyglot_random import RANDOM64
+
+ENTRY = struct.Struct('>QHHI')
+
+#Book file used by the engine when there is none given (see badchess.py and uci.py)
+DEFAULT_BOOK = 'book.bin'
+
+#Castling rights bits of state.flags in the order of the Random64 castling numbers
+castling_bits = (chess_rules.special_dict['w0-0'], chess_rules.special_dict['w0-0-0'], chess_rules.special_dict['b0-0'], chess_rules.special_dict['b0-0-0'])
+
+promotion_codes = (None, 'N', 'B', 'R', 'Q')
+
+#Polyglot key of state: pieces, castling rights, en passant file (only if a pawn can take there) and turn
+def polyglot_key(state):
+	board = state.board
+	key = 0
+	for sq in range(64):
+		code = board[sq]
+		if code:
+			kind = 2 * ((code & 7) - 1) + (0 if code & BLACK else 1)
+			key ^= RANDOM64[64 * kind + 8 * (7 - sq // 8) + sq % 8]
+
+	for i, bit in enumerate(castling_bits):
+		if state.flags & (1 << bit):
+			key ^= RANDOM64[768 + i]
+
+	passant_file = (state.flags >> 4) - 1
+	if passant_file >= 0:
+		#Pawns of the side to move stand next to the pawn that just moved two squares
+		row = 3 if state.turn == 'w' else 4
+		pawn = PAWN | (0 if state.turn == 'w' else BLACK)
+		if any(0 <= x < 8 and board[row * 8 + x] == pawn for x in (passant_file - 1, passant_file + 1)):
+			key ^= RANDOM64[772 + passant_file]
+
+	if state.turn == 'w':
+		key ^= RANDOM64[780]
+
+	return key
+
+#Move (start, target, promotion_piece) of a Polyglot move at state, castling is written king takes rook
+def decode_book_move(state, raw):
+	target = (raw & 7, 7 - ((raw >> 3) & 7))
+	start = ((raw >> 6) & 7, 7 - ((raw >> 9) & 7))
+	promotion_piece = promotion_codes[(raw >> 12) & 7]
+	if state.board[square_of(start)] & 7 == KING and start[0] == 4 and target[1] == start[1] and target[0] in (0, 7):
+		target = (6 if target[0] == 7 else 2, target[1])
+
+	return (start, target, promotion_piece)
+
+def encode_book_move(state, move):
+	start, target, promotion_piece = move
+	if state.board[square_of(start)] & 7 == KING and abs(target[0] - start[0]) == 2:
+		target = (7 if target[0] == 6 else 0, target[1])
+
+	return target[0] | (7 - target[1]) << 3 | start[0] << 6 | (7 - start[1]) << 9 | promotion_codes.index(promotion_piece) << 12
+
+class opening_book():
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, 'rb')
+		size = self.file.seek(0, 2)
+		self.entries = size // ENTRY.size
+		#An empty file can't be mapped
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) if self.entries else b''
+
+	def key_at(self, index):
+		return struct.unpack_from('>Q', self.map, index * ENTRY.size)[0]
+
+	#Book moves of state with their weights: list of (move, weight), legal moves only
+	def moves(self, state):
+		key = polyglot_key(state)
+
+		#Binary search of the first entry with key
+		low, high = 0, self.entries
+		while low < high:
+			middle = (low + high) // 2
+			if self.key_at(middle) < key:
+				low = middle + 1
+			else:
+				high = middle
+
+		legal = chess_rules.legal_moves(state)
+		found = []
+		for index in range(low, self.entries):
+			entry_key, raw, weight, learn = ENTRY.unpack_from(self.map, index * ENTRY.size)
+			if entry_key != key:
+				break
+			move = decode_book_move(state, raw)
+			if move in legal:
+				found.append((move, weight))
+
+		return found
+
+	#Book move of state picked at random in proportion to the weights (the best one if best is True),
+	#None if the position is not in the book
+	def pick(self, state, best = False):
+		found = [(move, weight) for move, weight in self.moves(state) if weight]
+		if not found:
+			return None
+		if best:
+			return max(found, key = lambda entry: entry[1])[0]
+		return random.choices([move for move, weight in found], [weight for move, weight in found])[0]
+
+	def close(self):
+		if self.entries:
+			self.map.close()
+		self.file.close()
+
+#Book of path, None if there is no such file
+def open_book(path = DEFAULT_BOOK):
+	try:
+		return opening_book(path)
+	except OSError:
+		return None
+
+#Games of a PGN file, read one at a time: (tags, list of SAN moves); comments, variations and
+#numeric annotations are left out
+def read_pgn(path):
+	with open(path, encoding = 'utf-8', errors = 'replace') as pgn_file:
+		tags = dict()
+		movetext = []
+		for line in pgn_file:
+			line = line.strip()
+			if line.startswith('['):
+				if movetext:
+					yield tags, pgn_moves(' '.join(movetext))
+					tags, movetext = dict(), []
+				name, __, value = line[1:-1].partition(' ')
+				tags[name] = value.strip().strip('"')
+			elif line and not line.startswith('%'):
+				movetext.append(line)
+		if movetext:
+			yield tags, pgn_moves(' '.join(movetext))
+
+#SAN moves of the main line of a PGN movetext
+def pgn_moves(text):
+	moves = []
+	depth = 0
+	comment = False
+	for token in text.replace('(', ' ( ').replace(')', ' ) ').replace('{', ' { ').replace('}', ' } ').split():
+		if comment:
+			comment = token != '}'
+		elif token == '{':
+			comment = True
+		elif token == '(':
+			depth += 1
+		elif token == ')':
+			depth -= 1
+		elif depth == 0 and not token.startswith('$') and token not in ('1-0', '0-1', '1/2-1/2', '*'):
+			token = token.split('.')[-1]		#Move number glued to the move, ex. 1.e4
+			if token:
+				moves.append(token)
+
+	return moves
+
+#Build a book of the first plies moves of the games of the PGN files at pgn_paths, written to output_path.
+#Each move played weighs 2 for a win of its side, 1 for a draw and 0 for a loss (unfinished games weigh 1);
+#moves played less than min_count times are left out. Return (games, entries)
+def build_book(pgn_paths, output_path, plies = 16, min_count = 1):
+	counts = dict()
+	weights = dict()
+	games = 0
+	for path in pgn_paths:
+		for tags, moves in read_pgn(path):
+			games += 1
+			result = tags.get('Result', '*')
+			state = chess_rules.fen_to_state(tags['FEN']) if 'FEN' in tags else chess_rules.start_board_position()
+			for text in moves[:plies]:
+				try:
+					move = chess_rules.san_to_move(state, text)
+				except ValueError:
+					break
+				entry = (polyglot_key(state), encode_book_move(state, move))
+				if result == '1/2-1/2' or result == '*':
+					score = 1
+				else:
+					score = 2 if (result == '1-0') == (state.turn == 'w') else 0
+				counts[entry] = counts.get(entry, 0) + 1
+				weights[entry] = weights.get(entry, 0) + score
+				state.make_move(move)
+
+	entries = sorted((key, raw) for key, raw in counts if counts[key, raw] >= min_count)
+	top = max([weights[entry] for entry in entries] + [1])
+	with open(output_path, 'wb') as book_file:
+		for key, raw in entries:
+			#Weights fit in 16 bits, a move played at all keeps at least weight 1
+			weight = max(1, weights[key, raw] * 65535 // top) if top > 65535 else max(1, weights[key, raw])
+			book_file.write(ENTRY.pack(key, raw, weight, 0))
+
+	return games, len(entries)
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "Build or probe a Polyglot opening book")
+	commands = parser.add_subparsers(dest = 'command', required = True)
+	build = commands.add_parser('build', help = "build a book from PGN files")
+	build.add_argument('pgn', nargs = '+', help = "PGN files")
+	build.add_argument('--output', default = DEFAULT_BOOK)
+	build.add_argument('--plies', type = int, default = 16, help = "moves kept from the start of each game")
+	build.add_argument('--min-count', type = int, default = 1, help = "times a move must be played to be kept")
+	probe = commands.add_parser('probe', help = "book moves of a position")
+	probe.add_argument('book', help = "book file")
+	probe.add_argument('--fen', help = "position, start position if not given")
+	options = parser.parse_args(arguments)
+
+	if options.command == 'build':
+		games, entries = build_book(options.pgn, options.output, options.plies, options.min_count)
+		print("%d games, %d entries written to %s" % (games, entries, options.output))
+		return 0
+
+	book = opening_book(options.book)
+	state = chess_rules.fen_to_state(options.fen) if options.fen else chess_rules.start_board_position()
+	print("key %016x, %d entries in book" % (polyglot_key(state), book.entries))
+	for move, weight in sorted(book.moves(state), key = lambda entry: entry[1], reverse = True):
+		print("%-8s %5d" % (chess_rules.move_to_san(state, move), weight))
+	book.close()
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
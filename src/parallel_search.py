@@ -0,0 +1,296 @@
+#Parallel search: several worker processes search the same position, sharing a transposition table
+#
+#Root split (parallel_search): the first root move is searched alone (young brothers wait), then the
+#other root moves are searched in parallel. Each worker starts from the best root score found so far
+#(shared between processes), so moves searched later get cut off sooner.
+#Lazy SMP (lazy_smp_search): every worker searches the whole tree, helpers starting from different
+#root moves (and odd helpers one ply deeper); they help the main worker through the shared table.
+#
+#The pool and its shared transposition table are created once and reused by later searches.
+#
+#Usage:
+#	python3 parallel_search.py --depth 4                  speedup curve for 1, 2, 4 and 8 workers
+#	python3 parallel_search.py --depth 3 --workers 1 2 --mode smp
+
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import search_algo as search
+import transposition as tt
+
+#Set in each worker by init_worker: best root score so far and stop flag, shared by the workers of the pool
+shared_bound = None
+stop_flag = None
+
+def init_worker(bound, stop, table):
+	global shared_bound, stop_flag
+	shared_bound = bound
+	stop_flag = stop
+	search.REPORT_STATS = False
+	search.TT_SIZE_MB = table.size_mb
+	search.transposition_table = table
+
+#Search stopped when the time is out or when another worker raised the stop flag
+class worker_context(search.search_context):
+	def check_limits(self):
+		if stop_flag.value:
+			raise search.search_timeout()
+		search.search_context.check_limits(self)
+
+	#Window of the task's root move node (ply 1): the best root score so far, which may have improved
+	#since the task started. bound keeps the tightest one read
+	def shared_window(self):
+		if self.root_maximizing:
+			self.bound = max(self.bound, shared_bound.value)
+			return self.bound, float('inf')
+		self.bound = min(self.bound, shared_bound.value)
+		return float('-inf'), self.bound
+
+#Counts of a worker task: (nodes, probes, hits, stores, collisions)
+def task_stats(context):
+	table = context.table
+	return (context.nodes, table.probes, table.hits, table.stores, table.collisions)
+
+#Worker task: search root move at depth from state, with the best root score so far as bound, read again
+#between the moves after it (with share_bound, else an open window). Return (value, window_bound, stats),
+#window_bound being the last bound used; value is None if the search was stopped
+def search_root_move(state, move, maximizing_player, depth, deadline = None, share_bound = True):
+	if share_bound:
+		bound = shared_bound.value
+	else:
+		bound = float('-inf') if maximizing_player else float('inf')
+	if maximizing_player:
+		alpha, beta = bound, float('inf')
+	else:
+		alpha, beta = float('-inf'), bound
+
+	state.make_move(move)
+	context = worker_context(state, deadline)
+	context.table.reset_stats()
+	if share_bound:
+		context.shared_window_ply = 1
+	context.root_maximizing, context.bound = maximizing_player, bound
+	try:
+		value, __ = context.minimax(not maximizing_player, depth - 1, alpha, beta, ply = 1)
+	except search.search_timeout:
+		return None, context.bound, task_stats(context)
+	bound = context.bound
+
+	with shared_bound.get_lock():
+		if (maximizing_player and value > shared_bound.value) or (not maximizing_player and value < shared_bound.value):
+			shared_bound.value = value
+
+	return value, bound, task_stats(context)
+
+#Worker task of lazy SMP: iterative deepening up to depth, one more ply for odd helpers.
+#Helpers (helper > 0) start each iteration from a different root move.
+#Return (value, best_move, stats) of the last finished iteration, value is None if none finished
+def lazy_smp_task(state, maximizing_player, depth, helper, deadline = None):
+	context = worker_context(state, deadline)
+	context.table.reset_stats()
+	moves = root_moves(state)
+	value, best_move = None, None
+	for iteration_depth in range(1, depth + 1 + helper % 2):
+		if helper and moves:
+			context.root_best_move = moves[helper % len(moves)]
+		try:
+			value, best_move = context.minimax(maximizing_player, iteration_depth, float('-inf'), float('inf'), root = True)
+		except search.search_timeout:
+			break
+
+	return value, best_move, task_stats(context)
+
+#Pool reused by successive searches, rebuilt only if the number of workers or the table size changes
+pool = None
+pool_bound = None
+pool_stop = None
+pool_settings = None
+shared_table = None
+
+def get_pool(workers):
+	global pool, pool_bound, pool_stop, pool_settings, shared_table
+	if shared_table is None or shared_table.size_mb != search.TT_SIZE_MB:
+		close_pool()
+		shared_table = tt.shared_transposition_table(search.TT_SIZE_MB)
+	if pool is None or pool_settings != workers:
+		close_pool()
+		pool_bound = multiprocessing.Value('d', 0.0)
+		pool_stop = multiprocessing.RawValue('b', 0)
+		pool = ProcessPoolExecutor(max_workers = workers, initializer = init_worker, initargs = (pool_bound, pool_stop, shared_table))
+		pool_settings = workers
+	return pool
+
+def close_pool():
+	global pool, pool_settings
+	if pool is not None:
+		pool.shutdown()
+	pool = None
+	pool_settings = None
+
+#Close the pool and free the shared table
+def close_all():
+	global shared_table
+	close_pool()
+	if shared_table is not None:
+		shared_table.close()
+	shared_table = None
+
+#Stop the searches running in the pool (called from another thread), they return what they found so far
+def request_stop():
+	if pool_stop is not None:
+		pool_stop.value = 1
+
+#Sum of worker task counts of the last search: (nodes, probes, hits, stores, collisions)
+last_search_stats = (0, 0, 0, 0, 0)
+
+def add_stats(total, stats):
+	return tuple(a + b for a, b in zip(total, stats))
+
+#Legal root moves, first_move (if legal) first, then in staged order
+def root_moves(state, first_move = None):
+	board = state.copy()
+	moves = []
+	for move in search.rules.staged_moves(board, first_move):
+		undo = search.rules.make_legal_move(board, move)
+		if undo is not None:
+			board.unmake_move(undo)
+			moves.append(move)
+	return moves
+
+#Search state at depth with workers processes, splitting root moves. Return (value, best_move, nodes, finished);
+#best_move is None if there is no legal move. If the deadline is reached, finished is False and
+#the best move among the root moves searched completely is returned (None if the first one wasn't).
+#share_bound False searches every root move with an open window, to measure what the shared bound saves
+def parallel_search(state, maximizing_player, depth, workers = 4, first_move = None, deadline = None, share_bound = True):
+	global last_search_stats
+	moves = root_moves(state, first_move)
+	if not moves:
+		context = search.search_context(state)
+		value, __ = context.minimax(maximizing_player, 1, float('-inf'), float('inf'), root = True)
+		return value, None, context.nodes, True
+
+	executor = get_pool(workers)
+	pool_bound.value = float('-inf') if maximizing_player else float('inf')
+
+	#Young brothers wait: the first move gives the bound for the others
+	value, bound, stats = executor.submit(search_root_move, state, moves[0], maximizing_player, depth, deadline, share_bound).result()
+	last_search_stats = stats
+	if value is None:
+		return None, None, stats[0], False
+	best_value, best_move = value, moves[0]
+
+	finished = True
+	running = dict()
+	for move in moves[1:]:
+		running[executor.submit(search_root_move, state, move, maximizing_player, depth, deadline, share_bound)] = move
+	while running:
+		done, __ = wait(running, return_when = FIRST_COMPLETED)
+		for future in done:
+			move = running.pop(future)
+			value, bound, stats = future.result()
+			last_search_stats = add_stats(last_search_stats, stats)
+			if value is None:
+				finished = False
+				continue
+
+			#A score equal to the bound only says the move is not better
+			if (maximizing_player and value > bound and value > best_value) or (not maximizing_player and value < bound and value < best_value):
+				best_value, best_move = value, move
+
+	return best_value, best_move, last_search_stats[0], finished
+
+#Search state at depth with workers processes, lazy SMP. Same results as parallel_search,
+#the move is the one of the main worker; helpers are stopped when it's done
+def lazy_smp_search(state, maximizing_player, depth, workers = 4, deadline = None):
+	global last_search_stats
+	executor = get_pool(workers)
+	pool_stop.value = 0
+	futures = [executor.submit(lazy_smp_task, state, maximizing_player, depth, helper, deadline) for helper in range(workers)]
+	value, best_move, stats = futures[0].result()
+	pool_stop.value = 1
+	last_search_stats = stats
+	for future in futures[1:]:
+		last_search_stats = add_stats(last_search_stats, future.result()[2])
+	pool_stop.value = 0
+
+	if value is None:
+		return None, None, last_search_stats[0], False
+	return value, best_move, last_search_stats[0], True
+
+#Fixed depth parallel search. Return best child state
+def parallel_minimax_algo(state, maximizing_player, depth = 5, workers = 4):
+	get_pool(workers)
+	pool_stop.value = 0
+	value, best_move, nodes, finished = parallel_search(state, maximizing_player, depth, workers)
+	return search.best_child(state, best_move)
+
+#Parallel iterative deepening with a time budget (seconds, None for no limit), until request_stop
+#is called. Return best move, None if there is no move
+def parallel_iterative_deepening_move(state, maximizing_player, move_time, workers = 4, max_depth = 64):
+	start_time = time.perf_counter()
+	deadline = start_time + move_time if move_time else None
+	get_pool(workers)
+	pool_stop.value = 0
+	best_move = None
+	for depth in range(1, max_depth + 1):
+		value, move, nodes, finished = parallel_search(state, maximizing_player, depth, workers, best_move, deadline)
+		if move is not None:
+			best_move = move
+		elapsed = time.perf_counter() - start_time
+		if not finished:
+			break
+		if search.REPORT_STATS:
+			print("depth %d score %.2f nodes %d time %.2f s" % (depth, value, nodes, elapsed))
+		if best_move is None or abs(value) >= search.MATE_BOUND or (move_time and elapsed > move_time / 2):
+			break
+
+	return best_move
+
+#Time a fixed depth search of each position with each number of workers and print the speedup
+#over the first number of workers, and the shared table statistics. Return {workers: seconds}.
+#Only a machine with at least as many cpus as workers measures a speedup
+def speedup_curve(fens, depth, worker_counts = (1, 2, 4, 8), mode = 'split'):
+	times = dict()
+	for workers in worker_counts:
+		get_pool(workers)	#Start the workers before timing
+		pool_stop.value = 0
+		shared_table.clear()
+		total = (0, 0, 0, 0, 0)
+		start_time = time.perf_counter()
+		for fen in fens:
+			state = search.rules.fen_to_state(fen)
+			if mode == 'smp':
+				lazy_smp_search(state, state.turn == 'w', depth, workers)
+			else:
+				parallel_search(state, state.turn == 'w', depth, workers)
+			total = add_stats(total, last_search_stats)
+		times[workers] = time.perf_counter() - start_time
+		nodes, probes, hits, stores, collisions = total
+		print("%d workers: %8d nodes %7.2f s %9.0f nodes/s speedup %.2f, TT hits %.1f%% collisions %.1f%% full %.1f%%" % (workers, nodes, times[workers], nodes / times[workers],
+			times[worker_counts[0]] / times[workers], 100 * hits / max(probes, 1), 100 * collisions / max(stores, 1), 100 * shared_table.fill_rate()))
+	close_all()
+
+	return times
+
+def main(arguments):
+	from perft import reference_positions
+
+	parser = argparse.ArgumentParser(description = "Speedup of the parallel search with the number of workers")
+	parser.add_argument('--depth', type = int, default = 4)
+	parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4, 8])
+	parser.add_argument('--mode', default = 'split', choices = ('split', 'smp'), help = "root split or lazy SMP")
+	options = parser.parse_args(arguments)
+
+	search.REPORT_STATS = False
+	cpus = multiprocessing.cpu_count()
+	print("%d cpus" % cpus)
+	if cpus < max(options.workers):
+		print("more workers than cpus: times only show the overhead of the extra workers, not a speedup")
+	speedup_curve([fen for fen, counts in reference_positions.values()], options.depth, tuple(options.workers), options.mode)
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,107 @@
+#Perft: count leaf nodes of the legal move tree, to check move generation and measure its speed
+#
+#Usage:
+#	python3 perft.py                          check all reference positions against known counts
+#	python3 perft.py --fen FEN --depth 3       count one position
+#	python3 perft.py --position kiwipete --depth 2 --divide
+
+import sys
+import time
+import argparse
+import search_algo
+
+#Reference positions with their known node counts at depth 1, 2, 3, ...
+reference_positions = dict()
+reference_positions['start'] = ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', (20, 400, 8902, 197281, 4865609))
+reference_positions['kiwipete'] = ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', (48, 2039, 97862, 4085603))
+reference_positions['position3'] = ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', (14, 191, 2812, 43238, 674624))
+reference_positions['position4'] = ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', (6, 264, 9467, 422333))
+reference_positions['position5'] = ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', (44, 1486, 62379, 2103487))
+
+#Number of leaf nodes at depth plies from state
+def perft(rules, state, depth):
+	if depth == 0:
+		return 1
+	nodes = 0
+	for move in rules.pseudo_legal_moves(state):
+		undo = rules.make_legal_move(state, move)
+		if undo is None:
+			continue
+		if depth == 1:
+			nodes += 1
+		else:
+			nodes += perft(rules, state, depth - 1)
+		state.unmake_move(undo)
+
+	return nodes
+
+#Perft split by root move: list of (move, nodes)
+def divide(rules, state, depth):
+	results = []
+	for move in rules.legal_moves(state):
+		undo = state.make_move(move)
+		results.append((move, perft(rules, state, depth - 1)))
+		state.unmake_move(undo)
+
+	return results
+
+#Run perft on fen and print nodes and nodes/second. Return node count
+def run_perft(rules, fen, depth, show_divide = False):
+	state = rules.fen_to_state(fen)
+	start_time = time.perf_counter()
+	if show_divide:
+		nodes = 0
+		for move, move_nodes in divide(rules, state, depth):
+			print("%s: %d" % (rules.move_to_uci(move), move_nodes))
+			nodes += move_nodes
+	else:
+		nodes = perft(rules, state, depth)
+	elapsed = time.perf_counter() - start_time
+	print("depth %d: %d nodes %.2f s %.0f nodes/s" % (depth, nodes, elapsed, nodes / max(elapsed, 1e-9)))
+
+	return nodes
+
+#Check every reference position up to the deepest depth with at most max_nodes nodes.
+#Return True if all counts match
+def check_reference_positions(rules, max_nodes = 100000):
+	all_passed = True
+	total_nodes = 0
+	start_time = time.perf_counter()
+	for name, (fen, counts) in reference_positions.items():
+		state = rules.fen_to_state(fen)
+		for depth in range(1, len(counts) + 1):
+			expected = counts[depth - 1]
+			if expected > max_nodes:
+				break
+			nodes = perft(rules, state, depth)
+			total_nodes += nodes
+			result = 'ok' if nodes == expected else 'FAILED, expected %d' % expected
+			if nodes != expected:
+				all_passed = False
+			print("%-10s depth %d: %8d nodes %s" % (name, depth, nodes, result))
+	elapsed = time.perf_counter() - start_time
+	print("%d nodes %.2f s %.0f nodes/s" % (total_nodes, elapsed, total_nodes / max(elapsed, 1e-9)))
+
+	return all_passed
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "Count leaf nodes of the legal move tree")
+	parser.add_argument('--fen', help = "position to count")
+	parser.add_argument('--position', choices = sorted(reference_positions), help = "reference position to count")
+	parser.add_argument('--depth', type = int, default = 3)
+	parser.add_argument('--divide', action = 'store_true', help = "print node count of each root move")
+	parser.add_argument('--max-nodes', type = int, default = 100000, help = "deepest reference check with at most this many nodes")
+	options = parser.parse_args(arguments)
+
+	rules = search_algo.rules
+	if options.fen or options.position:
+		fen = options.fen or reference_positions[options.position][0]
+		run_perft(rules, fen, options.depth, options.divide)
+		return 0
+
+	if check_reference_positions(rules, options.max_nodes):
+		return 0
+	return 1
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+#Piece values and piece-square tables used by the evaluation
+#
+#Tables are written from white's point of view with the a8 square first, so the entry of
+#internal coordinate (x, y) is table[y * 8 + x]; black pieces use the mirrored row (7 - y).
+#Values are in centipawns so the running totals kept by state_board stay exact
+
+piece_value = dict()
+piece_value['wp'] = 1.0
+piece_value['bp'] = -1.0
+piece_value['wN'] = 3.0
+piece_value['bN'] = -3.0
+piece_value['wB'] = 3.1
+piece_value['bB'] = -3.1
+piece_value['wR'] = 5.0
+piece_value['bR'] = -5.0
+piece_value['wQ'] = 9.0
+piece_value['bQ'] = -9.0
+piece_value['wK'] = 0.0
+piece_value['bK'] = 0.0
+piece_value['']   = 0.0
+
+pawn_table = (
+	  0,   0,   0,   0,   0,   0,   0,   0,
+	 50,  50,  50,  50,  50,  50,  50,  50,
+	 10,  10,  20,  30,  30,  20,  10,  10,
+	  5,   5,  10,  25,  25,  10,   5,   5,
+	  0,   0,   0,  20,  20,   0,   0,   0,
+	  5,  -5, -10,   0,   0, -10,  -5,   5,
+	  5,  10,  10, -20, -20,  10,  10,   5,
+	  0,   0,   0,   0,   0,   0,   0,   0)
+
+knight_table = (
+	-50, -40, -30, -30, -30, -30, -40, -50,
+	-40, -20,   0,   0,   0,   0, -20, -40,
+	-30,   0,  10,  15,  15,  10,   0, -30,
+	-30,   5,  15,  20,  20,  15,   5, -30,
+	-30,   0,  15,  20,  20,  15,   0, -30,
+	-30,   5,  10,  15,  15,  10,   5, -30,
+	-40, -20,   0,   5,   5,   0, -20, -40,
+	-50, -40, -30, -30, -30, -30, -40, -50)
+
+bishop_table = (
+	-20, -10, -10, -10, -10, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,  10,  10,   5,   0, -10,
+	-10,   5,   5,  10,  10,   5,   5, -10,
+	-10,   0,  10,  10,  10,  10,   0, -10,
+	-10,  10,  10,  10,  10,  10,  10, -10,
+	-10,   5,   0,   0,   0,   0,   5, -10,
+	-20, -10, -10, -10, -10, -10, -10, -20)
+
+rook_table = (
+	  0,   0,   0,   0,   0,   0,   0,   0,
+	  5,  10,  10,  10,  10,  10,  10,   5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	  0,   0,   0,   5,   5,   0,   0,   0)
+
+queen_table = (
+	-20, -10, -10,  -5,  -5, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,   5,   5,   5,   0, -10,
+	 -5,   0,   5,   5,   5,   5,   0,  -5,
+	  0,   0,   5,   5,   5,   5,   0,  -5,
+	-10,   5,   5,   5,   5,   5,   0, -10,
+	-10,   0,   5,   0,   0,   0,   0, -10,
+	-20, -10, -10,  -5,  -5, -10, -10, -20)
+
+#King hides in the middle game and walks to the center in the end game
+king_middle_table = (
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-20, -30, -30, -40, -40, -30, -30, -20,
+	-10, -20, -20, -20, -20, -20, -20, -10,
+	 20,  20,   0,   0,   0,   0,  20,  20,
+	 20,  30,  10,   0,   0,  10,  30,  20)
+
+king_end_table = (
+	-50, -40, -30, -20, -20, -30, -40, -50,
+	-30, -20, -10,   0,   0, -10, -20, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -30,   0,   0,   0,   0, -30, -30,
+	-50, -30, -30, -30, -30, -30, -30, -50)
+
+middle_tables = {'p': pawn_table, 'N': knight_table, 'B': bishop_table, 'R': rook_table, 'Q': queen_table, 'K': king_middle_table}
+end_tables = {'p': pawn_table, 'N': knight_table, 'B': bishop_table, 'R': rook_table, 'Q': queen_table, 'K': king_end_table}
+
+#Game phase: 24 with all pieces on the board, 0 with only kings and pawns
+phase_weight = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+#piece_terms[piece][sq]: (material, middle game, end game, phase) added by piece on square index sq
+piece_terms = dict()
+for __piece in piece_value:
+	if not __piece:
+		continue
+	__color, __kind = __piece
+	piece_terms[__piece] = []
+	for __sq in range(64):
+		__x, __y = __sq % 8, __sq // 8
+		__index = __sq if __color == 'w' else (7 - __y) * 8 + __x
+		piece_terms[__piece].append((int(round(abs(piece_value[__piece]) * 100)), middle_tables[__kind][__index], end_tables[__kind][__index], phase_weight[__kind]))
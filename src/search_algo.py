@@ -1,23 +1,34 @@
-import numpy as np
+import time
 import chess_rules as rules
+import transposition as tt
+import endgame_tables
+import search_stats
+from piece_tables import piece_value, MAX_PHASE
 
-piece_value = dict()
-piece_value['wp'] = 1.0
-piece_value['bp'] = -1.0
-piece_value['wN'] = 3.0
-piece_value['bN'] = -3.0
-piece_value['wB'] = 3.1
-piece_value['bB'] = -3.1
-piece_value['wR'] = 5.0
-piece_value['bR'] = -5.0
-piece_value['wQ'] = 9.0
-piece_value['bQ'] = -9.0
-piece_value['wK'] = 0.0
-piece_value['bK'] = 0.0
-piece_value['']   = 0.0
+#Recompute evaluation terms from scratch at each evaluation and check the running ones
+EVAL_DEBUG = False
+
+def check_evaluation_terms(state):
+	material, middle_game, end_game, phase = rules.evaluation_terms(state)
+	assert material == state.material, (material, state.material)
+	assert middle_game == state.middle_game, (middle_game, state.middle_game)
+	assert end_game == state.end_game, (end_game, state.end_game)
+	assert phase == state.phase, (phase, state.phase)
+
+#Material balance in pawns, white positive
+def material_balance(state):
+	return (state.material['w'] - state.material['b']) / 100
+
+#Piece-square balance in pawns, white positive, tapered between middle and end game by phase.
+#The state carries it, but it is not part of the evaluation: evaluator scores material and scope only
+def piece_square_balance(state):
+	phase = min(state.phase, MAX_PHASE)
+	middle = state.middle_game['w'] - state.middle_game['b']
+	end = state.end_game['w'] - state.end_game['b']
+	return (middle * phase + end * (MAX_PHASE - phase)) / (MAX_PHASE * 100)
 
 def basic_evaluator(state):
-	status = state.special[rules.special_dict['game_finished']]
+	status = state.status
 	if status == 'w':
 		return float('inf')
 	elif status == 'b':
@@ -25,21 +36,16 @@ def basic_evaluator(state):
 	elif status == 'Draw':
 		return 0.0
 
-	coordinates = []
-	for i in range(8):
-		for j in range(8):
-			coordinates.append((i, j))
+	if EVAL_DEBUG:
+		check_evaluation_terms(state)
 
 	#Material count
-	material = 0.0
-	for coord in coordinates:
-		material += piece_value[state.pieces[coord]]
+	return material_balance(state)
 
-	return material
 
-
-def evaluator(state):
-	status = state.special[rules.special_dict['game_finished']]
+#scope_squares: function counting the scope of a piece, chess_rules.scope_squares if None
+def evaluator(state, scope_squares = None):
+	status = state.status
 	if status == 'w':
 		return float('inf')
 	elif status == 'b':
@@ -47,72 +53,662 @@ def evaluator(state):
 	elif status == 'Draw':
 		return 0.0
 
-	coordinates = []
-	for i in range(8):
-		for j in range(8):
-			coordinates.append((i, j))
+	if EVAL_DEBUG:
+		check_evaluation_terms(state)
 
-	#Material count
-	material = 0.0
-	for coord in coordinates:
-		material += piece_value[state.pieces[coord]]
+	#Material count, carried by the state
+	material = material_balance(state)
 
 	#Scope count
+	if scope_squares is None:
+		scope_squares = rules.scope_squares
 	scope = 0
-	for coord in coordinates:
-		piece = state.pieces[coord]
-		if piece:
-			if piece[0] == 'w':
-				scope += len(rules.piece_scope(coord, state))
-			if piece[0] == 'b':
-				scope -= len(rules.piece_scope(coord, state))
+	for sq, code in enumerate(state.board):
+		if code:
+			if code & rules.BLACK:
+				scope -= len(scope_squares(sq, state))
+			else:
+				scope += len(scope_squares(sq, state))
 
 	return 4 * material + scope
 
-def minimax_algo(state, maximizing_player, depth = 5, alpha = float('-inf'), beta = float('inf')):
-	def minimax(state, maximizing_player, depth, alpha, beta):
-		status = state.special[rules.special_dict['game_finished']]
-		if depth == 0 or status:
-			return evaluator(state), False
-	
-		if maximizing_player:
-			max_eval = float('-inf')
-			best_children = False
-			for child in rules.new_child_states(state):
-				eval, __ = minimax(child, False, depth - 1, alpha, beta)
-				if max_eval != max(max_eval, eval) or max_eval == float('-inf'):
-					max_eval = max(max_eval, eval)
-					best_children = child
+#Transposition table shared by successive searches
+TT_SIZE_MB = 16
+transposition_table = None
+
+#Print transposition table statistics after each search
+REPORT_STATS = True
+
+#Time these functions during each search (calls and time in the search stats). The search calls them
+#through its context, which wraps them only for itself (see search_context.time_functions); off, they run unwrapped
+TIME_FUNCTIONS = False
+TIMED_FUNCTIONS = ('scope_squares', 'make_legal_move', 'king_in_check', 'evaluator')
+
+#Stats of the last search run (see search_stats)
+last_stats = None
+
+def get_transposition_table():
+	global transposition_table
+	if transposition_table is None or transposition_table.size_mb != TT_SIZE_MB:
+		transposition_table = tt.transposition_table(TT_SIZE_MB)
+	return transposition_table
+
+#Endgame tables probed at the root and in the search once few pieces are left (see endgame_tables.py).
+#Opened at the first search, False if there is no such file
+ENDGAME_TABLES = True
+ENDGAME_TABLES_PATH = endgame_tables.DEFAULT_TABLES
+tablebase = None
+
+def get_tablebase():
+	global tablebase
+	if tablebase is None or (tablebase and tablebase.path != ENDGAME_TABLES_PATH):
+		tablebase = endgame_tables.open_tables(ENDGAME_TABLES_PATH) or False
+	return tablebase
+
+#Score of a checkmate at the root; a mate n plies away scores MATE_SCORE - n.
+#Scores beyond MATE_BOUND are mates
+MATE_SCORE = 100000.0
+MATE_BOUND = MATE_SCORE - 1000
+
+#Mate scores count plies from the root, the transposition table keeps them counted from the node
+def score_to_table(score, ply):
+	if score >= MATE_BOUND:
+		return score + ply
+	if score <= - MATE_BOUND:
+		return score - ply
+	return score
+
+def score_from_table(score, ply):
+	if score >= MATE_BOUND:
+		return score - ply
+	if score <= - MATE_BOUND:
+		return score + ply
+	return score
+
+#Score for the side to move of an endgame tables result (1 win, 0 draw, -1 loss) with plies to mate, at ply
+def tablebase_score(result, plies, ply):
+	if not result:
+		return 0.0
+	return result * (MATE_SCORE - ply - plies)
+
+#Quiescence search at depth 0: captures and queen promotions are searched until the position is quiet
+QUIESCENCE = True
+#Captures that can't bring the score near alpha / beta even winning this much more are skipped (evaluation units, 4 per pawn)
+DELTA_MARGIN = 8.0
+#Quiescence nodes in check along a line searched with all their evasions instead of standing pat (0: none)
+CHECK_EVASIONS = 1
+
+#Principal variation search: moves after the first are searched with a null window (alpha, alpha + NULL_WINDOW)
+#and searched again with the full window only if they turn out better. False: every move gets the full window
+PVS = True
+NULL_WINDOW = 0.01
+#Nodes whose window is wider than this are PV (open window) nodes. Twice NULL_WINDOW, as the width of a
+#null window like (beta - NULL_WINDOW, beta) can round to a bit more than NULL_WINDOW
+PV_WINDOW = 2 * NULL_WINDOW
+#Iterative deepening searches the root in a window of this half width around the previous score (0: no
+#aspiration window), doubled on the failing side until the score falls inside, open beyond ASPIRATION_LIMIT
+ASPIRATION_WINDOW = 8.0
+ASPIRATION_LIMIT = 64.0
+
+#Selective search (see search_context.minimax), each part can be turned off
+#Null move pruning: from depth NULL_MOVE_MIN_DEPTH, the null move is searched NULL_MOVE_REDUCTION plies less deep
+NULL_MOVE = True
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+#Late move reductions: quiet moves after the first LMR_MOVES are reduced by one ply from depth LMR_MIN_DEPTH,
+#not at the root nor in PV nodes
+LMR = True
+LMR_MOVES = 3
+LMR_MIN_DEPTH = 3
+#Futility pruning: margin by depth (evaluation units, 4 per pawn); pruning is done at depths below len(FUTILITY_MARGINS)
+FUTILITY = True
+FUTILITY_MARGINS = (0.0, 8.0, 20.0)
+
+#Search features that can be turned off by name (ex. epd.py --disable): name of their switch
+FEATURES = {'quiescence': 'QUIESCENCE', 'pvs': 'PVS', 'aspiration': 'ASPIRATION_WINDOW', 'null': 'NULL_MOVE', 'lmr': 'LMR', 'futility': 'FUTILITY',
+	'tables': 'ENDGAME_TABLES'}
+
+def disable_features(names):
+	for name in names:
+		globals()[FEATURES[name]] = False
+
+#Deepest ply of the killer, played move and principal variation tables
+MAX_PLY = 128
+
+#Raised inside a search when its time or node budget is exhausted
+class search_timeout(Exception):
+	pass
+
+#State of a running search. The search runs on a single board, moves are played and taken back in place
+class search_context():
+	def __init__(self, state, deadline = None, node_limit = None, stop_event = None):
+		self.board = state.copy()
+		self.table = get_transposition_table()
+		self.deadline = deadline
+		self.node_limit = node_limit
+		self.stop_event = stop_event	#threading.Event, set by another thread to stop the search
+		self.tablebase = get_tablebase() if ENDGAME_TABLES else None
+		self.tablebase_pieces = self.tablebase.max_pieces if self.tablebase else 0
+		self.nodes = 0		#All nodes, quiescence ones included
+		self.qnodes = 0		#Quiescence nodes
+		self.seldepth = 0		#Deepest ply reached
+		self.tb_hits = 0		#Nodes found in the endgame tables
+		self.functions = dict()		#Timed functions (see TIME_FUNCTIONS): name: [calls, seconds]
+		self.evaluator = evaluator
+		self.make_legal_move = rules.make_legal_move
+		self.king_in_check = rules.king_in_check
+		if TIME_FUNCTIONS:
+			self.time_functions(TIMED_FUNCTIONS)
+		self.root_best_move = None
+		self.root_move_changed = False		#The running iteration proved another root move better, inside its window
+		self.shared_window_ply = None		#Ply whose window is narrowed by shared_window between its moves
+
+		#Quiet move ordering: two killer moves per ply (quiet moves that caused a cutoff at that ply),
+		#history by side and from * 64 + to square (depth squared added at each cutoff) and the
+		#countermove of each from * 64 + to square (quiet reply that cut off the move played there)
+		self.killers = [[None, None] for ply in range(MAX_PLY)]
+		self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+		self.countermoves = [None] * 4096
+		self.played = [None] * MAX_PLY		#Move played at each ply of the current line
+		self.pv = [[] for ply in range(MAX_PLY + 1)]		#Best line found from each ply, pv[0] is the principal variation
+		self.researches = 0		#PVS null window searches that failed high and were searched again
+		self.aspiration_failures = 0		#Root searches outside their aspiration window
+		self.null_cutoffs = 0
+		self.futility_pruned = 0		#Moves skipped by futility pruning
+
+		#Ordering quality: beta cutoffs, how many on the first move searched, sum of move indexes (0 for first) at cutoff
+		self.cutoffs = 0
+		self.first_move_cutoffs = 0
+		self.cutoff_index_sum = 0
+
+	#Wrap the functions called by this search among names (evaluator, make_legal_move, king_in_check and
+	#scope_squares, called by evaluator) to count their calls and time in self.functions. Other searches are not affected
+	def time_functions(self, names):
+		def timed(name, function):
+			return search_stats.timed_function(self.functions, name, function) if name in names else function
+		self.make_legal_move = timed('make_legal_move', self.make_legal_move)
+		self.king_in_check = timed('king_in_check', self.king_in_check)
+		scope_squares = timed('scope_squares', rules.scope_squares)
+		self.evaluator = timed('evaluator', lambda state: evaluator(state, scope_squares))
+
+	#Stop the search if it's out of time or nodes, or if it was asked to stop
+	def check_limits(self):
+		if self.node_limit and self.nodes >= self.node_limit:
+			raise search_timeout()
+		if self.deadline and time.perf_counter() >= self.deadline:
+			raise search_timeout()
+		if self.stop_event is not None and self.stop_event.is_set():
+			raise search_timeout()
+
+	def minimax(self, maximizing_player, depth, alpha, beta, root = False, ply = 0):
+		board = self.board
+		table = self.table
+		self.pv[ply] = []
+		if depth == 0 and QUIESCENCE:
+			return self.quiescence(maximizing_player, alpha, beta, ply, CHECK_EVASIONS), None
+		self.nodes += 1
+		self.check_limits()
+		if __debug__:	#Left out by python -O
+			if ply > self.seldepth:
+				self.seldepth = ply
+
+		#Endgame tables know the result once few pieces are left
+		if self.tablebase_pieces and not root and 64 - board.board.count(rules.EMPTY) <= self.tablebase_pieces:
+			entry = self.tablebase.probe(board)
+			if entry:
+				if __debug__:
+					self.tb_hits += 1
+				value = tablebase_score(entry[0], entry[1], ply)
+				return (value if maximizing_player else - value), None
+
+		#Terminal nodes are found below, when no move is legal
+		if depth == 0:
+			return self.evaluator(board), None
+
+		#Transposition table: cutoff from a deep enough result, else best move first
+		key = board.key
+		hash_move = None
+		entry = table.probe(key)
+		if entry:
+			entry_depth, entry_score, entry_bound, entry_move = entry
+			entry_score = score_from_table(entry_score, ply)
+			#No cutoff in PVS nodes with an open window, so the principal variation is complete
+			if entry_depth >= depth and not root and not (PVS and beta - alpha > PV_WINDOW):
+				if entry_bound == tt.EXACT or (entry_bound == tt.LOWER and entry_score >= beta) or (entry_bound == tt.UPPER and entry_score <= alpha):
+					if __debug__:
+						table.cutoffs += 1
+					return entry_score, None
+			if entry_move:
+				hash_move = rules.decode_move(entry_move)
+
+		#At the root, best move of the previous iteration goes first
+		if root and self.root_best_move:
+			hash_move = self.root_best_move
+
+		alpha_start, beta_start = alpha, beta
+		in_check = self.king_in_check(board, board.turn)
+
+		#Selective search, never at the root, in check or in an open window node of PVS
+		selective = not root and not in_check and not (PVS and beta - alpha > PV_WINDOW)
+		static_eval = None
+		if selective and ((NULL_MOVE and depth >= NULL_MOVE_MIN_DEPTH) or (FUTILITY and depth < len(FUTILITY_MARGINS))):
+			static_eval = self.evaluator(board)
+
+		#Null move pruning: if passing the turn still doesn't let the opponent reach the window, a move won't either.
+		#Not after a null move, nor when the side to move has only pawns (zugzwang)
+		if static_eval is not None and NULL_MOVE and depth >= NULL_MOVE_MIN_DEPTH and self.played[ply - 1] is not None \
+				and abs(beta if maximizing_player else alpha) < MATE_BOUND and rules.has_pieces(board, board.turn) \
+				and (static_eval >= beta if maximizing_player else static_eval <= alpha):
+			undo = board.make_null_move()
+			self.played[ply] = None
+			if maximizing_player:
+				null_value, __ = self.minimax(False, max(depth - 1 - NULL_MOVE_REDUCTION, 0), beta - NULL_WINDOW, beta, ply = ply + 1)
+			else:
+				null_value, __ = self.minimax(True, max(depth - 1 - NULL_MOVE_REDUCTION, 0), alpha, alpha + NULL_WINDOW, ply = ply + 1)
+			board.unmake_null_move(undo)
+			if maximizing_player and null_value >= beta:
+				if __debug__:
+					self.null_cutoffs += 1
+				return beta, None
+			if not maximizing_player and null_value <= alpha:
+				if __debug__:
+					self.null_cutoffs += 1
+				return alpha, None
+
+		#Futility pruning near the leaves: quiet moves that don't give check are skipped when the static
+		#evaluation is that far from the window; the value returned still covers them
+		futile = False
+		if static_eval is not None and FUTILITY and depth < len(FUTILITY_MARGINS):
+			margin = FUTILITY_MARGINS[depth]
+			if maximizing_player and static_eval + margin <= alpha:
+				futile, futile_value = True, static_eval + margin
+			elif not maximizing_player and static_eval - margin >= beta:
+				futile, futile_value = True, static_eval - margin
+
+		legal_moves = 0
+		pruned_moves = 0
+		killers = self.killers[ply]
+		counter_move = None
+		if ply and self.played[ply - 1]:
+			previous = self.played[ply - 1]
+			counter_move = self.countermoves[rules.square_of(previous[0]) * 64 + rules.square_of(previous[1])]
+		moves = rules.staged_moves(board, hash_move, (killers[0], killers[1], counter_move), self.history[board.turn])
+		best_value = float('-inf') if maximizing_player else float('inf')
+		best_move = None
+		for move in moves:
+			quiet = (futile or LMR) and rules.is_quiet(move, board)
+			undo = self.make_legal_move(board, move)
+			if undo is None:
+				continue
+			legal_moves += 1
+			gives_check = quiet and self.king_in_check(board, board.turn)
+
+			if futile and quiet and not gives_check and legal_moves > 1:
+				board.unmake_move(undo)
+				pruned_moves += 1
+				continue
+
+			#Late move reductions: quiet moves ordered late are first searched less deep, in selective nodes only
+			reduction = 0
+			if LMR and selective and quiet and not gives_check and depth >= LMR_MIN_DEPTH and legal_moves > LMR_MOVES:
+				reduction = 1
+			self.played[ply] = move
+			eval = self.search_move(not maximizing_player, depth, alpha, beta, ply, legal_moves > 1, reduction)
+			board.unmake_move(undo)
+
+			if (maximizing_player and eval > best_value) or (not maximizing_player and eval < best_value) or best_move is None:
+				best_value = eval
+				best_move = move
+				self.pv[ply] = [move] + self.pv[ply + 1]
+				#At the root, only a score inside the window proves the move: one that failed low is only an upper
+				#bound, and the previous best move stays first for the search again with a wider window
+				if root and (eval > alpha_start if maximizing_player else eval < beta_start):
+					if move != self.root_best_move:
+						self.root_move_changed = True
+					self.root_best_move = move
+			if maximizing_player:
 				alpha = max(alpha, eval)
-				if beta <= alpha:
-					break
-			return max_eval, best_children
-	
-		else:
-			min_eval = float('inf')
-			best_children = False
-			for child in rules.new_child_states(state):
-				eval, __ = minimax(child, True, depth - 1, alpha, beta)
-				if min_eval != min(min_eval, eval) or min_eval == float('inf'):
-					min_eval = min(min_eval, eval)
-					best_children = child
+			else:
 				beta = min(beta, eval)
-				if beta <= alpha:
-					break
-			return min_eval, best_children
+			if ply == self.shared_window_ply:
+				low, high = self.shared_window()
+				alpha, beta = max(alpha, low), min(beta, high)
+				alpha_start, beta_start = max(alpha_start, low), min(beta_start, high)
+			if beta <= alpha:
+				self.record_cutoff(move, legal_moves - 1, depth, ply)
+				break
 
-	valuation, best_state = minimax(state, maximizing_player, depth, alpha, beta)
+		value = best_value
+		if pruned_moves:
+			if __debug__:
+				self.futility_pruned += pruned_moves
+			value = max(value, futile_value) if maximizing_player else min(value, futile_value)
+
+		#No legal move: checkmate (sooner is better for the winner) or stalemate
+		if not legal_moves:
+			if in_check:
+				value = - (MATE_SCORE - ply) if maximizing_player else MATE_SCORE - ply
+			else:
+				value = 0.0
+
+		if value <= alpha_start:
+			bound = tt.UPPER
+		elif value >= beta_start:
+			bound = tt.LOWER
+		else:
+			bound = tt.EXACT
+		table.store(key, depth, score_to_table(value, ply), bound, rules.encode_move(best_move) if best_move else 0)
+
+		return value, best_move
+
+	#Limits (low, high) of the window at shared_window_ply, read again after each of its moves: the bounds
+	#found meanwhile by other searches of the same root (see parallel_search.worker_context)
+	def shared_window(self):
+		return float('-inf'), float('inf')
+
+	#Value of the position after a move from a node at depth with window (alpha, beta), maximizing_player
+	#being the side to move after it. A late move (not the first one searched) is first searched with a
+	#null window and depth reduced by reduction, then again normally if it may be better
+	def search_move(self, maximizing_player, depth, alpha, beta, ply, late, reduction):
+		if late and (reduction or (PVS and beta - alpha > PV_WINDOW)):
+			if maximizing_player:
+				value, __ = self.minimax(True, depth - 1 - reduction, beta - NULL_WINDOW, beta, ply = ply + 1)
+				better = value < beta and (reduction or value > alpha)
+			else:
+				value, __ = self.minimax(False, depth - 1 - reduction, alpha, alpha + NULL_WINDOW, ply = ply + 1)
+				better = value > alpha and (reduction or value < beta)
+			if not better:
+				return value
+			if __debug__:
+				self.researches += 1
+
+		value, __ = self.minimax(maximizing_player, depth - 1, alpha, beta, ply = ply + 1)
+		return value
+
+	#Count a cutoff by the move at index (0: first move searched). A quiet move becomes a killer
+	#at ply and the countermove of the previous move, and gains history
+	def record_cutoff(self, move, index, depth, ply):
+		if __debug__:
+			self.cutoffs += 1
+			self.cutoff_index_sum += index
+			if index == 0:
+				self.first_move_cutoffs += 1
+
+		board = self.board
+		if not rules.is_quiet(move, board):
+			return
+		killers = self.killers[ply]
+		if move != killers[0]:
+			killers[1] = killers[0]
+			killers[0] = move
+		self.history[board.turn][rules.square_of(move[0]) * 64 + rules.square_of(move[1])] += depth * depth
+		if ply and self.played[ply - 1]:
+			previous = self.played[ply - 1]
+			self.countermoves[rules.square_of(previous[0]) * 64 + rules.square_of(previous[1])] = move
+
+	#Statistics of the search so far, with the result of its last finished iteration
+	def stats(self, depth, score, pv, seconds):
+		stats = search_stats.search_stats()
+		stats.depth, stats.score, stats.pv, stats.seconds = depth, score, [rules.move_to_uci(move) for move in pv], seconds
+		stats.seldepth, stats.nodes, stats.qnodes, stats.tb_hits = self.seldepth, self.nodes, self.qnodes, self.tb_hits
+		stats.cutoffs, stats.first_move_cutoffs = self.cutoffs, self.first_move_cutoffs
+		stats.tt_probes, stats.tt_hits, stats.tt_cutoffs = self.table.probes, self.table.hits, self.table.cutoffs
+		stats.hashfull = int(1000 * self.table.fill_rate())
+		stats.researches, stats.aspiration_failures = self.researches, self.aspiration_failures
+		stats.null_cutoffs, stats.futility_pruned = self.null_cutoffs, self.futility_pruned
+		stats.functions = {name: list(totals) for name, totals in self.functions.items()}
+		return stats
+
+	#First move cutoff rate and average move index at cutoff (0 when the first move always cuts off)
+	def ordering_report(self):
+		return "cutoffs %d, first move %.1f%%, average index %.2f" % (self.cutoffs, 100 * self.first_move_cutoffs / max(self.cutoffs, 1),
+			self.cutoff_index_sum / max(self.cutoffs, 1))
+
+	#Search captures and queen promotions only. The side to move can also stand pat (keep the static
+	#evaluation) unless it's in check and evasions (count of in-check nodes searched with all their moves) is left
+	def quiescence(self, maximizing_player, alpha, beta, ply, evasions):
+		board = self.board
+		self.nodes += 1
+		self.check_limits()
+		if __debug__:	#Left out by python -O
+			self.qnodes += 1
+			if ply > self.seldepth:
+				self.seldepth = ply
+
+		in_check = evasions > 0 and self.king_in_check(board, board.turn)
+		if in_check:
+			best = float('-inf') if maximizing_player else float('inf')
+			moves = rules.staged_moves(board)
+			evasions -= 1
+		else:
+			best = stand_pat = self.evaluator(board)
+			if maximizing_player:
+				if best >= beta:
+					return best
+				alpha = max(alpha, best)
+			else:
+				if best <= alpha:
+					return best
+				beta = min(beta, best)
+			moves = [move for score, move in rules.capture_moves(board)]
+
+		legal_moves = 0
+		for move in moves:
+			#Delta pruning: even winning the captured piece and the margin doesn't reach the window.
+			#The returned bound must still cover what the move could win
+			if not in_check:
+				victim = board.board[move[1][1] * 8 + move[1][0]] & 7 or rules.PAWN
+				gain = 4 * rules.ordering_value[victim] + DELTA_MARGIN
+				if move[2]:
+					gain += 32
+				if maximizing_player and stand_pat + gain <= alpha:
+					best = max(best, stand_pat + gain)
+					continue
+				if not maximizing_player and stand_pat - gain >= beta:
+					best = min(best, stand_pat - gain)
+					continue
+
+			undo = self.make_legal_move(board, move)
+			if undo is None:
+				continue
+			legal_moves += 1
+			score = self.quiescence(not maximizing_player, alpha, beta, ply + 1, evasions)
+			board.unmake_move(undo)
+
+			if maximizing_player:
+				if score > best:
+					best = score
+				alpha = max(alpha, score)
+			else:
+				if score < best:
+					best = score
+				beta = min(beta, score)
+			if beta <= alpha:
+				break
+
+		#In check without a legal move: checkmate
+		if in_check and not legal_moves:
+			return - (MATE_SCORE - ply) if maximizing_player else MATE_SCORE - ply
+
+		return best
+
+#Return the child state reached by best_move, or False if there is no move
+def best_child(state, best_move):
+	if best_move is None:
+		return False
+
+	best_state = rules.child_from_move(state, best_move)
+	best_state.status = rules.finished_game_check(best_state)
 	return best_state
 
+#Fixed depth search. Return best child state, the stats of the search are left in last_stats
+def minimax_algo(state, maximizing_player, depth = 5, alpha = float('-inf'), beta = float('inf')):
+	global last_stats
+	start_time = time.perf_counter()
+	context = search_context(state)
+	context.table.reset_stats()
+	valuation, best_move = context.minimax(maximizing_player, depth, alpha, beta, root = True)
+	last_stats = context.stats(depth, valuation, context.pv[0], time.perf_counter() - start_time)
+	if REPORT_STATS:
+		print("score %.2f pv %s" % (valuation, pv_text(context.pv[0])))
+		print(context.ordering_report())
+		print(context.table.report())
+		for line in last_stats.functions_report():
+			print(line)
+
+	return best_child(state, best_move)
+
+#First legal move of state in the search order, None if there is none. State is only changed temporarily
+def first_legal_move(state):
+	for move in rules.staged_moves(state):
+		undo = rules.make_legal_move(state, move)
+		if undo is not None:
+			state.unmake_move(undo)
+			return move
+	return None
+
+#Time to spend on a move given the remaining clock time and increment, in seconds
+def time_for_move(clock_time, increment = 0.0):
+	budget = clock_time / 30 + 0.8 * increment
+	return max(0.01, min(budget, clock_time / 2))
+
+#Moves of a principal variation in UCI notation, separated by spaces
+def pv_text(pv):
+	return ' '.join(rules.move_to_uci(move) for move in pv)
+
+#Root search at depth in a window around score, the previous iteration's score (see ASPIRATION_WINDOW).
+#Return (value, best_move) as minimax
+def aspiration_search(context, maximizing_player, depth, score):
+	if not ASPIRATION_WINDOW or abs(score) >= MATE_BOUND:
+		return context.minimax(maximizing_player, depth, float('-inf'), float('inf'), root = True)
+
+	low = high = ASPIRATION_WINDOW
+	while True:
+		alpha = score - low if low <= ASPIRATION_LIMIT else float('-inf')
+		beta = score + high if high <= ASPIRATION_LIMIT else float('inf')
+		value, best_move = context.minimax(maximizing_player, depth, alpha, beta, root = True)
+		if value <= alpha and alpha > float('-inf'):
+			low *= 2
+		elif value >= beta and beta < float('inf'):
+			high *= 2
+		else:
+			return value, best_move
+		if __debug__:
+			context.aspiration_failures += 1
+
+#Search depth 1, 2, 3, ... until the budget runs out: move_time (seconds), clock_time and increment
+#(seconds, the budget is computed with time_for_move) and/or node_limit, or until stop_event is set.
+#Return (score, principal variation, stats) of the last iteration, the variation is empty if there is no move;
+#if an unfinished iteration already proved another move better, the variation is only that move, and if no
+#iteration got that far it is the first legal move (score None).
+#on_iteration(depth, score, pv, nodes, seconds) is called after each iteration, and on_stats(stats) with the
+#stats so far. With profile, the search runs under cProfile and profile(pstats.Stats) gets its profile
+def iterative_deepening_search(state, maximizing_player, move_time = None, clock_time = None, increment = 0.0, node_limit = None, max_depth = 64, stop_event = None, on_iteration = None,
+		on_stats = None, profile = None):
+	global last_stats
+	if profile:
+		return search_stats.profile_call(profile, iterative_deepening_search, state, maximizing_player, move_time, clock_time, increment, node_limit, max_depth, stop_event,
+			on_iteration, on_stats)
+
+	start_time = time.perf_counter()
+	if clock_time is not None:
+		move_time = time_for_move(clock_time, increment)
+	deadline = start_time + move_time if move_time else None
+
+	context = search_context(state, deadline, node_limit, stop_event)
+	context.table.reset_stats()
+
+	#A position of the endgame tables is played from them
+	found = context.tablebase.best_move(state.copy(), rules) if context.tablebase_pieces else None
+	if found:
+		move, result, plies = found
+		valuation = tablebase_score(result, plies, 0)
+		valuation = valuation if maximizing_player else - valuation
+		pv = context.tablebase.line(state, rules)
+		if __debug__:
+			context.tb_hits += 1
+		last_stats = context.stats(len(pv), valuation, pv, time.perf_counter() - start_time)
+		if REPORT_STATS:
+			print("endgame tables: score %.2f pv %s" % (valuation, pv_text(pv)))
+		if on_iteration:
+			on_iteration(len(pv), valuation, pv, 0, last_stats.seconds)
+		if on_stats:
+			on_stats(last_stats)
+		return valuation, pv, last_stats
+
+	#Until an iteration finds better, the first legal move is played: a search stopped that early still has one
+	valuation, pv = None, []
+	first_move = first_legal_move(context.board)
+	if first_move:
+		pv = [first_move]
+	finished_depth = 0
+	for depth in range(1, max_depth + 1):
+		context.root_move_changed = False
+		try:
+			if depth == 1:
+				valuation, best_move = context.minimax(maximizing_player, depth, float('-inf'), float('inf'), root = True)
+			else:
+				valuation, best_move = aspiration_search(context, maximizing_player, depth, valuation)
+		except search_timeout:
+			#The unfinished iteration's move only if it beat the finished one's inside a real window
+			if context.root_move_changed and context.root_best_move not in pv[:1]:
+				pv = [context.root_best_move]
+			break
+		pv = list(context.pv[0])
+		finished_depth = depth
+		elapsed = time.perf_counter() - start_time
+		if REPORT_STATS:
+			print("depth %d score %.2f nodes %d (%d quiescence) time %.2f s pv %s" % (depth, valuation, context.nodes, context.qnodes, elapsed, pv_text(pv)))
+		if on_iteration:
+			on_iteration(depth, valuation, pv, context.nodes, elapsed)
+		if on_stats:
+			on_stats(context.stats(depth, valuation, pv, elapsed))
+
+		#Stop if the game ends or the next iteration can't be expected to finish
+		if best_move is None or abs(valuation) >= MATE_BOUND:
+			break
+		if move_time and elapsed > move_time / 2:
+			break
+
+	last_stats = context.stats(finished_depth, valuation, pv, time.perf_counter() - start_time)
+	if REPORT_STATS:
+		print("re-searches %d, aspiration failures %d, null move cutoffs %d, futility pruned %d" % (context.researches, context.aspiration_failures, context.null_cutoffs, context.futility_pruned))
+		print(context.ordering_report())
+		print(context.table.report())
+		for line in last_stats.functions_report():
+			print(line)
+
+	return valuation, pv, last_stats
+
+#Same as iterative_deepening_search, return (score, principal variation)
+def iterative_deepening_line(state, maximizing_player, move_time = None, clock_time = None, increment = 0.0, node_limit = None, max_depth = 64, stop_event = None, on_iteration = None):
+	valuation, pv, stats = iterative_deepening_search(state, maximizing_player, move_time, clock_time, increment, node_limit, max_depth, stop_event, on_iteration)
+	return valuation, pv
+
+#Same as iterative_deepening_line, return best move, None if there is no move
+def iterative_deepening_move(state, maximizing_player, move_time = None, clock_time = None, increment = 0.0, node_limit = None, max_depth = 64, stop_event = None, on_iteration = None):
+	valuation, pv = iterative_deepening_line(state, maximizing_player, move_time, clock_time, increment, node_limit, max_depth, stop_event, on_iteration)
+	return pv[0] if pv else None
+
+#Same as iterative_deepening_move, return best child state
+def iterative_deepening(state, maximizing_player, move_time = None, clock_time = None, increment = 0.0, node_limit = None, max_depth = 64, stop_event = None):
+	best_move = iterative_deepening_move(state, maximizing_player, move_time, clock_time, increment, node_limit, max_depth, stop_event)
+	return best_child(state, best_move)
+
 def basic_minimax(state, maximizing_player, depth = 5, alpha = float('-inf'), beta = float('inf')):
-	status = state.special[rules.special_dict['game_finished']]
+	status = state.status
 	if depth == 0 or status:
 		return basic_evaluator(state), False
 
+	children = rules.child_states(state)
+	if not children:
+		state.status = rules.finished_game_check(state)
+		return basic_evaluator(state), False
+
 	if maximizing_player:
 		max_eval = float('-inf')
 		best_children = False
-		for child in rules.child_states(state):
+		for child in children:
 			eval, __ = basic_minimax(child, False, depth - 1, alpha, beta)
 			if max_eval != max(max_eval, eval):
 				max_eval = max(max_eval, eval)
@@ -125,7 +721,7 @@ def basic_minimax(state, maximizing_player, depth = 5, alpha = float('-inf'), be
 	else:
 		min_eval = float('inf')
 		best_children = False
-		for child in rules.child_states(state):
+		for child in children:
 			eval, __ = basic_minimax(child, True, depth - 1, alpha, beta)
 			if min_eval != min(min_eval, eval):
 				min_eval = min(min_eval, eval)
@@ -139,6 +735,7 @@ def random_move(state):
 	possible_states = rules.child_states(state)
 	number_states = len(possible_states)
 	if number_states:
+		import numpy as np	#Only needed here, imported late to keep startup fast
 		rdm = np.random.randint(0, number_states)
 		return possible_states[rdm]
 
@@ -0,0 +1,100 @@
+#Statistics of one search (see search_algo.iterative_deepening_search) and profiling helpers
+#
+#A search_stats record has the counters of the search (nodes, cutoffs, transposition table, ...), its result
+#and, when function timing is on, the calls and time of chosen functions. It can be printed, sent as UCI
+#info lines or written as JSON.
+#Function timing wraps the functions called by one search only, so with timing off they cost nothing.
+#Counters other than nodes are only kept when python runs without -O
+
+import sys
+import json
+import time
+import cProfile
+import pstats
+
+class search_stats():
+	def __init__(self):
+		self.depth = 0			#Last finished iteration
+		self.seldepth = 0		#Deepest ply reached, quiescence included
+		self.score = None		#White positive
+		self.pv = []			#Moves in UCI notation
+		self.nodes = 0
+		self.qnodes = 0
+		self.seconds = 0.0
+		self.cutoffs = 0
+		self.first_move_cutoffs = 0
+		self.tt_probes = 0
+		self.tt_hits = 0
+		self.tt_cutoffs = 0
+		self.hashfull = 0		#Per mille of the transposition table in use
+		self.tb_hits = 0		#Positions found in the endgame tables
+		self.researches = 0
+		self.aspiration_failures = 0
+		self.null_cutoffs = 0
+		self.futility_pruned = 0
+		self.functions = dict()		#Name: [calls, seconds], time includes the calls made inside
+
+	def nps(self):
+		return int(self.nodes / max(self.seconds, 1e-6))
+
+	def as_dict(self):
+		record = dict(self.__dict__)
+		record['nps'] = self.nps()
+		record['functions'] = {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.functions.items()}
+		return record
+
+	def to_json(self):
+		return json.dumps(self.as_dict())
+
+	#UCI info lines, score from the side to move as given by score_text (ex. "cp 25")
+	def uci_info(self, score_text):
+		line = "info depth %d seldepth %d score %s nodes %d nps %d time %d hashfull %d tbhits %d" % (self.depth, self.seldepth, score_text,
+			self.nodes, self.nps(), self.seconds * 1000, self.hashfull, self.tb_hits)
+		if self.pv:
+			line += " pv " + ' '.join(self.pv)
+		lines = [line]
+		for name, (calls, seconds) in self.functions.items():
+			lines.append("info string %s %d calls %d ms" % (name, calls, seconds * 1000))
+		return lines
+
+	def report(self):
+		lines = ["depth %d (seldepth %d) nodes %d (%d quiescence) time %.2f s nps %d" % (self.depth, self.seldepth, self.nodes, self.qnodes, self.seconds, self.nps()),
+			"cutoffs %d (first move %.1f%%), TT %d probes %d hits %d cutoffs, %d tables hits" % (self.cutoffs, 100 * self.first_move_cutoffs / max(self.cutoffs, 1),
+			self.tt_probes, self.tt_hits, self.tt_cutoffs, self.tb_hits)]
+		return '\n'.join(lines + self.functions_report())
+
+	#Lines of the timed functions, longest first
+	def functions_report(self):
+		return ["%-20s %9d calls %8.3f s %6.1f%%" % (name, calls, seconds, 100 * seconds / max(self.seconds, 1e-9))
+			for name, (calls, seconds) in sorted(self.functions.items(), key = lambda item: - item[1][1])]
+
+#Function calling function and counting its calls and time in functions[name] ([calls, seconds])
+def timed_function(functions, name, function):
+	totals = functions.setdefault(name, [0, 0.0])
+	clock = time.perf_counter
+
+	def wrapper(*arguments, **keywords):
+		start = clock()
+		try:
+			return function(*arguments, **keywords)
+		finally:
+			totals[0] += 1
+			totals[1] += clock() - start
+
+	return wrapper
+
+#Run function(*arguments, **keywords) under cProfile and give the profile (pstats.Stats) to callback.
+#Return what function returns
+def profile_call(callback, function, *arguments, **keywords):
+	profiler = cProfile.Profile()
+	try:
+		return profiler.runcall(function, *arguments, **keywords)
+	finally:
+		callback(pstats.Stats(profiler))
+
+#Callback for profile_call printing the top functions by cumulative time to stream (standard output if None)
+def print_profile(top = 20, sort = 'cumulative', stream = None):
+	def callback(profile):
+		profile.stream = stream or sys.stdout
+		profile.sort_stats(sort).print_stats(top)
+	return callback
@@ -0,0 +1,67 @@
+#Tests of the background engine without the GUI: run with python3 -m pytest from src/
+
+import pytest
+import search_algo as search
+from background_engine import background_engine
+
+@pytest.fixture
+def engine():
+	search.REPORT_STATS = False
+	search.get_transposition_table().clear()
+	engine = background_engine(move_time = 0.2)
+	yield engine
+	engine.shutdown()
+
+def is_legal(move, state):
+	return move in search.rules.legal_moves(state)
+
+def test_search_answers_a_legal_move(engine):
+	state = search.rules.start_board_position()
+	future = engine.search(state)
+	assert is_legal(future.result(timeout = 30), state)
+	assert not engine.busy()
+
+#A search with a long budget stopped early still answers the best move so far
+def test_stop_answers_a_legal_move(engine):
+	engine.move_time = 60.0
+	state = search.rules.start_board_position()
+	future = engine.search(state)
+	engine.stop()
+	assert is_legal(future.result(timeout = 30), state)
+
+def test_cancel_discards_the_search(engine):
+	engine.move_time = 60.0
+	future = engine.search(search.rules.start_board_position())
+	engine.cancel()
+	assert future.done()
+	assert engine.future is None and not engine.busy()
+
+#Engine move, then ponder on the position after it: the state the engine expects the user to reply to
+def pondered_state(engine):
+	state = search.rules.start_board_position()
+	state.make_move(engine.search(state).result(timeout = 30))
+	return state
+
+#The user plays the expected reply: the ponder search goes on and answers within move_time
+def test_ponder_hit_continues_the_ponder_search(engine):
+	state = pondered_state(engine)
+	reply = engine.ponder(state)
+	assert reply is not None
+	ponder_future = engine.future
+	state.make_move(reply)
+	future = engine.search(state)
+	assert future is ponder_future
+	assert is_legal(future.result(timeout = 30), state)
+	assert (engine.ponder_hits, engine.ponder_misses) == (1, 0)
+
+#The user plays another reply: the ponder search is dropped for a search of the position played
+def test_ponder_miss_starts_a_new_search(engine):
+	state = pondered_state(engine)
+	reply = engine.ponder(state)
+	ponder_future = engine.future
+	other = next(move for move in search.rules.legal_moves(state) if move != reply)
+	state.make_move(other)
+	future = engine.search(state)
+	assert future is not ponder_future and ponder_future.done()
+	assert is_legal(future.result(timeout = 30), state)
+	assert (engine.ponder_hits, engine.ponder_misses) == (0, 1)
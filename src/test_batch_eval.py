@@ -0,0 +1,25 @@
+#Tests of the batch evaluation: run with python3 -m pytest from src/
+
+import chess_rules
+import search_algo as search
+import batch_eval
+from perft import reference_positions
+
+#Batch scores are the scalar evaluator's, bit for bit
+def test_evaluate_states_equals_evaluator():
+	states = batch_eval.random_positions(300, seed = 1)
+	states += [chess_rules.fen_to_state(fen) for fen, counts in reference_positions.values()]
+	#En passant available, castling blocked and finished games
+	states += [chess_rules.fen_to_state(fen) for fen in ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+		"r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4", "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1", "7k/8/6Q1/8/8/8/8/K7 b - - 0 1")]
+	for state in states:
+		state.status = chess_rules.finished_game_check(state)
+	assert [state.status for state in states[-2:]] == ['w', 'Draw']
+	assert batch_eval.evaluate_states(states) == [search.evaluator(state) for state in states]
+
+#Batches split in chunks score the same as one batch
+def test_chunks_score_the_same(monkeypatch):
+	states = batch_eval.random_positions(50, seed = 2)
+	scores = batch_eval.evaluate_states(states)
+	monkeypatch.setattr(batch_eval, 'CHUNK', 7)
+	assert batch_eval.evaluate_states(states) == scores
@@ -0,0 +1,63 @@
+#Tests of the move generators and notations: run with python3 -m pytest from src/
+
+import pytest
+import chess_rules
+import bitboard_rules
+from perft import perft, reference_positions
+
+#Everything make_move changes, to check that unmake_move restores it
+def snapshot(state):
+	return (bytes(state.board), state.turn, state.flags, state.status, state.key, state.kings, dict(state.material), dict(state.middle_game),
+		dict(state.end_game), state.phase, state.halfmove, state.fullmove)
+
+#Play and take back every move two plies deep, checking keys and running terms on the way
+def check_make_unmake(rules, state, depth):
+	for move in rules.pseudo_legal_moves(state):
+		before = snapshot(state)
+		undo = state.make_move(move)
+		assert state.key == chess_rules.zobrist_key(state), move
+		assert (state.material, state.middle_game, state.end_game, state.phase) == chess_rules.evaluation_terms(state), move
+		if depth > 1:
+			check_make_unmake(rules, state, depth - 1)
+		state.unmake_move(undo)
+		assert snapshot(state) == before, move
+
+@pytest.mark.parametrize('rules', [chess_rules, bitboard_rules])
+@pytest.mark.parametrize('name', sorted(reference_positions))
+def test_make_unmake_round_trip(rules, name):
+	fen, counts = reference_positions[name]
+	state = rules.fen_to_state(fen)
+	assert state.key == chess_rules.zobrist_key(state)
+	check_make_unmake(rules, state, 2)
+
+#Reference counts up to a few thousand nodes per position, on both move generators
+@pytest.mark.parametrize('rules', [chess_rules, bitboard_rules])
+@pytest.mark.parametrize('name', sorted(reference_positions))
+def test_perft_reference_counts(rules, name):
+	fen, counts = reference_positions[name]
+	state = rules.fen_to_state(fen)
+	for depth, expected in enumerate(counts, 1):
+		if expected > 10000:
+			break
+		assert perft(rules, state, depth) == expected, depth
+
+@pytest.mark.parametrize('name', sorted(reference_positions))
+def test_fen_round_trip(name):
+	fen, counts = reference_positions[name]
+	assert chess_rules.state_to_fen(chess_rules.fen_to_state(fen)) == fen
+
+@pytest.mark.parametrize('name', sorted(reference_positions))
+def test_san_and_uci_round_trip(name):
+	fen, counts = reference_positions[name]
+	state = chess_rules.fen_to_state(fen)
+	for move in chess_rules.legal_moves(state):
+		assert chess_rules.san_to_move(state, chess_rules.move_to_san(state, move)) == move
+		assert chess_rules.uci_to_move(chess_rules.move_to_uci(move)) == move
+
+@pytest.mark.parametrize('rules', [chess_rules, bitboard_rules])
+def test_check_king_without_a_king_raises(rules, capsys):
+	assert rules.check_king(rules.fen_to_state("4k3/8/8/8/8/8/8/4K2r w - - 0 1")) == (True, False)
+	with pytest.raises(ValueError):
+		rules.check_king(rules.fen_to_state("4k3/8/8/8/8/8/8/7R w - - 0 1"))
+	#Nothing written to stdout, where the UCI engine talks
+	assert capsys.readouterr().out == ''
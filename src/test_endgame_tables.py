@@ -0,0 +1,47 @@
+#Tests of the endgame tables: run with python3 -m pytest from src/
+#The KPK tables (with KQK and KRK for the promotions) are built once for the module, in about a minute
+
+import pytest
+import chess_rules
+import endgame_tables
+
+@pytest.fixture(scope = 'module')
+def tables(tmp_path_factory):
+	path = str(tmp_path_factory.mktemp('tables') / 'kpk.bin')
+	endgame_tables.generate(['KPK'], path, verbose = False)
+	tables = endgame_tables.endgame_tables(path)
+	yield tables
+	tables.close()
+
+def probe(tables, fen):
+	return tables.probe(chess_rules.fen_to_state(fen))
+
+#King on the sixth rank in front of its pawn wins whoever moves
+def test_kpk_wins(tables):
+	assert probe(tables, "4k3/8/4K3/4P3/8/8/8/8 w - - 0 1")[0] == 1
+	assert probe(tables, "4k3/8/4K3/4P3/8/8/8/8 b - - 0 1")[0] == -1
+	#Pawn out of reach of the black king
+	assert probe(tables, "7k/8/8/8/8/8/P7/K7 w - - 0 1")[0] == 1
+
+def test_kpk_draws(tables):
+	#Black takes the opposition in front of the pawn
+	assert probe(tables, "4k3/8/8/4K3/4P3/8/8/8 b - - 0 1") == (0, 0)
+	assert probe(tables, "8/8/8/8/8/4k3/4P3/4K3 w - - 0 1") == (0, 0)
+	#Rook pawn with the black king in front of it
+	assert probe(tables, "k7/8/8/8/8/8/P7/K7 w - - 0 1") == (0, 0)
+	#Black takes the pawn
+	assert probe(tables, "8/8/8/8/8/8/4Pk2/4K3 b - - 0 1") == (0, 0)
+
+#Colors swapped: the same results for black
+def test_kpk_with_colors_swapped(tables):
+	assert probe(tables, "8/8/8/8/4p3/4k3/8/4K3 b - - 0 1")[0] == 1
+	assert probe(tables, "8/8/8/8/8/k7/p7/K7 w - - 0 1") == (0, 0)
+
+#The best move of a won position keeps the win, one ply shorter
+def test_best_move_keeps_the_win(tables):
+	state = chess_rules.fen_to_state("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1")
+	result, plies = tables.probe(state)
+	move, move_result, move_plies = tables.best_move(state, chess_rules)
+	assert (move_result, move_plies) == (result, plies)
+	state.make_move(move)
+	assert tables.probe(state) == (-1, plies - 1)
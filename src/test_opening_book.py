@@ -0,0 +1,71 @@
+#Tests of the Polyglot opening book: run with python3 -m pytest from src/
+
+import pytest
+import chess_rules
+import opening_book
+
+#Keys published with the Polyglot format, after each move of a line from the start position
+published_keys = [
+	(None, 0x463b96181691fc9c),
+	('e2e4', 0x823c9b50fd114196),
+	('d7d5', 0x0756b94461c50fb0),
+	('e4e5', 0x662fafb965db29d4),
+	('f7f5', 0x22a48b5a8e47ff78),
+	('e1e2', 0x652a607ca3f242c1),
+	('e8f7', 0x00fdd303c946bdd9),
+]
+
+def test_polyglot_keys_match_the_published_ones():
+	state = chess_rules.start_board_position()
+	for text, key in published_keys:
+		if text:
+			state.make_move(chess_rules.uci_to_move(text))
+		assert opening_book.polyglot_key(state) == key, text
+
+def test_castling_moves_are_written_king_takes_rook():
+	state = chess_rules.fen_to_state("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+	for text in ('e1g1', 'e1c1'):
+		move = chess_rules.uci_to_move(text)
+		raw = opening_book.encode_book_move(state, move)
+		assert opening_book.decode_book_move(state, raw) == move
+	assert opening_book.encode_book_move(state, chess_rules.uci_to_move('e1g1')) & 0x3F == 7
+
+PGN = """[Event "a"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "b"]
+[Result "1/2-1/2"]
+
+1. e4 c5 2. Nf3 1/2-1/2
+
+[Event "c"]
+[Result "0-1"]
+
+1. d4 d5 0-1
+"""
+
+@pytest.fixture
+def book(tmp_path):
+	pgn_path = tmp_path / 'games.pgn'
+	pgn_path.write_text(PGN)
+	book_path = str(tmp_path / 'book.bin')
+	assert opening_book.build_book([str(pgn_path)], book_path) == (3, 8)
+	book = opening_book.open_book(book_path)
+	yield book
+	book.close()
+
+#Moves of the start position weigh 2 per win, 1 per draw and 0 per loss of the side playing them, at least 1
+def test_book_lookup(book):
+	state = chess_rules.start_board_position()
+	moves = dict((chess_rules.move_to_uci(move), weight) for move, weight in book.moves(state))
+	assert moves == {'e2e4': 3, 'd2d4': 1}
+	assert chess_rules.move_to_uci(book.pick(state, best = True)) == 'e2e4'
+	state.make_move(chess_rules.uci_to_move('e2e4'))
+	assert sorted(chess_rules.move_to_uci(move) for move, weight in book.moves(state)) == ['c7c5', 'e7e5']
+	state.make_move(chess_rules.uci_to_move('h7h6'))
+	assert book.moves(state) == [] and book.pick(state) is None
+
+def test_missing_book_opens_as_none(tmp_path):
+	assert opening_book.open_book(str(tmp_path / 'missing.bin')) is None
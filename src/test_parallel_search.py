@@ -0,0 +1,24 @@
+#Tests of the parallel search: run with python3 -m pytest from src/
+
+import search_algo as search
+import parallel_search
+from perft import reference_positions
+
+#With one worker the root moves are searched in order, so node counts are deterministic: the shared
+#bound must never make the search bigger, and must not change its score
+def test_shared_bound_never_searches_more_nodes():
+	search.REPORT_STATS = False
+	try:
+		for fen, counts in reference_positions.values():
+			state = search.rules.fen_to_state(fen)
+			results = dict()
+			for share_bound in (True, False):
+				parallel_search.get_pool(1)
+				parallel_search.shared_table.clear()
+				value, move, nodes, finished = parallel_search.parallel_search(state, state.turn == 'w', 2, 1, share_bound = share_bound)
+				assert finished
+				results[share_bound] = (value, nodes)
+			assert results[True][0] == results[False][0], fen
+			assert results[True][1] <= results[False][1], fen
+	finally:
+		parallel_search.close_all()
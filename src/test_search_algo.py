@@ -0,0 +1,73 @@
+#Tests of the search: run with python3 -m pytest from src/
+
+import search_algo as search
+from perft import reference_positions
+
+#Search context keeping the reduction of every move searched, by ply of the node searching it
+class recording_context(search.search_context):
+	def __init__(self, state):
+		search.search_context.__init__(self, state)
+		self.reductions = []
+
+	def search_move(self, maximizing_player, depth, alpha, beta, ply, late, reduction):
+		self.reductions.append((ply, reduction))
+		return search.search_context.search_move(self, maximizing_player, depth, alpha, beta, ply, late, reduction)
+
+def test_root_moves_are_never_reduced():
+	search.REPORT_STATS = False
+	reduced = 0
+	for fen, counts in reference_positions.values():
+		search.get_transposition_table().clear()
+		state = search.rules.fen_to_state(fen)
+		context = recording_context(state)
+		context.minimax(state.turn == 'w', 4, float('-inf'), float('inf'), root = True)
+		assert not any(reduction for ply, reduction in context.reductions if ply == 0), fen
+		reduced += sum(1 for ply, reduction in context.reductions if reduction)
+	#Reductions still happen below the root
+	assert reduced
+
+#A root search failing low (window far above the score) keeps the best move of the previous depth
+def test_root_move_kept_on_fail_low():
+	search.REPORT_STATS = False
+	search.get_transposition_table().clear()
+	state = search.rules.start_board_position()
+	context = search.search_context(state)
+	value, best_move = context.minimax(True, 3, float('-inf'), float('inf'), root = True)
+	failed_value, __ = context.minimax(True, 4, value + 50, value + 66, root = True)
+	assert failed_value <= value + 50
+	assert context.root_best_move == best_move
+
+#Iteration that fails low at the root then runs out of time: the move of the finished iteration is played
+def test_timeout_after_fail_low_keeps_finished_move(monkeypatch):
+	search.REPORT_STATS = False
+	search.get_transposition_table().clear()
+	state = search.rules.start_board_position()
+	value, pv = search.iterative_deepening_line(state, True, max_depth = 3)
+
+	aspiration_search = search.aspiration_search
+	def failing_search(context, maximizing_player, depth, score):
+		if depth <= 3:
+			return aspiration_search(context, maximizing_player, depth, score)
+		context.minimax(maximizing_player, depth, score + 50, score + 66, root = True)
+		raise search.search_timeout()
+
+	search.get_transposition_table().clear()
+	monkeypatch.setattr(search, 'aspiration_search', failing_search)
+	timeout_value, timeout_pv = search.iterative_deepening_line(state, True, max_depth = 4)
+	assert timeout_value == value
+	assert timeout_pv[:1] == pv[:1]
+
+#Function timing wraps the functions of one search only, never the module ones other searches use
+def test_function_timing_is_local_to_a_search(monkeypatch):
+	search.REPORT_STATS = False
+	make_legal_move = search.rules.make_legal_move
+	monkeypatch.setattr(search, 'TIME_FUNCTIONS', True)
+	state = search.rules.start_board_position()
+	timed = search.search_context(state)
+	monkeypatch.setattr(search, 'TIME_FUNCTIONS', False)
+	untimed = search.search_context(state)
+	timed.minimax(True, 2, float('-inf'), float('inf'), root = True)
+	untimed.minimax(True, 2, float('-inf'), float('inf'), root = True)
+	assert timed.functions['make_legal_move'][0] > 0 and timed.functions['evaluator'][0] > 0
+	assert not untimed.functions
+	assert search.rules.make_legal_move is make_legal_move
@@ -0,0 +1,58 @@
+#Tests of the transposition tables: run with python3 -m pytest from src/
+
+import pytest
+import transposition as tt
+
+@pytest.fixture(params = ['local', 'shared'])
+def table(request):
+	if request.param == 'local':
+		yield tt.transposition_table(1)
+	else:
+		table = tt.shared_transposition_table(1)
+		yield table
+		table.close()
+
+def test_probe_returns_what_was_stored(table):
+	key = 0x123456789ABCDEF0
+	assert table.probe(key) is None
+	table.store(key, 5, -1.25, tt.LOWER, 1234)
+	assert table.probe(key) == (5, -1.25, tt.LOWER, 1234)
+	#Same position stored again: replaced, whatever the depth
+	table.store(key, 2, 3.5, tt.EXACT, 42)
+	assert table.probe(key) == (2, 3.5, tt.EXACT, 42)
+
+def test_negative_depth_is_kept(table):
+	table.store(77, -1, 0.5, tt.UPPER, 0)
+	assert table.probe(77) == (-1, 0.5, tt.UPPER, 0)
+
+#Keys of one bucket: the depth-preferred slot keeps the deeper search, the other slot takes the rest
+def test_replacement_keeps_the_deepest_entry(table):
+	first, second, third = 7, 7 + table.buckets, 7 + 2 * table.buckets
+	table.store(first, 6, 1.0, tt.EXACT, 1)
+	table.store(second, 3, 2.0, tt.EXACT, 2)
+	assert table.probe(first) == (6, 1.0, tt.EXACT, 1)
+	assert table.probe(second) == (3, 2.0, tt.EXACT, 2)
+	table.store(third, 4, 3.0, tt.EXACT, 3)
+	assert table.probe(first) == (6, 1.0, tt.EXACT, 1)
+	assert table.probe(second) is None
+	assert table.probe(third) == (4, 3.0, tt.EXACT, 3)
+	#At least as deep: the depth-preferred slot is replaced
+	table.store(second, 6, 4.0, tt.EXACT, 4)
+	assert table.probe(first) is None
+	assert table.probe(second) == (6, 4.0, tt.EXACT, 4)
+
+def test_clear_empties_the_table(table):
+	table.store(99, 3, 1.0, tt.EXACT, 5)
+	table.clear()
+	assert table.probe(99) is None
+
+#A torn shared entry (words of two different stores) doesn't verify and reads as a miss
+def test_torn_shared_entry_reads_as_a_miss():
+	table = tt.shared_transposition_table(1)
+	try:
+		table.store(11, 3, 1.0, tt.EXACT, 5)
+		check, data, score = tt.SHARED_ENTRY.unpack_from(table.memory.buf, 2 * (11 % table.buckets) * tt.SHARED_ENTRY_SIZE)
+		tt.SHARED_ENTRY.pack_into(table.memory.buf, 2 * (11 % table.buckets) * tt.SHARED_ENTRY_SIZE, check, data, 2.0)
+		assert table.probe(11) is None
+	finally:
+		table.close()
@@ -0,0 +1,37 @@
+#Tests of the UCI engine: run with python3 -m pytest from src/
+
+import io
+import search_algo as search
+import uci
+
+#Output lines of an engine given command lines, the book turned off
+def run_commands(lines):
+	search.REPORT_STATS = False
+	output = io.StringIO()
+	engine = uci.uci_engine(output)
+	engine.loop(["setoption name OwnBook value false"] + lines)
+	return output.getvalue().splitlines()
+
+def best_move(lines):
+	answers = [line.split()[1] for line in lines if line.startswith("bestmove")]
+	assert len(answers) == 1, lines
+	return answers[0]
+
+def legal_uci_moves(fen = None):
+	state = search.rules.fen_to_state(fen) if fen else search.rules.start_board_position()
+	return [search.rules.move_to_uci(move) for move in search.rules.legal_moves(state)]
+
+#A node budget exhausted before depth 1 finishes still answers a legal move
+def test_go_nodes_1_answers_a_legal_move():
+	lines = run_commands(["position startpos", "go nodes 1"])
+	assert best_move(lines) in legal_uci_moves()
+
+def test_stop_right_after_go_answers_a_legal_move():
+	lines = run_commands(["position startpos", "go depth 4", "stop"])
+	assert best_move(lines) in legal_uci_moves()
+
+#No legal move: checkmate
+def test_null_move_only_without_legal_moves():
+	fen = "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1"
+	lines = run_commands(["position fen " + fen, "go nodes 1"])
+	assert best_move(lines) == '0000'
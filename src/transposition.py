@@ -0,0 +1,217 @@
+#Transposition table: remembers searched positions by zobrist key
+#
+#Fixed size in memory: entries live in flat typed arrays, two slots per bucket.
+#Slot 0 is depth-preferred (kept unless the new search is at least as deep), slot 1 is always replaced.
+#shared_transposition_table keeps the same kind of table in shared memory, for several search processes
+#Statistics (probes, hits, stores, collisions) are only counted when python runs without -O
+
+import struct
+from array import array
+
+#Bound types of stored scores
+EXACT = 1
+LOWER = 2	#Score is at least the stored one (search failed high)
+UPPER = 3	#Score is at most the stored one (search failed low)
+
+#Bytes used by one entry: key (8), score (8), depth (1), bound (1), move (2)
+ENTRY_SIZE = 20
+
+class transposition_table():
+	def __init__(self, size_mb = 16):
+		self.resize(size_mb)
+
+	#Allocate an empty table of size_mb megabytes
+	def resize(self, size_mb):
+		self.size_mb = size_mb
+		self.buckets = max(1, size_mb * 1024 * 1024 // (2 * ENTRY_SIZE))
+		entries = 2 * self.buckets
+		self.keys = array('Q', bytes(8 * entries))
+		self.scores = array('d', bytes(8 * entries))
+		self.depths = array('b', bytes(entries))
+		self.bounds = array('B', bytes(entries))
+		self.moves = array('H', bytes(2 * entries))
+		self.reset_stats()
+
+	def clear(self):
+		self.resize(self.size_mb)
+
+	def reset_stats(self):
+		self.probes = 0
+		self.hits = 0
+		self.cutoffs = 0
+		self.stores = 0
+		self.collisions = 0
+
+	#Return (depth, score, bound, move_code) stored for key, or None
+	def probe(self, key):
+		if __debug__:
+			self.probes += 1
+		slot = 2 * (key % self.buckets)
+		if self.bounds[slot] and self.keys[slot] == key:
+			if __debug__:
+				self.hits += 1
+			return self.depths[slot], self.scores[slot], self.bounds[slot], self.moves[slot]
+		slot += 1
+		if self.bounds[slot] and self.keys[slot] == key:
+			if __debug__:
+				self.hits += 1
+			return self.depths[slot], self.scores[slot], self.bounds[slot], self.moves[slot]
+		return None
+
+	def store(self, key, depth, score, bound, move_code):
+		if __debug__:
+			self.stores += 1
+		slot = 2 * (key % self.buckets)
+		if self.bounds[slot] and self.keys[slot] != key and depth < self.depths[slot]:
+			slot += 1
+		if self.bounds[slot] and self.keys[slot] != key:
+			if __debug__:
+				self.collisions += 1
+		self.keys[slot] = key
+		self.scores[slot] = score
+		self.depths[slot] = depth
+		self.bounds[slot] = bound
+		self.moves[slot] = move_code
+
+	#Fraction of probes that found their position
+	def hit_rate(self):
+		if not self.probes:
+			return 0.0
+		return self.hits / self.probes
+
+	#Fraction of stores that replaced an entry of another position
+	def collision_rate(self):
+		if not self.stores:
+			return 0.0
+		return self.collisions / self.stores
+
+	#Fraction of used entries, sampled on the first buckets
+	def fill_rate(self, sample = 1000):
+		entries = min(2 * self.buckets, 2 * sample)
+		return sum(1 for slot in range(entries) if self.bounds[slot]) / entries
+
+	def report(self):
+		return "TT %d MB: %d probes, %d hits (%.1f%%), %d cutoffs, %d stores, %.1f%% collisions, %.1f%% full" % (self.size_mb, self.probes, self.hits, 100 * self.hit_rate(), self.cutoffs, self.stores, 100 * self.collision_rate(), 100 * self.fill_rate())
+
+#Entry of the shared table: check word, data word, score. The check word is key ^ data ^ score bits,
+#so an entry torn by two processes writing it at once doesn't verify and reads as a miss (no locks)
+SHARED_ENTRY = struct.Struct('<QQd')
+SHARED_ENTRY_SIZE = SHARED_ENTRY.size
+score_bits = struct.Struct('<d')
+bits_word = struct.Struct('<Q')
+
+#Data word: move code (16 bits), bound (8 bits), depth (8 bits, signed)
+def pack_data(depth, bound, move_code):
+	return move_code | bound << 16 | (depth & 0xFF) << 24
+
+def unpack_data(data):
+	depth = (data >> 24) & 0xFF
+	if depth > 127:
+		depth -= 256
+	return depth, (data >> 16) & 0xFF, data & 0xFFFF
+
+#Transposition table in shared memory, read and written by several processes at once.
+#Same interface as transposition_table; statistics are counted by each process for itself.
+#The process that creates the table owns it (and unlinks it with close); other processes get it
+#pickled (for example as initializer argument of a process pool) and attach to the same memory
+class shared_transposition_table():
+	def __init__(self, size_mb = 16):
+		self.memory = None
+		self.resize(size_mb)
+
+	#Allocate an empty table of size_mb megabytes. Processes attached to the old table keep using it
+	def resize(self, size_mb):
+		from multiprocessing import shared_memory	#Imported late, most programs only use transposition_table
+		self.close()
+		self.size_mb = size_mb
+		self.buckets = max(1, size_mb * 1024 * 1024 // (2 * SHARED_ENTRY_SIZE))
+		self.memory = shared_memory.SharedMemory(create = True, size = 2 * self.buckets * SHARED_ENTRY_SIZE)
+		self.owner = True
+		self.memory.buf[:] = bytes(self.memory.size)
+		self.reset_stats()
+
+	def __getstate__(self):
+		return (self.memory.name, self.size_mb, self.buckets)
+
+	def __setstate__(self, state):
+		from multiprocessing import shared_memory, resource_tracker
+		name, self.size_mb, self.buckets = state
+		self.memory = shared_memory.SharedMemory(name = name)
+		#Attaching registers the memory to be removed when this process ends; only the owner removes it
+		resource_tracker.unregister(self.memory._name, 'shared_memory')
+		self.owner = False
+		self.reset_stats()
+
+	#Detach from the memory, and remove it if this process owns it
+	def close(self):
+		if self.memory is None:
+			return
+		self.memory.close()
+		if self.owner:
+			self.memory.unlink()
+		self.memory = None
+
+	#Empty the table for every process using it
+	def clear(self):
+		self.memory.buf[:] = bytes(self.memory.size)
+
+	def reset_stats(self):
+		self.probes = 0
+		self.hits = 0
+		self.cutoffs = 0
+		self.stores = 0
+		self.collisions = 0
+
+	#Return (depth, score, bound, move_code) stored for key, or None
+	def probe(self, key):
+		if __debug__:
+			self.probes += 1
+		buffer = self.memory.buf
+		offset = 2 * (key % self.buckets) * SHARED_ENTRY_SIZE
+		for slot_offset in (offset, offset + SHARED_ENTRY_SIZE):
+			check, data, score = SHARED_ENTRY.unpack_from(buffer, slot_offset)
+			if data and check ^ data ^ bits_word.unpack(score_bits.pack(score))[0] == key:
+				if __debug__:
+					self.hits += 1
+				depth, bound, move_code = unpack_data(data)
+				return depth, score, bound, move_code
+		return None
+
+	def store(self, key, depth, score, bound, move_code):
+		if __debug__:
+			self.stores += 1
+		buffer = self.memory.buf
+		offset = 2 * (key % self.buckets) * SHARED_ENTRY_SIZE
+
+		#Depth-preferred slot is kept if it holds a deeper search of another position
+		check, data, old_score = SHARED_ENTRY.unpack_from(buffer, offset)
+		old_key = check ^ data ^ bits_word.unpack(score_bits.pack(old_score))[0]
+		if data and old_key != key and depth < unpack_data(data)[0]:
+			offset += SHARED_ENTRY_SIZE
+			check, data, old_score = SHARED_ENTRY.unpack_from(buffer, offset)
+			old_key = check ^ data ^ bits_word.unpack(score_bits.pack(old_score))[0]
+		if data and old_key != key:
+			if __debug__:
+				self.collisions += 1
+
+		data = pack_data(depth, bound, move_code)
+		SHARED_ENTRY.pack_into(buffer, offset, key ^ data ^ bits_word.unpack(score_bits.pack(score))[0], data, score)
+
+	def hit_rate(self):
+		if not self.probes:
+			return 0.0
+		return self.hits / self.probes
+
+	def collision_rate(self):
+		if not self.stores:
+			return 0.0
+		return self.collisions / self.stores
+
+	#Fraction of used entries, sampled on the first buckets
+	def fill_rate(self, sample = 1000):
+		entries = min(2 * self.buckets, 2 * sample)
+		buffer = self.memory.buf
+		return sum(1 for slot in range(entries) if SHARED_ENTRY.unpack_from(buffer, slot * SHARED_ENTRY_SIZE)[1]) / entries
+
+	def report(self):
+		return "shared TT %d MB: %d probes, %d hits (%.1f%%), %d cutoffs, %d stores, %.1f%% collisions, %.1f%% full" % (self.size_mb, self.probes, self.hits, 100 * self.hit_rate(), self.cutoffs, self.stores, 100 * self.collision_rate(), 100 * self.fill_rate())
@@ -0,0 +1,224 @@
+#Headless engine speaking the UCI protocol on standard input and output, for chess GUIs and batch use
+#
+#Usage:
+#	python3 uci.py
+#	python3 uci.py --stats-json stats.jsonl --time-functions     one JSON stats record per search, with function times
+#
+#Supported: uci, isready, ucinewgame, setoption name Hash | OwnBook | BookFile value <value>, position [startpos | fen <fen>] [moves ...],
+#go [depth N] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms] [nodes N] [infinite], stop, quit
+
+import sys
+import argparse
+import threading
+import search_algo as search
+import search_stats
+import opening_book
+
+ENGINE_NAME = 'badchess'
+ENGINE_AUTHOR = 'titoattack'
+
+#Score for UCI info: centipawns (4 evaluation units are a pawn) or moves to mate, from the side to move
+def uci_score(value, turn):
+	if turn == 'b':
+		value = - value
+	if abs(value) >= search.MATE_BOUND:
+		plies = int(search.MATE_SCORE - abs(value))
+		moves = (plies + 1) // 2
+		return "mate %d" % (moves if value > 0 else - moves)
+	return "cp %d" % round(value * 25)
+
+#Options of a go command, as a dict; values are ints, 'infinite' is True if present
+def parse_go(words):
+	options = dict()
+	i = 0
+	while i < len(words):
+		if words[i] == 'infinite':
+			options['infinite'] = True
+			i += 1
+		elif i + 1 < len(words) and words[i + 1].lstrip('-').isdigit():
+			options[words[i]] = int(words[i + 1])
+			i += 2
+		else:
+			i += 1
+	return options
+
+class uci_engine():
+	#stats_path: file getting the JSON stats of each search, one per line. profile: cProfile top functions printed
+	#to standard error after each search (0: no profile)
+	def __init__(self, output = sys.stdout, stats_path = None, profile = 0):
+		self.output = output
+		self.stats_path = stats_path
+		self.profile = profile
+		self.rules = search.rules
+		self.state = self.rules.start_board_position()
+		self.stop_event = threading.Event()
+		self.thread = None
+		self.own_book = True
+		self.book_path = opening_book.DEFAULT_BOOK
+		self.book = None		#Opened at the first go
+		self.book_opened = False
+
+	def send(self, text):
+		self.output.write(text + '\n')
+		self.output.flush()
+
+	#Set position from the words after 'position'
+	def set_position(self, words):
+		if 'moves' in words:
+			moves = words[words.index('moves') + 1:]
+			words = words[:words.index('moves')]
+		else:
+			moves = []
+
+		if words and words[0] == 'fen':
+			state = self.rules.fen_to_state(' '.join(words[1:]))
+		else:
+			state = self.rules.start_board_position()
+		for text in moves:
+			move = self.rules.uci_to_move(text)
+			legal = self.rules.legal_moves(state)
+			if move not in legal and (move[0], move[1], 'Q') in legal:	#Promotion without piece letter
+				move = (move[0], move[1], 'Q')
+			if move not in legal:
+				self.send("info string illegal move " + text)
+				break
+			state.make_move(move)
+		self.state = state
+
+	#Book move of the current position, None if there is none (or no book)
+	def book_move(self):
+		if not self.own_book:
+			return None
+		if not self.book_opened:
+			self.book = opening_book.open_book(self.book_path)
+			self.book_opened = True
+		return self.book.pick(self.state) if self.book is not None else None
+
+	def set_book(self, own_book, path):
+		if self.book is not None:
+			self.book.close()
+		self.own_book, self.book_path = own_book, path
+		self.book, self.book_opened = None, False
+
+	#Start searching the current position in a background thread, answered with bestmove.
+	#A book move is answered at once, unless the search is infinite
+	def go(self, words):
+		self.stop()
+		options = parse_go(words)
+		move = self.book_move() if not options.get('infinite') else None
+		if move is not None:
+			self.send("info string book move")
+			self.send("bestmove " + self.rules.move_to_uci(move))
+			return
+		state = self.state.copy()
+		turn = state.turn
+
+		move_time = None
+		clock_time = None
+		increment = 0.0
+		if 'movetime' in options:
+			move_time = options['movetime'] / 1000
+		elif (turn == 'w' and 'wtime' in options) or (turn == 'b' and 'btime' in options):
+			clock_time = options['wtime' if turn == 'w' else 'btime'] / 1000
+			increment = options.get('winc' if turn == 'w' else 'binc', 0) / 1000
+		arguments = dict(move_time = move_time, clock_time = clock_time, increment = increment,
+			node_limit = options.get('nodes'), max_depth = options.get('depth', 64))
+
+		self.stop_event.clear()
+		self.thread = threading.Thread(target = self.search, args = (state, arguments, options.get('infinite', False)))
+		self.thread.start()
+
+	def search(self, state, arguments, infinite):
+		turn = state.turn
+
+		#Function times are sent once, at the end
+		def send_info(stats):
+			self.send(stats.uci_info(uci_score(stats.score, turn))[0])
+
+		profile = search_stats.print_profile(self.profile, stream = sys.stderr) if self.profile else None
+		value, pv, stats = search.iterative_deepening_search(state, turn == 'w', stop_event = self.stop_event, on_stats = send_info, profile = profile, **arguments)
+		best_move = pv[0] if pv else None
+		#0000 only when there is no legal move, a search stopped early still answers a legal one
+		if best_move is None:
+			moves = self.rules.legal_moves(state)
+			best_move = moves[0] if moves else None
+		for line in stats.uci_info(uci_score(stats.score, turn) if stats.score is not None else "cp 0")[1:]:
+			self.send(line)
+		if self.stats_path:
+			with open(self.stats_path, 'a') as stats_file:
+				stats_file.write(stats.to_json() + '\n')
+
+		#An infinite search answers only when told to stop
+		if infinite:
+			self.stop_event.wait()
+		self.send("bestmove " + (self.rules.move_to_uci(best_move) if best_move else '0000'))
+
+	#Stop the running search (it sends its bestmove) and wait for it
+	def stop(self):
+		if self.thread is not None:
+			self.stop_event.set()
+			self.thread.join()
+			self.thread = None
+
+	#Handle one command line. Return False on quit
+	def handle(self, line):
+		words = line.split()
+		if not words:
+			return True
+		command = words[0]
+
+		if command == 'uci':
+			self.send("id name " + ENGINE_NAME)
+			self.send("id author " + ENGINE_AUTHOR)
+			self.send("option name Hash type spin default %d min 1 max 1024" % search.TT_SIZE_MB)
+			self.send("option name OwnBook type check default true")
+			self.send("option name BookFile type string default " + opening_book.DEFAULT_BOOK)
+			self.send("uciok")
+		elif command == 'isready':
+			self.send("readyok")
+		elif command == 'setoption':
+			if len(words) >= 5 and words[1] == 'name' and words[3] == 'value':
+				name, value = words[2].lower(), ' '.join(words[4:])
+				if name == 'hash':
+					search.TT_SIZE_MB = max(1, int(value))
+				elif name == 'ownbook':
+					self.set_book(value.lower() == 'true', self.book_path)
+				elif name == 'bookfile':
+					self.set_book(self.own_book, value)
+		elif command == 'ucinewgame':
+			self.stop()
+			search.get_transposition_table().clear()
+		elif command == 'position':
+			self.stop()
+			self.set_position(words[1:])
+		elif command == 'go':
+			self.go(words[1:])
+		elif command == 'stop':
+			self.stop()
+		elif command == 'quit':
+			self.stop()
+			self.set_book(False, self.book_path)
+			return False
+		return True
+
+	def loop(self, lines):
+		for line in lines:
+			if not self.handle(line):
+				break
+		self.stop()
+
+def main(arguments):
+	parser = argparse.ArgumentParser(description = "UCI chess engine")
+	parser.add_argument('--stats-json', help = "file getting the stats of each search as a JSON line")
+	parser.add_argument('--time-functions', action = 'store_true', help = "time the main functions of the search (slower)")
+	parser.add_argument('--profile', type = int, default = 0, help = "print this many top functions of cProfile after each search")
+	options = parser.parse_args(arguments)
+
+	search.REPORT_STATS = False
+	search.TIME_FUNCTIONS = options.time_functions
+	uci_engine(stats_path = options.stats_json, profile = options.profile).loop(sys.stdin)
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))